@@ -1,7 +1,8 @@
-from board import app, db
+from board import create_app
 import os
 
+app = create_app()
 
 if __name__ == '__main__':
 
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
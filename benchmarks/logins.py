@@ -0,0 +1,70 @@
+"""Measure login throughput and board latency during a login burst.
+
+    PASSWORD_HASH_WORKERS=2 PASSWORD_HASH_QUEUE=8 python -m benchmarks.logins --logins 200 --concurrency 32
+
+Logs in from many threads at once while one more thread keeps loading a board, and reports logins per second, how many
+logins were turned away with 503, and the board latency percentiles during the burst. Change the PASSWORD_HASH_* and
+BCRYPT_* environment variables between runs to see their effect.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+
+from board import db, passwords  # noqa: E402
+from benchmarks.run import app, logged_in_client, percentile  # noqa: E402
+from benchmarks.seed import PASSWORD, seed  # noqa: E402
+
+
+def login(index, users):
+    client = app.test_client()
+    response = client.post('/login', data={'email': f'user{index % users + 1}@example.com', 'password': PASSWORD})
+    return response.status_code
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--users', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        info = seed(users=args.users, teams=5, tasks=2000)
+    print(f'bcrypt cost {passwords.rounds}, {app.config["PASSWORD_HASH_WORKERS"]} hash workers, '
+          f'queue {app.config["PASSWORD_HASH_QUEUE"]}')
+
+    board_client = logged_in_client(info['email'])
+    board_timings, done = [], threading.Event()
+
+    def load_board():
+        while not done.is_set():
+            start = time.perf_counter()
+            board_client.get('/', headers={'Cache-Control': 'no-cache'})
+            board_timings.append((time.perf_counter() - start) * 1000)
+
+    board_thread = threading.Thread(target=load_board)
+    board_thread.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        statuses = list(pool.map(lambda index: login(index, args.users), range(args.logins)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    board_thread.join()
+
+    accepted = statuses.count(302)
+    print(f'{accepted} logins in {elapsed:.2f} s: {accepted / elapsed:.1f} logins/s, {statuses.count(503)} rejected with 503')
+    print(f'board during the burst: p50 {percentile(board_timings, 0.5):.2f} ms  p95 {percentile(board_timings, 0.95):.2f} ms  '
+          f'p99 {percentile(board_timings, 0.99):.2f} ms over {len(board_timings)} requests')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
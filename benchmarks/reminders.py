@@ -0,0 +1,82 @@
+"""Measure the reminder scheduler against a scan of every open task.
+
+    python -m benchmarks.reminders --tasks 10000 100000 1000000 --due 200
+
+For each task count, seeds a board whose open tasks are due over the next three years, with the given number of them
+due on the first day, and reports the time to read every open task (what a naive reminder job does on each run), to
+start the scheduler (loading its first window), to tick while nothing changed and to tick while sending the reminders
+of the first day. The scheduler times should follow the number of due tasks and stay flat as the board grows.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault('BCRYPT_ROUNDS', '4')
+
+from sqlalchemy import select  # noqa: E402
+from board import create_app, db  # noqa: E402
+from board.models import Task  # noqa: E402
+from board.reminders import OPEN_STATUSES, ReminderScheduler  # noqa: E402
+from benchmarks.seed import insert_in_batches  # noqa: E402
+
+# the benchmark clock. the first day's tasks become due soon at the start of day 2 and overdue at the start of day 3
+NOW = datetime(2030, 1, 1, 12)
+
+
+class CountingSink:
+    def __init__(self):
+        self.sent = 0
+
+    def send(self, reminders):
+        self.sent += len(reminders)
+
+
+def seed_tasks(tasks, due):
+    rows = [{'title': f'task {i}', 'description': 'seeded by the benchmark', 'priority': 1, 'rank': 'V',
+             'status': 'To Do' if i % 3 else 'Done', 'user_id': 1,
+             'due_date': datetime(2030, 1, 2) if i < due else datetime(2030, 1, 3) + timedelta(days=i % 1000)}
+            for i in range(tasks)]
+    insert_in_batches(Task.__table__, rows)
+    db.session.commit()
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def run(tasks, due):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db'),
+                      'TEMPLATE_CACHE_DIR': '', 'SLOW_QUERY_MS': float('inf')})
+    with app.app_context():
+        db.create_all()
+        seed_tasks(tasks, due)
+        scan, _ = timed(lambda: db.session.execute(select(Task.id, Task.due_date)
+                                                   .where(Task.status.in_(OPEN_STATUSES))).all())
+        sink = CountingSink()
+        scheduler = ReminderScheduler(sink, lead=timedelta(hours=24), window=timedelta(hours=1), batch_size=500)
+        start, _ = timed(lambda: scheduler.start(NOW))
+        idle, _ = timed(lambda: scheduler.tick(NOW + timedelta(minutes=1)))
+        sending, sent = timed(lambda: scheduler.tick(datetime(2030, 1, 2, 0, 1)))
+    return scan, start, idle, sending, sent
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--due', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    print(f'{"tasks":>10}{"scan ms":>10}{"start ms":>10}{"idle ms":>10}{"send ms":>10}{"sent":>8}')
+    for tasks in args.tasks:
+        scan, start, idle, sending, sent = run(tasks, args.due)
+        print(f'{tasks:10}{scan:10.1f}{start:10.1f}{idle:10.1f}{sending:10.1f}{sent:8}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
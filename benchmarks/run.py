@@ -0,0 +1,239 @@
+"""Benchmark every route of the board against a seeded database.
+
+    python -m benchmarks.run --tasks 20000 --output benchmarks/results.json --compare benchmarks/baseline.json
+
+Each scenario is driven through the Flask test client. The report gives p50/p95/p99 latency, queries per request (read
+from the Server-Timing header) and peak Python memory per request (measured in a separate tracemalloc pass so it
+does not skew the timings). With --compare the results are checked against a baseline file and the exit status is 1
+when an endpoint regressed.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime
+
+# the benchmark always seeds a throwaway database, which has to be configured before the app is created
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+
+from board import bcrypt, create_app, db  # noqa: E402
+from board.models import Task, Team, User, user_team_association  # noqa: E402
+from board.ranks import spread_ranks  # noqa: E402
+from benchmarks.seed import PASSWORD, seed  # noqa: E402
+
+app = create_app()
+
+# setup runs before every request of the scenario and is not timed. it returns the values used to build the url and
+# form data, and may return its own logged in client for requests that end the session
+Scenario = namedtuple('Scenario', ['name', 'method', 'path', 'data', 'setup', 'client'], defaults=[None, None, 'user'])
+
+TASK_FORM = {'title': 'benchmark task', 'description': 'benchmark description', 'status': 'To Do',
+             'due_date': '2030-01-01', 'priority': '5'}
+
+
+def new_task(info):
+    with app.app_context():
+        task = Task(title='to delete', description='to delete', status='To Do', priority=1,
+                    due_date=datetime(2030, 1, 1), user_id=info['user_id'])
+        db.session.add(task)
+        db.session.commit()
+        return {'task_id': task.id}
+
+
+def new_team(info):
+    with app.app_context():
+        team = Team(name='to delete')
+        db.session.add(team)
+        db.session.flush()
+        db.session.execute(user_team_association.insert(), {'user_id': info['user_id'], 'team_id': team.id})
+        db.session.commit()
+        return {'team_id': team.id}
+
+
+def logged_in_client(email):
+    client = app.test_client()
+    client.post('/login', data={'email': email, 'password': PASSWORD})
+    return client
+
+
+def anonymous_client(info):
+    return {'client': app.test_client()}
+
+
+def new_session(info):
+    return {'client': logged_in_client(info['email'])}
+
+
+def new_account(info):
+    # a user with a personal board of 100 tasks, logged in on its own client
+    with app.app_context():
+        count = db.session.query(User).count()
+        user = User(username=f'deleted{count}', email=f'deleted{count}@example.com',
+                    password=bcrypt.generate_password_hash(PASSWORD).decode('utf-8'))
+        db.session.add(user)
+        db.session.flush()
+        db.session.execute(Task.__table__.insert(), [{'title': f'task {i}', 'description': 'to delete', 'status': 'Done',
+                                                      'priority': 1, 'due_date': datetime(2030, 1, 1), 'user_id': user.id,
+                                                      'rank': rank} for i, rank in enumerate(spread_ranks(100))])
+        db.session.commit()
+        user_id, email = user.id, user.email
+    return {'user_id': user_id, 'client': logged_in_client(email)}
+
+
+def scenarios():
+    member_emails = ','.join(f'user{i}@example.com' for i in range(2, 12))
+    return [
+        Scenario('index', 'GET', lambda s: '/'),
+        Scenario('index_revalidate', 'GET', lambda s: '/'),
+        Scenario('about', 'GET', lambda s: '/about'),
+        Scenario('register', 'GET', lambda s: '/register', client='anonymous'),
+        Scenario('login_page', 'GET', lambda s: '/login', client='anonymous'),
+        Scenario('login', 'POST', lambda s: '/login', lambda s: {'email': s['email'], 'password': PASSWORD},
+                 setup=anonymous_client),
+        Scenario('account', 'GET', lambda s: '/account'),
+        Scenario('account_update', 'POST', lambda s: '/account', lambda s: {'username': 'user1', 'email': s['email']}),
+        Scenario('logout', 'GET', lambda s: '/logout', setup=new_session),
+        Scenario('delete_account', 'POST', lambda s: f'/account/{s["user_id"]}/delete', setup=new_account),
+        Scenario('create_task_form', 'GET', lambda s: '/task/new'),
+        Scenario('create_task', 'POST', lambda s: '/task/new', lambda s: TASK_FORM),
+        Scenario('task', 'GET', lambda s: f'/task/{s["task_id"]}'),
+        Scenario('update_task_form', 'GET', lambda s: f'/task/{s["task_id"]}/update'),
+        Scenario('update_task', 'POST', lambda s: f'/task/{s["task_id"]}/update', lambda s: TASK_FORM),
+        Scenario('delete_task', 'POST', lambda s: f'/task/{s["task_id"]}/delete', setup=new_task),
+        Scenario('create_team_form', 'GET', lambda s: '/team/new'),
+        Scenario('create_team', 'POST', lambda s: '/team/new', lambda s: {'name': 'benchmark team', 'member_emails': member_emails}),
+        Scenario('teams', 'GET', lambda s: '/teams'),
+        Scenario('team', 'GET', lambda s: f'/team/{s["team_id"]}'),
+        Scenario('update_team_form', 'GET', lambda s: f'/team/{s["team_id"]}/update'),
+        Scenario('update_team', 'POST', lambda s: f'/team/{s["team_id"]}/update', lambda s: {'name': 'team1', 'member_emails': member_emails}),
+        Scenario('delete_team', 'POST', lambda s: f'/team/{s["team_id"]}/delete', setup=new_team),
+        Scenario('create_team_task', 'POST', lambda s: f'/team/{s["team_id"]}/task/new', lambda s: TASK_FORM),
+        Scenario('team_tasks', 'GET', lambda s: f'/team/{s["team_id"]}/tasks'),
+        Scenario('board_column', 'GET', lambda s: f'/api/boards/team-{s["team_id"]}/columns/done'),
+    ]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def run_scenario(scenario, info, clients, requests, memory_requests):
+    timings, queries, peaks, statuses = [], [], [], set()
+    etag = None
+    for iteration in range(requests + memory_requests):
+        state = dict(info)
+        if scenario.setup:
+            state.update(scenario.setup(info))
+        client = state.pop('client', None) or clients[scenario.client]
+        headers = {'If-None-Match': etag} if scenario.name == 'index_revalidate' and etag else {}
+        data = scenario.data(state) if scenario.data else None
+
+        measure_memory = iteration >= requests
+        if measure_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        response = client.open(scenario.path(state), method=scenario.method, data=data, headers=headers)
+        elapsed = time.perf_counter() - start
+        if measure_memory:
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        else:
+            timings.append(elapsed * 1000)
+
+        etag = response.headers.get('ETag', etag)
+        statuses.add(response.status_code)
+        match = re.search(r'desc="(\d+) queries"', response.headers.get('Server-Timing', ''))
+        if match:
+            queries.append(int(match.group(1)))
+
+    return {
+        'p50_ms': round(percentile(timings, 0.50), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'queries': max(queries) if queries else None,
+        'peak_kib': round(max(peaks) / 1024, 1) if peaks else None,
+        'status': sorted(statuses),
+    }
+
+
+def run(sizes, requests, memory_requests, only=None):
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        db.create_all()
+        info = seed(**sizes)
+    clients = {'user': logged_in_client(info['email']), 'anonymous': app.test_client()}
+
+    results = {}
+    for scenario in scenarios():
+        if only and scenario.name not in only:
+            continue
+        results[scenario.name] = run_scenario(scenario, info, clients, requests, memory_requests)
+        print(f'{scenario.name:20} p50 {results[scenario.name]["p50_ms"]:8.2f} ms  p95 {results[scenario.name]["p95_ms"]:8.2f} ms  '
+              f'p99 {results[scenario.name]["p99_ms"]:8.2f} ms  queries {results[scenario.name]["queries"]}  '
+              f'peak {results[scenario.name]["peak_kib"]} KiB', flush=True)
+    return {
+        'meta': {'created': datetime.utcnow().isoformat(timespec='seconds'), 'python': platform.python_version(),
+                 'requests': requests, 'sizes': sizes},
+        'endpoints': results,
+    }
+
+
+def compare(results, baseline, tolerance, noise_ms):
+    # an endpoint regressed when its p95 grew by more than the tolerance (and more than the timing noise),
+    # when it issues more queries, or when its peak memory grew by more than the tolerance
+    regressions = []
+    for name, base in baseline['endpoints'].items():
+        current = results['endpoints'].get(name)
+        if current is None:
+            continue
+        if current['p95_ms'] > base['p95_ms'] * (1 + tolerance) and current['p95_ms'] - base['p95_ms'] > noise_ms:
+            regressions.append(f'{name}: p95 {base["p95_ms"]} ms -> {current["p95_ms"]} ms')
+        if base['queries'] is not None and current['queries'] is not None and current['queries'] > base['queries']:
+            regressions.append(f'{name}: queries {base["queries"]} -> {current["queries"]}')
+        if base['peak_kib'] and current['peak_kib'] and current['peak_kib'] > base['peak_kib'] * (1 + tolerance):
+            regressions.append(f'{name}: peak memory {base["peak_kib"]} KiB -> {current["peak_kib"]} KiB')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--teams', type=int, default=20)
+    parser.add_argument('--tasks', type=int, default=20000)
+    parser.add_argument('--largest-team', type=int, default=None, help='members of the biggest team (default: every user)')
+    parser.add_argument('--skew', type=float, default=1.1, help='zipf exponent of team sizes and task owners')
+    parser.add_argument('--requests', type=int, default=50, help='timed requests per scenario')
+    parser.add_argument('--memory-requests', type=int, default=3, help='requests per scenario measured with tracemalloc')
+    parser.add_argument('--only', nargs='*', help='run only these scenarios')
+    parser.add_argument('--output', help='write the results to this json file')
+    parser.add_argument('--compare', help='baseline json file to check the results against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative growth before a regression is reported')
+    parser.add_argument('--noise-ms', type=float, default=1.0, help='latency differences below this are ignored')
+    args = parser.parse_args(argv)
+
+    sizes = {'users': args.users, 'teams': args.teams, 'tasks': args.tasks, 'largest_team': args.largest_team, 'skew': args.skew}
+    results = run(sizes, args.requests, args.memory_requests, args.only)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance, args.noise_ms)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            return 1
+        print('No regressions against the baseline.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""Compare full-text task search with the LIKE scan it replaces.
+
+    python -m benchmarks.search --tasks 200000
+
+Seeds tasks whose titles and descriptions are drawn from a Zipf-distributed vocabulary, so there are very common and
+very rare words, then times search_tasks (FTS5) against the equivalent LIKE '%word%' query on the same board.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+
+from sqlalchemy import or_  # noqa: E402
+from board import create_app, db  # noqa: E402
+from board.boards import COLUMN_ORDER, board_query  # noqa: E402
+from board.models import Task, Team  # noqa: E402
+from board.ranks import spread_ranks  # noqa: E402
+from board.search import search_tasks  # noqa: E402
+from benchmarks.seed import insert_in_batches, zipf_weights  # noqa: E402
+
+app = create_app()
+
+
+def seed_text(tasks, vocabulary, rng):
+    words = [f'word{i}' for i in range(vocabulary)]
+    weights = zipf_weights(vocabulary, 1.0)
+    db.session.add(Team(name='search'))
+    db.session.flush()
+    rows = [{'title': ' '.join(rng.choices(words, weights, k=4)), 'description': ' '.join(rng.choices(words, weights, k=30)),
+             'status': 'Done', 'priority': 1, 'due_date': datetime(2030, 1, 1), 'team_id': 1, 'rank': rank}
+            for rank in spread_ranks(tasks)]
+    insert_in_batches(Task.__table__, rows)
+    db.session.commit()
+    return words
+
+
+def like_search(word, team, per_page):
+    return board_query(team=team).filter(or_(Task.title.like(f'%{word}%'), Task.description.like(f'%{word}%'))) \
+        .order_by(*COLUMN_ORDER).limit(per_page + 1).all()
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=100000)
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        words = seed_text(args.tasks, args.vocabulary, random.Random(0))
+        print(f'seeded and indexed {args.tasks} tasks in {time.perf_counter() - start:.1f} s')
+        team = db.session.get(Team, 1)
+        # the most common word, a mid frequency word and a rare one
+        for word in (words[0], words[len(words) // 100], words[-1]):
+            fts = timed(lambda: search_tasks(word, team=team), args.repeat)
+            like = timed(lambda: like_search(word, team, 20), args.repeat)
+            print(f'{word:12} fts {fts:9.2f} ms   like {like:9.2f} ms   speedup {like / fts:7.1f}x')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+import random
+from datetime import datetime, timedelta
+from board import bcrypt, db
+from board.models import Task, Team, User, user_team_association
+from board.ranks import spread_ranks
+
+# Synthetic data for the benchmarks. Sizes follow skewed distributions like real tenants: a few huge teams and many
+# small ones, a few users owning most personal tasks, and Done columns that keep growing while To Do stays short.
+
+PASSWORD = 'benchmark'
+STATUS_WEIGHTS = (('To Do', 0.1), ('In Progress', 0.05), ('Done', 0.85))
+
+
+def zipf_weights(count, skew):
+    return [1 / (rank ** skew) for rank in range(1, count + 1)]
+
+
+def insert_in_batches(table, rows, batch_size=5000):
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(table.insert(), rows[start:start + batch_size])
+
+
+def seed(users=200, teams=20, tasks=20000, team_task_share=0.7, largest_team=None, skew=1.1, random_seed=0):
+    # fill an empty database and return a summary with the ids the benchmark drives. user 1 is a member of every
+    # team and owns the most personal tasks, so its pages are the heaviest ones
+    rng = random.Random(random_seed)
+    largest_team = min(largest_team or users, users)
+    password = bcrypt.generate_password_hash(PASSWORD).decode('utf-8')  # hashing once keeps seeding fast
+
+    insert_in_batches(User.__table__, [{'username': f'user{i}', 'email': f'user{i}@example.com', 'password': password}
+                                       for i in range(1, users + 1)])
+    insert_in_batches(Team.__table__, [{'name': f'team{i}', 'date_created': datetime.utcnow()} for i in range(1, teams + 1)])
+
+    # team sizes fall off from largest_team following the skew, and user 1 joins every team
+    memberships = []
+    for team_id, weight in enumerate(zipf_weights(teams, skew), start=1):
+        size = max(2, int(largest_team * weight))
+        members = {1} | set(rng.sample(range(2, users + 1), min(size, users) - 1))
+        memberships.extend({'user_id': user_id, 'team_id': team_id} for user_id in members)
+    insert_in_batches(user_team_association, memberships)
+
+    statuses = [status for status, _ in STATUS_WEIGHTS]
+    status_weights = [weight for _, weight in STATUS_WEIGHTS]
+    team_weights = zipf_weights(teams, skew)
+    user_weights = zipf_weights(users, skew)
+    now = datetime.utcnow()
+    rows = []
+    for i in range(tasks):
+        row = {'title': f'task {i}', 'description': f'description of task {i}', 'date_created': now,
+               'due_date': now + timedelta(days=rng.randint(-365, 365)), 'priority': rng.randint(1, 10),
+               'status': rng.choices(statuses, status_weights)[0], 'user_id': None, 'team_id': None}
+        if rng.random() < team_task_share:
+            row['team_id'] = rng.choices(range(1, teams + 1), team_weights)[0]
+        else:
+            row['user_id'] = rng.choices(range(1, users + 1), user_weights)[0]
+        rows.append(row)
+    # cards are ranked in the order they were generated, like a board whose cards were never moved
+    columns = {}
+    for row in rows:
+        columns.setdefault((row['team_id'], row['user_id'], row['status']), []).append(row)
+    for column_rows in columns.values():
+        for row, rank in zip(column_rows, spread_ranks(len(column_rows))):
+            row['rank'] = rank
+    insert_in_batches(Task.__table__, rows)
+    db.session.commit()
+
+    return {
+        'users': users, 'teams': teams, 'tasks': tasks, 'memberships': len(memberships),
+        'user_id': 1, 'email': 'user1@example.com', 'password': PASSWORD,
+        'team_id': 1,  # the largest team
+        'task_id': db.session.query(Task.id).filter(Task.user_id == 1).limit(1).scalar(),
+        'team_task_id': db.session.query(Task.id).filter(Task.team_id == 1).limit(1).scalar(),
+    }
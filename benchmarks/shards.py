@@ -0,0 +1,91 @@
+"""Measure task write throughput with the team boards spread over shards.
+
+    SQLITE_SYNCHRONOUS=FULL python -m benchmarks.shards --shards 0 1 2 4 --teams 8 --writes 50
+
+For each shard count, builds a fresh set of databases with one user in the given number of teams, then writes tasks to
+every team at once, one thread per team, through the batch api. Reports the writes per second and the write latency
+percentiles. With no shards every team writes to the home database and waits for the same lock; with more shards the
+teams wait on different ones. SQLITE_SYNCHRONOUS=FULL makes each commit wait for the disk, which is where it shows.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault('BCRYPT_ROUNDS', '4')
+
+from board import bcrypt, create_app, db  # noqa: E402
+from board.migrations import upgrade  # noqa: E402
+from board.models import Team, User  # noqa: E402
+from benchmarks.run import percentile  # noqa: E402
+from benchmarks.seed import PASSWORD  # noqa: E402
+
+
+def build(shards, teams):
+    # an app with its own databases, a user and the teams it belongs to. returns the app and the team ids
+    folder = tempfile.mkdtemp()
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(folder, 'benchmark.db'),
+                      'SHARD_COUNT': shards, 'WTF_CSRF_ENABLED': False, 'TEMPLATE_CACHE_DIR': '',
+                      'SLOW_QUERY_MS': float('inf')})
+    with app.app_context():
+        upgrade()
+        user = User(username='user1', email='user1@example.com',
+                    password=bcrypt.generate_password_hash(PASSWORD).decode('utf-8'))
+        db.session.add(user)
+        for i in range(teams):
+            team = Team(name=f'team {i + 1}')
+            team.members.append(user)
+            db.session.add(team)
+        db.session.commit()
+        return app, db.session.scalars(db.select(Team.id).order_by(Team.id)).all()
+
+
+def write_tasks(app, team_id, writes, batch, start, timings):
+    client = app.test_client()
+    client.post('/login', data={'email': 'user1@example.com', 'password': PASSWORD})
+    tasks = [{'title': f'task {i}', 'description': 'written by the benchmark', 'status': 'To Do',
+              'due_date': '2030-01-01', 'priority': 1, 'team_id': team_id} for i in range(batch)]
+    start.wait()
+    for _ in range(writes):
+        began = time.perf_counter()
+        response = client.post('/api/tasks/batch', json={'tasks': tasks})
+        timings.append(time.perf_counter() - began)
+        assert response.status_code == 201, response.get_data(as_text=True)
+
+
+def run(shards, teams, writes, batch):
+    app, team_ids = build(shards, teams)
+    start = threading.Barrier(len(team_ids) + 1)
+    timings = []
+    threads = [threading.Thread(target=write_tasks, args=(app, team_id, writes, batch, start, timings))
+               for team_id in team_ids]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    return len(timings) / elapsed, timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shards', type=int, nargs='+', default=[0, 1, 2, 4])
+    parser.add_argument('--teams', type=int, default=8)
+    parser.add_argument('--writes', type=int, default=50, help='writes per team')
+    parser.add_argument('--batch', type=int, default=1, help='tasks per write')
+    args = parser.parse_args(argv)
+
+    print(f'{"shards":>8}{"writes/s":>12}{"p50 ms":>10}{"p95 ms":>10}')
+    for shards in args.shards:
+        throughput, timings = run(shards, args.teams, args.writes, args.batch)
+        print(f'{shards:8}{throughput:12.1f}{percentile(timings, 0.5) * 1000:10.1f}'
+              f'{percentile(timings, 0.95) * 1000:10.1f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
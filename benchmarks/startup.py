@@ -0,0 +1,106 @@
+"""Measure worker cold start and first request latency.
+
+    python -m benchmarks.startup --runs 5
+
+Starts a new python process for every run, like a freshly forked worker, and reports the time spent importing the
+board package and in create_app, then the latency of the first and of later requests to the login page and to a
+board. Runs are repeated without a template cache, with an empty bytecode cache, with a cache filled by
+`flask compile-templates` and with a filled cache plus WARM_UP, and the medians are printed.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# the scenarios, as environment variables of the worker processes. None stands for a folder made for each run
+SCENARIOS = {
+    'no template cache': {'TEMPLATE_CACHE_DIR': ''},
+    'empty bytecode cache': {'TEMPLATE_CACHE_DIR': None},
+    'compiled templates': {},
+    'compiled templates + warm up': {'WARM_UP': '1'},
+}
+TIMINGS = ('import', 'create_app', 'first login page', 'later login page', 'first board', 'later board')
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    response = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    assert response.status_code == 200, response.status_code
+    return elapsed
+
+
+def worker():
+    # one run, in its own process. prints the timings in seconds as json
+    start = time.perf_counter()
+    from board import create_app
+    imported = time.perf_counter()
+    app = create_app({'WTF_CSRF_ENABLED': False})
+    timings = {'import': imported - start, 'create_app': time.perf_counter() - imported}
+    from benchmarks.seed import PASSWORD
+
+    timings['first login page'] = timed(app.test_client().get, '/login')
+    timings['later login page'] = statistics.median(timed(app.test_client().get, '/login') for _ in range(5))
+    client = app.test_client()
+    client.post('/login', data={'email': 'user1@example.com', 'password': PASSWORD})
+    timings['first board'] = timed(client.get, '/')
+    timings['later board'] = statistics.median(timed(client.get, '/') for _ in range(5))
+    print(json.dumps(timings))
+
+
+def seed_database(tasks):
+    from board import create_app, db
+    from benchmarks.seed import seed
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        seed(users=50, teams=5, tasks=tasks)
+
+
+def run(args, environ):
+    output = subprocess.run([sys.executable, '-m', 'benchmarks.startup'] + args, env=environ, check=True,
+                            capture_output=True, text=True).stdout
+    return output.strip().splitlines()[-1] if output.strip() else ''
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--tasks', type=int, default=5000)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--seed', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.worker:
+        worker()
+        return 0
+    if args.seed:
+        seed_database(args.tasks)
+        return 0
+
+    directory = tempfile.mkdtemp()
+    compiled = os.path.join(directory, 'compiled')
+    # a fixed bcrypt cost keeps the startup calibration out of the timings
+    base = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(directory, 'benchmark.db'), BCRYPT_ROUNDS='4',
+                TEMPLATE_CACHE_DIR=compiled, WARM_UP='')
+    run(['--seed', '--tasks', str(args.tasks)], base)
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'board', 'compile-templates'], env=base, check=True,
+                   capture_output=True)
+
+    print(f'{"median ms over " + str(args.runs) + " runs":30}' + ''.join(f'{name:>18}' for name in TIMINGS))
+    for name, settings in SCENARIOS.items():
+        results = []
+        for _ in range(args.runs):
+            environ = dict(base, **{key: tempfile.mkdtemp() if value is None else value for key, value in settings.items()})
+            results.append(json.loads(run(['--worker'], environ)))
+        print(f'{name:30}' + ''.join(f'{statistics.median(result[timing] for result in results) * 1000:18.1f}'
+                                     for timing in TIMINGS))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
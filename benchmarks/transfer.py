@@ -0,0 +1,78 @@
+"""Measure board export and import throughput and memory.
+
+    python -m benchmarks.transfer --tasks 1000000
+
+Seeds one team board with the given number of tasks, exports it to a file as CSV and as JSON Lines the way
+`flask export-board` does, reporting rows per second and the peak Python memory of the export, then imports the CSV
+file into a second, empty team board the way `flask import-board` does.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+
+from board import create_app, db  # noqa: E402
+from board.models import Task, Team  # noqa: E402
+from board.ranks import spread_ranks  # noqa: E402
+from board.transfer import export_lines, export_rows, import_tasks  # noqa: E402
+from benchmarks.seed import insert_in_batches  # noqa: E402
+
+app = create_app()
+
+
+def seed_board(tasks):
+    db.session.add_all([Team(name='exported'), Team(name='imported')])
+    db.session.flush()
+    rows = [{'title': f'task {i}', 'description': f'description of task {i}', 'status': 'Done', 'priority': 1 + i % 10,
+             'due_date': datetime(2030, 1, 1), 'date_created': datetime(2024, 1, 1), 'team_id': 1, 'rank': rank}
+            for i, rank in enumerate(spread_ranks(tasks))]
+    insert_in_batches(Task.__table__, rows)
+    db.session.commit()
+
+
+def export(path, fmt):
+    tracemalloc.start()
+    start = time.perf_counter()
+    with open(path, 'w', encoding='utf-8') as output:
+        for chunk in export_lines(export_rows(team=db.session.get(Team, 1)), fmt):
+            output.write(chunk)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=1000000)
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp()
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        seed_board(args.tasks)
+        print(f'seeded {args.tasks} tasks in {time.perf_counter() - start:.1f} s')
+
+        for fmt in ('csv', 'jsonl'):
+            path = os.path.join(directory, f'board.{fmt}')
+            elapsed, peak = export(path, fmt)
+            print(f'export {fmt:5}  {elapsed:7.1f} s  {args.tasks / elapsed:9.0f} rows/s  '
+                  f'peak {peak / 1024:8.1f} KiB  file {os.path.getsize(path) / 2 ** 20:7.1f} MiB')
+
+        start = time.perf_counter()
+        with open(os.path.join(directory, 'board.csv'), encoding='utf-8', newline='') as lines:
+            report = import_tasks('team-2', lines, 'csv')
+        elapsed = time.perf_counter() - start
+        print(f'import csv    {elapsed:7.1f} s  {report["imported"] / elapsed:9.0f} rows/s  '
+              f'{report["skipped"]} skipped, batches of {app.config["IMPORT_BATCH_SIZE"]}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""Measure the bytes sent for a large board.
+
+    python -m benchmarks.wire --cards 2000
+
+Seeds a personal board with the given number of cards and reports the size of the board page, of the api answer
+listing a column and of the static assets, sent as they are, with gzip and with brotli (when installed). The board
+page is measured with the default BOARD_PAGE_SIZE and with every card rendered at once.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+os.environ.setdefault('BCRYPT_ROUNDS', '4')
+
+from board import bcrypt, create_app, db  # noqa: E402
+from board.assets import build_assets, configure_assets  # noqa: E402
+from board.boards import STATUSES  # noqa: E402
+from board.compression import encodings  # noqa: E402
+from board.models import Task, User  # noqa: E402
+from board.ranks import spread_ranks  # noqa: E402
+from benchmarks.seed import PASSWORD, insert_in_batches  # noqa: E402
+
+app = create_app({'WTF_CSRF_ENABLED': False})
+
+
+def seed_board(cards):
+    db.session.add(User(username='user1', email='user1@example.com',
+                        password=bcrypt.generate_password_hash(PASSWORD).decode('utf-8')))
+    db.session.commit()
+    now = datetime.utcnow()
+    rows = []
+    for status in STATUSES:
+        count = cards // len(STATUSES)
+        rows.extend({'title': f'card {len(rows) + i}', 'description': f'description of card {len(rows) + i}',
+                     'date_created': now, 'due_date': now + timedelta(days=i % 60), 'priority': i % 10 + 1,
+                     'status': status, 'user_id': 1, 'team_id': None, 'rank': rank}
+                    for i, rank in enumerate(spread_ranks(count)))
+    insert_in_batches(Task.__table__, rows)
+    db.session.commit()
+
+
+def sizes(client, url):
+    # bytes of the body sent for url with each encoding
+    return [len(client.get(url, headers={'Accept-Encoding': encoding}).data) for encoding in ['identity'] + encodings()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cards', type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        db.create_all()
+        seed_board(args.cards)
+    client = app.test_client()
+    client.post('/login', data={'email': 'user1@example.com', 'password': PASSWORD})
+
+    print(f'{"bytes":44}' + ''.join(f'{encoding:>12}' for encoding in ['identity'] + encodings()))
+    rows = [(f'board page, {app.config["BOARD_PAGE_SIZE"]} cards per column', '/'),
+            ('api column page', '/api/boards/user-1/columns/todo')]
+    for name, url in rows:
+        print(f'{name:44}' + ''.join(f'{size:12}' for size in sizes(client, url)))
+    app.config['BOARD_PAGE_SIZE'] = args.cards
+    print(f'{f"board page, all {args.cards} cards":44}' + ''.join(f'{size:12}' for size in sizes(client, '/')))
+
+    # assets built into a copy of the static folder, so the benchmark leaves the source tree alone
+    static_folder = os.path.join(tempfile.mkdtemp(), 'static')
+    shutil.copytree(app.static_folder, static_folder, ignore=shutil.ignore_patterns('dist'))
+    app.static_folder = static_folder
+    manifest = build_assets(app)
+    configure_assets(app)
+    for name, built in manifest.items():
+        print(f'{name:44}' + ''.join(f'{size:12}' for size in sizes(client, f'/assets/{built}')))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
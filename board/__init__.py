@@ -1,18 +1,120 @@
-from flask import Flask
+from flask import Blueprint, Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
 import os
+from board.passwords import PasswordHasher, configure_passwords
+from board.storage import ShardedSession, configure_storage
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = "011d730ab92fc7e8536019bfdb33d5160f6fc7d03dd70ea01929130f129206cf"   # this and the database URI should technically be in an environment variable
-app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:///kanban.db"
+# The extensions are created unbound and the views are registered on a blueprint, so importing the package builds no
+# app, engine or thread pool. create_app builds an app from the environment and the given config, which is what each
+# worker (`gunicorn 'board:create_app()'`), each cli call (`flask --app board`) and the tests run.
 
-# app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
-bcrypt = Bcrypt(app)
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
+# the session routes the task tables to the shard of the request, see board/storage.py
+db = SQLAlchemy(session_options={'class_': ShardedSession})
+bcrypt = Bcrypt()
+# password hashing runs on a bounded pool sized by create_app, see board/passwords.py
+passwords = PasswordHasher(bcrypt)
+login_manager = LoginManager()
+login_manager.login_view = 'board.login'
 login_manager.login_message_category = 'info'
+# every view and cli command of the app. cli_group=None keeps the commands at the top level, e.g. `flask upgrade-db`
+bp = Blueprint('board', __name__, cli_group=None)
 
-from board import urls
\ No newline at end of file
+
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = "011d730ab92fc7e8536019bfdb33d5160f6fc7d03dd70ea01929130f129206cf"   # this and the database URI should technically be in an environment variable
+    # number of cards rendered per column before the rest is loaded on scroll
+    app.config['BOARD_PAGE_SIZE'] = int(os.environ.get('BOARD_PAGE_SIZE', 50))
+    app.config['SEARCH_PAGE_SIZE'] = int(os.environ.get('SEARCH_PAGE_SIZE', 20))
+    # upper bound, in characters, for the rendered board columns kept in memory by each worker
+    app.config['BOARD_CACHE_SIZE'] = int(os.environ.get('BOARD_CACHE_SIZE', 16 * 1024 * 1024))
+    # largest number of tasks accepted by one call of the batch task api
+    app.config['API_BATCH_LIMIT'] = int(os.environ.get('API_BATCH_LIMIT', 5000))
+    # accounts and teams are deleted with their first DELETE_CHUNK_SIZE tasks in the request, the rest is deleted in
+    # chunks of that size on a background thread, pausing DELETE_CHUNK_PAUSE seconds between chunks
+    app.config['DELETE_CHUNK_SIZE'] = int(os.environ.get('DELETE_CHUNK_SIZE', 5000))
+    app.config['DELETE_CHUNK_PAUSE'] = float(os.environ.get('DELETE_CHUNK_PAUSE', 0.05))
+    app.config['DELETE_IN_BACKGROUND'] = os.environ.get('DELETE_IN_BACKGROUND', 'true').lower() in ('1', 'true', 'yes')
+    # `flask archive-tasks` moves tasks Done for more than ARCHIVE_AFTER_DAYS days to the archive, ARCHIVE_BATCH_SIZE per transaction
+    app.config['ARCHIVE_AFTER_DAYS'] = float(os.environ.get('ARCHIVE_AFTER_DAYS', 30))
+    app.config['ARCHIVE_BATCH_SIZE'] = int(os.environ.get('ARCHIVE_BATCH_SIZE', 1000))
+    app.config['ARCHIVE_PAGE_SIZE'] = int(os.environ.get('ARCHIVE_PAGE_SIZE', 50))
+    # columns holding a card rank longer than this many characters get fresh ranks in the background
+    app.config['RANK_REBALANCE_LENGTH'] = int(os.environ.get('RANK_REBALANCE_LENGTH', 24))
+    # exports are read from the database and sent EXPORT_CHUNK_SIZE rows at a time, imports commit IMPORT_BATCH_SIZE tasks at a time
+    app.config['EXPORT_CHUNK_SIZE'] = int(os.environ.get('EXPORT_CHUNK_SIZE', 1000))
+    app.config['IMPORT_BATCH_SIZE'] = int(os.environ.get('IMPORT_BATCH_SIZE', 1000))
+    # board changes older than this are compacted away by `flask compact-changes`. clients further behind get a full snapshot
+    app.config['BOARD_CHANGE_RETENTION_HOURS'] = float(os.environ.get('BOARD_CHANGE_RETENTION_HOURS', 24 * 7))
+
+    # snapshots of logged in users are cached so requests do not have to load the user row.
+    # set USER_CACHE_URL (e.g. redis://localhost:6379/0) to share the cache between workers
+    app.config['USER_CACHE_URL'] = os.environ.get('USER_CACHE_URL')
+    app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', 10000))
+    app.config['USER_CACHE_TTL'] = float(os.environ.get('USER_CACHE_TTL', 60))
+    # statements slower than this are logged. /admin/metrics is open to the ADMIN_EMAILS users and to METRICS_TOKEN bearers
+    app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 100))
+    # make views fail when they lazily load a relationship missing from their loading policy (see board/loading.py)
+    app.config['RAISE_ON_LAZY_LOAD'] = os.environ.get('RAISE_ON_LAZY_LOAD', '').lower() in ('1', 'true', 'yes')
+    app.config['ADMIN_EMAILS'] = [email.strip() for email in os.environ.get('ADMIN_EMAILS', '').split(',') if email.strip()]
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+    # board pages receive changes as server-sent events. set EVENT_BROKER_URL (e.g. redis://localhost:6379/0) to deliver
+    # them across workers. a browser with more than EVENT_QUEUE_SIZE undelivered events is disconnected and catches up later
+    app.config['EVENT_BROKER_URL'] = os.environ.get('EVENT_BROKER_URL')
+    app.config['EVENT_QUEUE_SIZE'] = int(os.environ.get('EVENT_QUEUE_SIZE', 100))
+    app.config['EVENT_HEARTBEAT_SECONDS'] = float(os.environ.get('EVENT_HEARTBEAT_SECONDS', 15))
+    # compiled templates are kept in TEMPLATE_CACHE_DIR, shared by the workers and filled by `flask compile-templates`.
+    # with WARM_UP set, create_app loads every template and opens the pooled connections before returning the app
+    app.config['TEMPLATE_CACHE_DIR'] = os.environ.get('TEMPLATE_CACHE_DIR', os.path.join(app.instance_path, 'jinja-cache'))
+    app.config['WARM_UP'] = os.environ.get('WARM_UP', '').lower() in ('1', 'true', 'yes')
+    # html and json responses of at least COMPRESS_MIN_SIZE bytes are compressed, see board/compression.py. assets built
+    # by `flask build-assets` are cached by browsers for ASSET_MAX_AGE seconds, see board/assets.py
+    app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+    app.config['COMPRESS_LEVEL'] = int(os.environ.get('COMPRESS_LEVEL', 6))
+    app.config['COMPRESS_BROTLI_QUALITY'] = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 5))
+    app.config['ASSET_MAX_AGE'] = int(os.environ.get('ASSET_MAX_AGE', 365 * 24 * 3600))
+    # team boards are spread over SHARD_COUNT shard databases, by default files next to the home database. SHARD_URL
+    # names other sqlite files, with {shard} standing for the shard number. see board/shards.py
+    app.config['SHARD_COUNT'] = int(os.environ.get('SHARD_COUNT', 0))
+    app.config['SHARD_URL'] = os.environ.get('SHARD_URL')
+    # `flask send-reminders` sends a reminder REMINDER_LEAD_HOURS before a task's due day ends and one once it has ended,
+    # to the reminder table or to REMINDER_WEBHOOK_URL. it keeps the next REMINDER_WINDOW_MINUTES in memory, see board/reminders.py
+    app.config['REMINDER_LEAD_HOURS'] = float(os.environ.get('REMINDER_LEAD_HOURS', 24))
+    app.config['REMINDER_WINDOW_MINUTES'] = float(os.environ.get('REMINDER_WINDOW_MINUTES', 60))
+    app.config['REMINDER_POLL_SECONDS'] = float(os.environ.get('REMINDER_POLL_SECONDS', 10))
+    app.config['REMINDER_BATCH_SIZE'] = int(os.environ.get('REMINDER_BATCH_SIZE', 500))
+    app.config['REMINDER_WEBHOOK_URL'] = os.environ.get('REMINDER_WEBHOOK_URL')
+    app.config.from_mapping(config or {})
+
+    # the database URI, pool sizes and sqlite pragmas come from the environment unless config gives them, see board/storage.py
+    configure_storage(app)
+    # the bcrypt cost is BCRYPT_ROUNDS or measured against BCRYPT_TARGET_MS, and hashing runs on a bounded pool,
+    # see board/passwords.py
+    configure_passwords(app)
+    configure_templates(app)
+    # app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    configure_shards(app)
+    bcrypt.init_app(app)
+    passwords.configure(app.config['BCRYPT_LOG_ROUNDS'], app.config['PASSWORD_HASH_WORKERS'], app.config['PASSWORD_HASH_QUEUE'])
+    login_manager.init_app(app)
+    # the caches and the event hub are shared by the views of the process, sized by the last app created
+    configure_cache(app)
+    configure_user_cache(app)
+    configure_events(app)
+    configure_assets(app)
+    app.register_blueprint(bp)
+    if app.config['WARM_UP']:
+        warm_up(app)
+    return app
+
+
+from board import sessions, metrics, loading, urls, api, events, search, stats, deletion, archive, ranks, transfer, migrations, startup, compression, assets, shards, reminders
+from board.assets import configure_assets
+from board.cache import configure_cache
+from board.events import configure_events
+from board.sessions import configure_user_cache
+from board.shards import configure_shards
+from board.startup import configure_templates, warm_up
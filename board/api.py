@@ -0,0 +1,292 @@
+from datetime import datetime
+from flask import abort, current_app, jsonify, make_response, request, url_for
+from flask_login import current_user, login_required
+from sqlalchemy import case, delete, func, select, update
+from werkzeug.datastructures import MultiDict
+from board import bp, db
+from board.archive import done_date
+from board.boards import COLUMN_SLUGS, STATUSES, get_board_or_404, ids_by_board, load_board, load_column, task_board_key
+from board.cache import board_version
+from board.changes import board_changes, log_board_change, task_state
+from board.forms import TaskForm
+from board.membership import is_member
+from board.models import Task
+from board.ranks import check_rank, column_condition, rank_between, top_ranks
+from board.shards import board_shards, group_by_shard, task_shard, use_shard
+
+STATUS_BY_SLUG = {slug: status for status, slug in COLUMN_SLUGS.items()}
+
+
+def column_url(board_key, column):
+    # url of the next page of a column, or None when the column is complete
+    if column.cursor is None:
+        return None
+    return url_for('board.board_column', board_key=board_key, column=column.slug, after=column.cursor)
+
+
+@bp.route('/api/boards/<board_key>/columns/<column>')
+@login_required
+def board_column(board_key, column):
+    # return the next page of a column as json. used by the board pages to load more cards on scroll
+
+    board = get_board_or_404(board_key)
+    status = STATUS_BY_SLUG.get(column)
+    if status is None:
+        abort(404)
+    try:
+        page = load_column(status, after=request.args.get('after'), limit=current_app.config['BOARD_PAGE_SIZE'], **board)
+    except ValueError:
+        abort(400)
+    return jsonify(tasks=[task_state(task) for task in page.tasks], next=column_url(board_key, page))
+
+
+@bp.route('/api/boards/<board_key>/changes')
+@login_required
+def board_changes_since(board_key):
+    # bring a client that has version since of a board up to date. the answer holds the tasks created or changed since
+    # then and the ids of the deleted ones, or, when the change log does not reach back to since, a snapshot of the
+    # first page of every column like the board page
+
+    board = get_board_or_404(board_key)
+    version = board_version(board_key)
+    since = request.args.get('since', type=int)
+    changes = board_changes(board_key, since, version) if since is not None and since >= 0 else None
+    if changes is None:
+        columns = load_board(limit=current_app.config['BOARD_PAGE_SIZE'], **board)
+        return jsonify(version=version, snapshot=True,
+                       columns=[{'status': column.status, 'tasks': [task_state(task) for task in column.tasks],
+                                 'next': column_url(board_key, column)} for column in columns])
+    tasks, deleted, team_changed = changes
+    response = {'version': version, 'snapshot': False, 'tasks': [task_state(task) for task in tasks], 'deleted': deleted}
+    if team_changed and 'team' in board:
+        response['team'] = {'name': board['team'].name}
+    return jsonify(response)
+
+
+# fields of a task that can be set through the api, validated with the same rules as TaskForm
+TASK_FIELDS = ('title', 'description', 'status', 'due_date', 'priority')
+
+
+def validate_task_fields(item, fields, form=None):
+    # run the TaskForm validators over some fields of a json task. returns the converted values and the errors per field.
+    # binding the form fields costs more than validating them, so callers checking many items pass the same form
+    formdata = MultiDict({name: str(item[name]) for name in fields if item.get(name) is not None})
+    if form is None:
+        form = TaskForm(formdata=formdata, meta={'csrf': False})
+    else:
+        form.process(formdata)
+    values, errors = {}, {}
+    for name in fields:
+        field = form[name]
+        if field.validate(form):
+            values[name] = field.data
+        else:
+            errors[name] = field.errors
+    if 'due_date' in values:
+        values['due_date'] = datetime.combine(values['due_date'], datetime.min.time())
+    return values, errors
+
+
+def batch_items(key):
+    # the list sent under key in the json body, or a 400 response if the body is malformed or too large
+    body = request.get_json(silent=True)
+    items = body.get(key) if isinstance(body, dict) else None
+    if not isinstance(items, list) or not items:
+        abort(make_response(jsonify(errors=[{'error': f'Expected a non-empty list under "{key}"'}]), 400))
+    if len(items) > current_app.config['API_BATCH_LIMIT']:
+        abort(make_response(jsonify(errors=[{'error': f'At most {current_app.config["API_BATCH_LIMIT"]} items per batch'}]), 400))
+    return items
+
+
+def can_edit(task):
+    # team tasks can be changed by any member of the team, personal tasks only by their creator
+    if task.team_id:
+        return is_member(task.team_id)
+    return task.user_id == current_user.id
+
+
+def editable_tasks(ids):
+    # load the owner columns and status of the requested tasks with one query per shard. returns the tasks by id and
+    # the errors of the others
+    tasks = {}
+    for shard, shard_ids in group_by_shard(set(ids), task_shard).items():
+        with use_shard(shard):
+            tasks.update((task.id, task) for task in db.session.query(Task.id, Task.user_id, Task.team_id, Task.status)
+                         .filter(Task.id.in_(shard_ids)))
+    errors = []
+    for index, task_id in enumerate(ids):
+        if task_id not in tasks:
+            errors.append({'index': index, 'id': task_id, 'error': 'Task does not exist'})
+        elif not can_edit(tasks[task_id]):
+            errors.append({'index': index, 'id': task_id, 'error': 'You cannot change this task'})
+    return tasks, errors
+
+
+def batch_errors(errors):
+    # nothing is written when any item is invalid, the response lists the problem of every item
+    return jsonify(errors=errors), 400
+
+
+@bp.route('/api/tasks/batch', methods=['POST'])
+@login_required
+def create_tasks():
+    # create many tasks in one transaction with a single multi-row INSERT per shard.
+    # each item holds the TaskForm fields and an optional team_id to create the task on a team board
+
+    items = batch_items('tasks')
+    rows, keys, errors = [], [], []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({'index': index, 'error': 'Expected an object'})
+            continue
+        values, field_errors = validate_task_fields(item, TASK_FIELDS)
+        team_id = item.get('team_id')
+        if team_id is not None and not (isinstance(team_id, int) and is_member(team_id)):
+            field_errors['team_id'] = ['You are not a member of this team.']
+        if field_errors:
+            errors.append({'index': index, 'errors': field_errors})
+            continue
+        values['user_id'] = None if team_id else current_user.id
+        values['team_id'] = team_id
+        values['date_done'] = done_date(values['status'])
+        rows.append(values)
+        keys.append(f'team-{team_id}' if team_id else f'user-{current_user.id}')
+    if errors:
+        return batch_errors(errors)
+
+    # new cards go on top of their column, in the order they were sent
+    columns = {}
+    for key, values in zip(keys, rows):
+        columns.setdefault((key, values['status']), []).append(values)
+    for (key, status), column_rows in columns.items():
+        ranks = top_ranks(db.session, key, status, len(column_rows))
+        for values, rank in zip(column_rows, ranks):
+            values['rank'] = rank
+        check_rank(db.session, key, status, max(ranks, key=len))
+
+    # a core insert keeps every row the same shape, so the personal and team tasks of a shard go out in one multi-row
+    # statement. the rows of RETURNING may come back in any order, so each is matched to the task it was sent as by its
+    # board, column and rank, which top_ranks made unique. the ids are answered in the order the tasks were sent
+    table = Task.__table__
+    shards = board_shards(keys)
+    created = [None] * len(rows)
+    for shard, positions in group_by_shard(range(len(rows)), lambda position: shards[keys[position]]).items():
+        with use_shard(shard):
+            inserted = db.session.execute(table.insert().returning(table.c.id, table.c.user_id, table.c.team_id,
+                                                                   table.c.status, table.c.rank),
+                                          [rows[position] for position in positions]).all()
+        sent = {(keys[position], rows[position]['status'], rows[position]['rank']): position
+                for position in positions}
+        for task in inserted:
+            created[sent[task_board_key(task), task.status, task.rank]] = task
+    for key, ids in ids_by_board(created).items():
+        log_board_change(key, changed=ids)
+    db.session.commit()
+    return jsonify(ids=[task.id for task in created]), 201
+
+
+@bp.route('/api/tasks/batch', methods=['PATCH'])
+@login_required
+def update_tasks():
+    # change many tasks in one transaction. each item holds an id and the fields to change, e.g. {"id": 3, "status": "Done"}.
+    # items that make the same change are applied together with one UPDATE ... WHERE id IN (...), so moving
+    # a thousand cards to another column is a single statement per shard
+
+    items = batch_items('tasks')
+    if not all(isinstance(item, dict) and isinstance(item.get('id'), int) for item in items):
+        return batch_errors([{'error': 'Every item needs an integer "id"'}])
+    tasks, errors = editable_tasks([item['id'] for item in items])
+
+    changes = {}
+    for index, item in enumerate(items):
+        fields = [name for name in TASK_FIELDS if name in item]
+        if not fields:
+            errors.append({'index': index, 'id': item['id'], 'error': 'Nothing to change'})
+            continue
+        values, field_errors = validate_task_fields(item, fields)
+        if field_errors:
+            errors.append({'index': index, 'id': item['id'], 'errors': field_errors})
+            continue
+        changes.setdefault(tuple(sorted(values.items())), []).append(item['id'])
+    if errors:
+        return batch_errors(errors)
+
+    for values, ids in changes.items():
+        values = dict(values)
+        if 'status' in values:
+            # only the cards that change column get a new date_done and a new rank. the others keep theirs, so a task
+            # sent as Done again keeps aging towards the archive
+            changed = [task_id for task_id in ids if tasks[task_id].status != values['status']]
+            if changed:
+                stamp = done_date(values['status'])
+                values['date_done'] = case({task_id: stamp for task_id in changed}, value=Task.id, else_=Task.date_done)
+            # cards moved to another column go on top of it, each with its own rank so the statement stays single
+            moved = ids_by_board(tasks[task_id] for task_id in changed)
+            ranks = {}
+            for key, moved_ids in moved.items():
+                column_ranks = top_ranks(db.session, key, values['status'], len(moved_ids))
+                ranks.update(zip(moved_ids, column_ranks))
+                check_rank(db.session, key, values['status'], max(column_ranks, key=len))
+            if ranks:
+                values['rank'] = case(ranks, value=Task.id, else_=Task.rank)
+        for shard, shard_ids in group_by_shard(ids, task_shard).items():
+            with use_shard(shard):
+                db.session.execute(update(Task).where(Task.id.in_(shard_ids)).values(values),
+                                   execution_options={'synchronize_session': False})
+    for key, ids in ids_by_board(tasks.values()).items():
+        log_board_change(key, changed=ids)
+    db.session.commit()
+    return jsonify(updated=len(tasks))
+
+
+@bp.route('/api/tasks/batch', methods=['DELETE'])
+@login_required
+def delete_tasks():
+    # delete many tasks in one transaction with a single DELETE ... WHERE id IN (...) per shard
+
+    ids = batch_items('ids')
+    if not all(isinstance(task_id, int) for task_id in ids):
+        return batch_errors([{'error': 'Expected a list of integer ids'}])
+    tasks, errors = editable_tasks(ids)
+    if errors:
+        return batch_errors(errors)
+
+    for shard, shard_ids in group_by_shard(tasks, task_shard).items():
+        with use_shard(shard):
+            db.session.execute(delete(Task).where(Task.id.in_(shard_ids)), execution_options={'synchronize_session': False})
+    for key, ids in ids_by_board(tasks.values()).items():
+        log_board_change(key, deleted=ids)
+    db.session.commit()
+    return jsonify(deleted=len(tasks))
+
+
+@bp.route('/api/tasks/<int:task_id>/move', methods=['POST'])
+@login_required
+def move_task(task_id):
+    # drag and drop. moves a card to {"status": ..., "after": id}, right below the card with that id, or on top of the
+    # column when after is null. only the moved task is written: it gets a rank between the ranks of its new neighbours
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or body.get('status') not in STATUSES \
+            or not (body.get('after') is None or isinstance(body['after'], int)):
+        return batch_errors([{'error': 'Expected a status and the integer id of the card above, or null'}])
+    task = db.session.get(Task, task_id)
+    if task is None:
+        abort(404)
+    if not can_edit(task):
+        abort(403)
+
+    key, status = task_board_key(task), body['status']
+    column = column_condition(key, status) & (Task.id != task.id)
+    above = ''
+    if body['after'] is not None:
+        above = db.session.scalar(select(Task.rank).where(column, Task.id == body['after']))
+        if above is None:
+            return batch_errors([{'error': 'The card above is not in that column'}])
+    below = db.session.scalar(select(func.min(Task.rank)).where(column, Task.rank > above))
+    task.status = status
+    task.rank = rank_between(above, below)
+    check_rank(db.session, key, status, task.rank)
+    log_board_change(key, changed=[task.id])
+    db.session.commit()
+    return jsonify(task_state(task))
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from sqlalchemy import delete, event, inspect, literal, select
+from board import bp, db
+from board.boards import ids_by_board, task_board_key
+from board.changes import log_board_change
+from board.models import ArchivedTask, Task
+from board.ranks import first_rank, rank_between
+from board.shards import each_shard
+
+# Archive of old Done tasks. `flask archive-tasks` moves the tasks that have been Done for more than ARCHIVE_AFTER_DAYS
+# from the task table to archived_task, ARCHIVE_BATCH_SIZE tasks per transaction, so the boards, their counters and
+# their indexes only hold live tasks. Archived tasks are listed page by page on the archive page of their board and
+# can be restored to it.
+
+# the columns copied between the two tables. a task keeps its id
+TASK_COLUMNS = ('id', 'title', 'description', 'date_created', 'due_date', 'priority', 'status', 'user_id', 'team_id')
+
+
+def done_date(status):
+    # the date_done of a task given its new status
+    return datetime.utcnow() if status == 'Done' else None
+
+
+@event.listens_for(Task, 'before_insert')
+@event.listens_for(Task, 'before_update')
+def stamp_date_done(mapper, connection, task):
+    # tasks created or changed through the orm. the batch api sets date_done itself
+    if inspect(task).attrs.status.history.has_changes():
+        task.date_done = done_date(task.status)
+
+
+def archive_tasks(older_than, batch_size):
+    # move the tasks that have been Done since before older_than to the archive. returns the number of tasks moved
+    moved = 0
+    now = datetime.utcnow()
+    while True:
+        rows = db.session.query(Task.id, Task.user_id, Task.team_id) \
+            .filter(Task.status == 'Done', Task.date_done < older_than).limit(batch_size).all()
+        if not rows:
+            return moved
+        ids = [row.id for row in rows]
+        columns = [getattr(Task, name) for name in TASK_COLUMNS] + [Task.date_done, literal(now)]
+        db.session.execute(ArchivedTask.__table__.insert().from_select(TASK_COLUMNS + ('date_done', 'date_archived'),
+                                                                      select(*columns).where(Task.id.in_(ids))))
+        db.session.execute(delete(Task).where(Task.id.in_(ids)), execution_options={'synchronize_session': False})
+        # the tasks leave their boards like deleted tasks
+        for key, board_ids in ids_by_board(rows).items():
+            log_board_change(key, deleted=board_ids)
+        db.session.commit()
+        moved += len(ids)
+
+
+def archive_query(user=None, team=None):
+    # the archived tasks of a board, chosen like board_query chooses live tasks
+    if team is not None:
+        return ArchivedTask.query.filter(ArchivedTask.team_id == team.id)
+    return ArchivedTask.query.filter(ArchivedTask.user_id == user.id, ArchivedTask.team_id.is_(None))
+
+
+def archived_tasks(user=None, team=None, before=None, limit=50):
+    # one page of the archive of a board, newest tasks first. returns the tasks and the id to pass as before to get
+    # the next page, or None on the last page
+    query = archive_query(user, team)
+    if before is not None:
+        query = query.filter(ArchivedTask.id < before)
+    tasks = query.order_by(ArchivedTask.id.desc()).limit(limit + 1).all()
+    if len(tasks) > limit:
+        return tasks[:limit], tasks[limit - 1].id
+    return tasks, None
+
+
+def restore_task(archived):
+    # put an archived task back on top of its column. it counts as Done from now on, so the next archive run leaves it there
+    key = task_board_key(archived)
+    rank = rank_between('', first_rank(db.session, key, archived.status))
+    columns = [getattr(ArchivedTask, name) for name in TASK_COLUMNS] + [literal(datetime.utcnow()), literal(rank)]
+    db.session.execute(Task.__table__.insert().from_select(TASK_COLUMNS + ('date_done', 'rank'),
+                                                          select(*columns).where(ArchivedTask.id == archived.id)))
+    db.session.execute(delete(ArchivedTask).where(ArchivedTask.id == archived.id), execution_options={'synchronize_session': False})
+    log_board_change(key, changed=[archived.id])
+
+
+@bp.cli.command('archive-tasks')
+@click.option('--days', type=float, default=None, help='Archive tasks Done for more than this many days '
+                                                       '(default ARCHIVE_AFTER_DAYS).')
+def archive_tasks_command(days):
+    """Move old Done tasks to the archive."""
+    days = current_app.config['ARCHIVE_AFTER_DAYS'] if days is None else days
+    moved = sum(archive_tasks(datetime.utcnow() - timedelta(days=days), current_app.config['ARCHIVE_BATCH_SIZE'])
+                for _ in each_shard())
+    print(f'Archived {moved} tasks.')
@@ -0,0 +1,99 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+from flask import current_app, request, send_from_directory, url_for
+from werkzeug.exceptions import NotFound
+from board import bp
+from board.compression import brotli
+
+# Static assets with long lived caching. `flask build-assets` copies every file of the static folder to static/dist
+# under a name holding a hash of its content, e.g. kanban.3f2a9c1d0b4e.css, writes gzip and brotli compressed copies
+# next to it and records the names in static/dist/manifest.json. Pages link to the assets through asset_url, and
+# /assets serves them precompressed with an immutable cache header: a browser never asks for an asset again, and a
+# changed file gets a new name. Without a build, asset_url falls back on the plain static files.
+
+DIST_FOLDER = 'dist'
+MANIFEST = 'manifest.json'
+
+# names of the built assets by source name, loaded by create_app
+asset_manifest = {}
+
+
+def dist_folder(app):
+    return os.path.join(app.static_folder, DIST_FOLDER)
+
+
+def configure_assets(app):
+    asset_manifest.clear()
+    path = os.path.join(dist_folder(app), MANIFEST)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as manifest:
+            asset_manifest.update(json.load(manifest))
+
+
+def fingerprinted_name(name, content):
+    root, extension = os.path.splitext(name)
+    return f'{root}.{hashlib.sha256(content).hexdigest()[:12]}{extension}'
+
+
+def build_assets(app):
+    # build every asset of the static folder and write the manifest. returns the manifest
+    folder = dist_folder(app)
+    os.makedirs(folder, exist_ok=True)
+    manifest = {}
+    for name in sorted(os.listdir(app.static_folder)):
+        path = os.path.join(app.static_folder, name)
+        if not os.path.isfile(path):
+            continue
+        with open(path, 'rb') as source:
+            content = source.read()
+        built = fingerprinted_name(name, content)
+        variants = {built: content, built + '.gz': gzip.compress(content, 9, mtime=0)}
+        if brotli:
+            variants[built + '.br'] = brotli.compress(content, quality=11)
+        for variant, data in variants.items():
+            with open(os.path.join(folder, variant), 'wb') as output:
+                output.write(data)
+        manifest[name] = built
+    with open(os.path.join(folder, MANIFEST), 'w', encoding='utf-8') as output:
+        json.dump(manifest, output, indent=2, sort_keys=True)
+    return manifest
+
+
+@bp.app_template_global()
+def asset_url(name):
+    built = asset_manifest.get(name)
+    if built is None:
+        return url_for('static', filename=name)
+    return url_for('board.asset', filename=built)
+
+
+@bp.route('/assets/<filename>')
+def asset(filename):
+    # a built asset, in the best precompressed copy the browser accepts
+
+    if filename not in asset_manifest.values():
+        raise NotFound()
+    folder = dist_folder(current_app)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = request.accept_encodings.best_match([encoding for encoding, suffix in (('br', '.br'), ('gzip', '.gz'))
+                                                    if os.path.exists(os.path.join(folder, filename + suffix))])
+    suffix = {'br': '.br', 'gzip': '.gz'}.get(encoding, '')
+    response = send_from_directory(folder, filename + suffix, mimetype=mimetype, max_age=current_app.config['ASSET_MAX_AGE'])
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@bp.cli.command('build-assets')
+def build_assets_command():
+    """Write content-hashed, precompressed copies of the static files to static/dist."""
+    manifest = build_assets(current_app)
+    configure_assets(current_app)
+    for name, built in manifest.items():
+        print(f'{name} -> {DIST_FOLDER}/{built}')
@@ -0,0 +1,132 @@
+import base64
+import json
+from collections import namedtuple
+from flask import abort, g
+from flask_login import current_user
+from sqlalchemy import and_, or_, union_all
+from sqlalchemy.orm import aliased
+from board import db
+from board.loading import TEAM_ONLY
+from board.membership import require_member
+from board.models import Task, Team
+from board.storage import HOME
+
+# the columns of a board, in the order they are shown, and the slugs used for them in urls
+STATUSES = ('To Do', 'In Progress', 'Done')
+COLUMN_SLUGS = {'To Do': 'todo', 'In Progress': 'in-progress', 'Done': 'done'}
+
+# order of the cards inside a column, set by moving them (see board/ranks.py). the task id breaks ties so that every card
+# has a unique position for keyset pagination
+COLUMN_ORDER = (Task.rank.asc(), Task.id.asc())
+
+# one page of a column. cursor points just after the last task of the page and is None when the column has no more tasks
+Column = namedtuple('Column', ['status', 'slug', 'tasks', 'cursor'])
+
+
+def board_key(user=None, team=None):
+    # string that identifies a board in urls and caches
+    if team is not None:
+        return f'team-{team.id}'
+    return f'user-{user.id}'
+
+
+def task_board_key(task):
+    # key of the board a task is shown on
+    if task.team_id:
+        return f'team-{task.team_id}'
+    return f'user-{task.user_id}'
+
+
+def ids_by_board(tasks):
+    # group rows holding the id and owner columns of tasks by the board they are on
+    boards = {}
+    for task in tasks:
+        boards.setdefault(task_board_key(task), []).append(task.id)
+    return boards
+
+
+def get_board_or_404(board_key):
+    # resolve a board key like 'team-3' or 'user-7' to the keyword arguments taken by the board loaders,
+    # making sure the current user is allowed to see the board. the rest of the request reads the shard of the board
+    kind, _, owner_id = board_key.partition('-')
+    if not owner_id.isdigit():
+        abort(404)
+    if kind == 'team':
+        team = Team.query.options(*TEAM_ONLY).get_or_404(int(owner_id))
+        require_member(team.id)
+        g.shard = team.shard
+        return {'team': team}
+    if kind == 'user':
+        if int(owner_id) != current_user.id:
+            abort(403)
+        g.shard = HOME
+        return {'user': current_user}
+    abort(404)
+
+
+def board_query(user=None, team=None):
+    # a team board holds every task of the team. a personal board holds the tasks a user created outside of any team
+    if team is not None:
+        return Task.query.filter(Task.team_id == team.id)
+    return Task.query.filter(Task.user_id == user.id, Task.team_id.is_(None))
+
+
+def encode_cursor(task):
+    raw = json.dumps([task.rank, task.id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    # raises ValueError if the cursor was not produced by encode_cursor
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        rank, task_id = json.loads(raw)
+        if not isinstance(rank, str):
+            raise TypeError(rank)
+        return rank, int(task_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as error:
+        raise ValueError(f'Invalid cursor {cursor!r}') from error
+
+
+def after_cursor(cursor):
+    # keyset condition selecting the tasks that come after the cursor in COLUMN_ORDER
+    rank, task_id = decode_cursor(cursor)
+    return or_(Task.rank > rank, and_(Task.rank == rank, Task.id > task_id))
+
+
+def make_column(status, tasks, limit):
+    # tasks holds up to limit + 1 rows. the extra row only tells us that there is another page
+    if limit is not None and len(tasks) > limit:
+        tasks = tasks[:limit]
+        return Column(status, COLUMN_SLUGS[status], tasks, encode_cursor(tasks[-1]))
+    return Column(status, COLUMN_SLUGS[status], tasks, None)
+
+
+def load_board(user=None, team=None, limit=None):
+    # fetch every column of a board with one ordered query and split the rows by status in python.
+    # the ordering follows the composite board indexes on Task, so the database walks the index instead of sorting.
+    # with a limit only the first page of each column is loaded: one LIMIT per column, joined with UNION ALL, so each
+    # column is an index range scan of limit + 1 rows however large the board is
+    query = board_query(user, team)
+    if limit is None:
+        tasks = query.order_by(Task.status, *COLUMN_ORDER).all()
+    else:
+        pages = [query.filter(Task.status == status).order_by(*COLUMN_ORDER).limit(limit + 1).subquery().select()
+                 for status in STATUSES]
+        page = union_all(*pages).subquery()
+        page_task = aliased(Task, page)
+        tasks = db.session.query(page_task).order_by(page.c.status, page.c.rank, page.c.id).all()
+
+    grouped = {status: [] for status in STATUSES}
+    for task in tasks:
+        grouped[task.status].append(task)
+    return [make_column(status, grouped[status], limit) for status in STATUSES]
+
+
+def load_column(status, user=None, team=None, after=None, limit=50):
+    # one page of a single column, starting after the given cursor. this is an index range scan of at most limit + 1 rows
+    query = board_query(user, team).filter(Task.status == status)
+    if after:
+        query = query.filter(after_cursor(after))
+    tasks = query.order_by(*COLUMN_ORDER).limit(limit + 1).all()
+    return make_column(status, tasks, limit)
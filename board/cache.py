@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from flask import current_app, make_response, render_template, request, session
+from markupsafe import Markup
+from sqlalchemy import insert, update
+from board import db
+from board.assets import asset_manifest
+from board.models import BoardVersion
+from board.shards import board_shard, use_shard
+from board.stats import board_stats, today
+
+
+class LRUCache:
+    # thread safe least recently used cache bounded by the total size of its values.
+    # size is a function giving the size of one value, by default every value counts as 1
+
+    def __init__(self, max_size, size=None):
+        self.max_size = max_size
+        self.size = size or (lambda value: 1)
+        self.current_size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def set(self, key, value):
+        size = self.size(value)
+        with self.lock:
+            if key in self.entries:
+                self.current_size -= self.size(self.entries.pop(key))
+            if size > self.max_size:
+                return
+            self.entries[key] = value
+            self.current_size += size
+            while self.current_size > self.max_size:
+                _, evicted = self.entries.popitem(last=False)
+                self.current_size -= self.size(evicted)
+
+    def pop(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.current_size -= self.size(self.entries.pop(key))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.current_size = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# rendered board columns keyed by (board_key, version, page size), bounded by the number of characters they hold
+fragment_cache = LRUCache(0, size=len)
+
+
+def configure_cache(app):
+    fragment_cache.max_size = app.config['BOARD_CACHE_SIZE']
+
+
+def board_version(board_key):
+    row = db.session.get(BoardVersion, board_key)
+    return row.version if row else 0
+
+
+def bump_board_version(board_key):
+    # call before committing any write that changes a board. the bump is part of the same transaction as the write.
+    # returns the new version. the row is written at once, in the shard of the board
+    with use_shard(board_shard(board_key)):
+        version = db.session.execute(update(BoardVersion).where(BoardVersion.board_key == board_key)
+                                     .values(version=BoardVersion.version + 1).returning(BoardVersion.version)).scalar()
+        if version is None:
+            version = 1
+            db.session.execute(insert(BoardVersion).values(board_key=board_key, version=version))
+    return version
+
+
+def template_fingerprint():
+    # a hash of the template sources and of the asset names the pages link to, so that deploying new templates or
+    # assets changes every etag
+    if not hasattr(template_fingerprint, 'value'):
+        digest = hashlib.sha1()
+        folder = os.path.join(current_app.root_path, current_app.template_folder)
+        for name in sorted(os.listdir(folder)):
+            with open(os.path.join(folder, name), 'rb') as template:
+                digest.update(template.read())
+        digest.update(json.dumps(asset_manifest, sort_keys=True).encode('utf-8'))
+        template_fingerprint.value = digest.hexdigest()[:12]
+    return template_fingerprint.value
+
+
+def render_board(template, board_key, load_columns, **context):
+    # render a board page, answering with 304 Not Modified when the browser already has the current version.
+    # only the board_version row is read for a 304, and the columns are rendered at most once per version.
+    # the day is part of the etag because the overdue count in the header changes at midnight without any write
+    version = board_version(board_key)
+    page_size = current_app.config['BOARD_PAGE_SIZE']
+    etag = f'{board_key}.{version}.{page_size}.{today().isoformat()}.{template_fingerprint()}'
+
+    # flashed messages are part of the page but not of the version, so never answer 304 while there are some to show
+    if request.if_none_match.contains_weak(etag) and '_flashes' not in session:
+        response = make_response('', 304)
+    else:
+        cache_key = (board_key, version, page_size)
+        columns_html = fragment_cache.get(cache_key)
+        if columns_html is None:
+            columns_html = Markup(render_template('columns.html', columns=load_columns(), board_key=board_key,
+                                                   version=version))
+            fragment_cache.set(cache_key, columns_html)
+        response = make_response(render_template(template, columns_html=columns_html, board_key=board_key,
+                                                 stats=board_stats([board_key])[board_key], **context))
+
+    response.set_etag(etag)
+    # boards are private to their users and must be revalidated on every visit
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+from flask import current_app, url_for
+from sqlalchemy import delete
+from board import bp, db
+from board.cache import bump_board_version
+from board.models import BoardChange, Task
+from board.shards import board_shard, each_shard, use_shard
+
+# Change feed of the boards. Every write bumps the board version and appends what it changed to board_change in the
+# same transaction, so a client that saw version v catches up by reading the rows with a greater version. Rows older
+# than BOARD_CHANGE_RETENTION_HOURS are compacted away; a client whose version falls in the compacted range gets a
+# snapshot of the board instead.
+
+
+def task_state(task):
+    # the fields needed to draw a card and place it in its column, as sent to the board pages
+    # (due_date is still a date rather than a datetime on tasks changed by a form and not reloaded yet)
+    return {'id': task.id, 'title': task.title, 'url': url_for('board.task', task_id=task.id), 'status': task.status,
+            'priority': task.priority, 'due_date': task.due_date.strftime('%Y-%m-%d'), 'rank': task.rank}
+
+
+def log_board_change(board_key, changed=(), deleted=(), team=False):
+    # bump the version of a board and record the ids of the tasks created or updated, the ids of the deleted tasks and
+    # whether the team itself changed. call it before committing the write, new tasks need to be flushed to have an id
+    version = bump_board_version(board_key)
+    rows = [{'board_key': board_key, 'version': version, 'op': 'task', 'task_id': task_id} for task_id in changed]
+    rows += [{'board_key': board_key, 'version': version, 'op': 'delete', 'task_id': task_id} for task_id in deleted]
+    if team:
+        rows.append({'board_key': board_key, 'version': version, 'op': 'team', 'task_id': None})
+    if rows:
+        with use_shard(board_shard(board_key)):
+            db.session.execute(BoardChange.__table__.insert(), rows)
+    # kept until the commit, when board/events.py pushes the change to the browsers showing the board
+    db.session.info.setdefault('board_changes', []).append((board_key, version, list(changed), list(deleted), team))
+    return version
+
+
+def drop_board_changes(board_key):
+    # forget the log of a board that no longer exists
+    with use_shard(board_shard(board_key)):
+        db.session.execute(delete(BoardChange).where(BoardChange.board_key == board_key))
+
+
+def board_changes(board_key, since, version):
+    # the changes that took a board from version since to its current version, reduced to the last operation on each
+    # task. returns (tasks changed, ids deleted, whether the team changed), or None when the log does not cover since
+    # and the client needs a snapshot
+    if since == version:
+        return [], [], False
+    if since > version:
+        return None
+    rows = db.session.query(BoardChange.version, BoardChange.op, BoardChange.task_id) \
+        .filter(BoardChange.board_key == board_key, BoardChange.version > since) \
+        .order_by(BoardChange.version, BoardChange.id).all()
+    # every version has at least one row, so the log is complete when it starts right after since
+    if not rows or rows[0].version != since + 1:
+        return None
+
+    last_op, team = {}, False
+    for row in rows:
+        if row.op == 'team':
+            team = True
+        else:
+            last_op[row.task_id] = row.op
+    changed_ids = [task_id for task_id, op in last_op.items() if op == 'task']
+    tasks = Task.query.filter(Task.id.in_(changed_ids)).all() if changed_ids else []
+    # a task updated here may have been deleted by a write that is not logged yet
+    found = {task.id for task in tasks}
+    deleted = [task_id for task_id, op in last_op.items() if op == 'delete' or task_id not in found]
+    return tasks, deleted, team
+
+
+def compact_changes(older_than=None):
+    # delete the log rows older than the retention period, in every shard. returns the number of rows deleted
+    if older_than is None:
+        older_than = datetime.utcnow() - timedelta(hours=current_app.config['BOARD_CHANGE_RETENTION_HOURS'])
+    deleted = 0
+    for _ in each_shard():
+        deleted += db.session.execute(delete(BoardChange).where(BoardChange.date_created < older_than)).rowcount
+        db.session.commit()
+    return deleted
+
+
+@bp.cli.command('compact-changes')
+def compact_changes_command():
+    """Delete board changes older than BOARD_CHANGE_RETENTION_HOURS."""
+    print(f'Deleted {compact_changes()} board changes.')
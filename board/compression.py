@@ -0,0 +1,79 @@
+import gzip
+import zlib
+from flask import current_app, request
+from board import bp
+
+# Compression of the responses. Board pages and api answers repeat the same markup and keys for every card, so they
+# shrink many times over. Responses of a compressible type and of at least COMPRESS_MIN_SIZE bytes are sent with brotli
+# when the browser accepts it and the optional brotli package is installed, with gzip otherwise. Streamed responses,
+# such as board exports, are compressed chunk by chunk and flushed after every chunk, so they still arrive as they are
+# produced. Server-sent events are left alone, and so are responses that already have an encoding, like /assets.
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = {'text/html', 'text/plain', 'text/css', 'text/csv', 'application/json', 'application/javascript',
+                      'application/x-ndjson'}
+
+
+def encodings():
+    # the encodings this worker can produce, preferred first
+    return ['br', 'gzip'] if brotli else ['gzip']
+
+
+def chosen_encoding():
+    # the preferred encoding among those the browser accepts, or None
+    return request.accept_encodings.best_match(encodings())
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=current_app.config['COMPRESS_BROTLI_QUALITY'])
+    return gzip.compress(data, current_app.config['COMPRESS_LEVEL'], mtime=0)
+
+
+def compress_stream(chunks, encoding, level, quality):
+    # runs after the request is over, so the settings are passed in
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=quality)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+        return
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@bp.after_app_request
+def compress_response(response):
+    if response.mimetype not in COMPRESSIBLE_TYPES or 'Content-Encoding' in response.headers \
+            or response.direct_passthrough or response.status_code in (204, 304) or response.status_code < 200:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = chosen_encoding()
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        chunks = response.iter_encoded()
+        response.response = compress_stream(chunks, encoding, current_app.config['COMPRESS_LEVEL'],
+                                            current_app.config['COMPRESS_BROTLI_QUALITY'])
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < current_app.config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # a compressed body is a different representation, so only a weak etag still describes it
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
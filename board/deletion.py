@@ -0,0 +1,107 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy import delete, or_, select
+from board import bp, db
+from board.cache import bump_board_version
+from board.changes import drop_board_changes
+from board.models import ArchivedTask, Task, Team, User, user_team_association
+from board.shards import each_shard, team_shards, use_shard
+from board.storage import HOME, current_shard
+
+# Deleting accounts and teams with set-based statements. The owner, its memberships and a first chunk of its tasks are
+# deleted in the request's transaction with DELETE ... WHERE statements, so no task is loaded into the session. Owners
+# with more than DELETE_CHUNK_SIZE tasks are gone as soon as the request commits, and the rest of their tasks is deleted
+# chunk by chunk on a background thread, each chunk in its own short transaction so other writers are not held up.
+
+# one background thread is enough: chunks are small and sqlite takes one writer at a time anyway
+purge_worker = ThreadPoolExecutor(1, thread_name_prefix='purge')
+
+
+def delete_task_chunk(condition):
+    # delete up to DELETE_CHUNK_SIZE tasks matching condition. returns True when there may be more
+    chunk = current_app.config['DELETE_CHUNK_SIZE']
+    ids = select(Task.id).where(condition).limit(chunk).scalar_subquery()
+    deleted = db.session.execute(delete(Task).where(Task.id.in_(ids)), execution_options={'synchronize_session': False})
+    return deleted.rowcount == chunk
+
+
+def purge_tasks(condition):
+    # delete every task matching condition, one committed chunk at a time
+    while delete_task_chunk(condition):
+        db.session.commit()
+        time.sleep(current_app.config['DELETE_CHUNK_PAUSE'])
+    db.session.commit()
+
+
+def purge_in_background(condition):
+    app = current_app._get_current_object()
+    shard = current_shard()
+
+    def run():
+        with app.app_context(), use_shard(shard):
+            try:
+                purge_tasks(condition)
+            except Exception:
+                # the tasks left are found again by `flask purge-orphans`
+                app.logger.exception('Purging deleted tasks failed')
+
+    if app.config['DELETE_IN_BACKGROUND']:
+        purge_worker.submit(run)
+    else:
+        purge_tasks(condition)
+
+
+def delete_user_rows(user_id):
+    # delete an account with its personal tasks and memberships. call commit_deletion afterwards
+    condition = Task.user_id == user_id
+    more = delete_task_chunk(condition)
+    db.session.execute(delete(ArchivedTask).where(ArchivedTask.user_id == user_id))
+    db.session.execute(delete(user_team_association).where(user_team_association.c.user_id == user_id))
+    db.session.execute(delete(User).where(User.id == user_id), execution_options={'synchronize_session': False})
+    bump_board_version(f'user-{user_id}')
+    drop_board_changes(f'user-{user_id}')
+    return condition if more else None
+
+
+def delete_team_rows(team_id):
+    # delete a team with its tasks and memberships. call commit_deletion afterwards, with the shard of the team routed to
+    condition = Task.team_id == team_id
+    more = delete_task_chunk(condition)
+    db.session.execute(delete(ArchivedTask).where(ArchivedTask.team_id == team_id))
+    db.session.execute(delete(user_team_association).where(user_team_association.c.team_id == team_id))
+    db.session.execute(delete(Team).where(Team.id == team_id), execution_options={'synchronize_session': False})
+    bump_board_version(f'team-{team_id}')
+    drop_board_changes(f'team-{team_id}')
+    return condition if more else None
+
+
+def commit_deletion(remaining):
+    # commit a deletion and, for large owners, start deleting the tasks that did not fit in the first chunk
+    db.session.commit()
+    if remaining is not None:
+        purge_in_background(remaining)
+
+
+def orphaned_tasks():
+    # tasks of the current shard whose owner was deleted but whose purge did not finish, e.g. because the worker was
+    # restarted, and tasks left behind on a shard their team was moved away from
+    shard = current_shard()
+    if shard == HOME:
+        return or_(Task.user_id.isnot(None) & ~select(User.id).where(User.id == Task.user_id).exists(),
+                   Task.team_id.isnot(None) & ~select(Team.id).where(Team.id == Task.team_id, Team.shard == HOME).exists())
+    # the owners are in the home database, so they are looked up rather than joined
+    team_ids = db.session.scalars(select(Task.team_id).where(Task.team_id.isnot(None)).distinct()).all()
+    gone = [team_id for team_id, team_shard in team_shards(team_ids).items() if team_shard != shard]
+    return Task.team_id.in_(gone) | Task.team_id.is_(None)
+
+
+@bp.cli.command('purge-orphans')
+def purge_orphans_command():
+    """Delete the tasks left behind by deleted accounts and teams, and by teams moved to another shard."""
+    deleted = 0
+    for _ in each_shard():
+        condition = orphaned_tasks()
+        deleted += db.session.query(Task.id).filter(condition).count()
+        purge_tasks(condition)
+    print(f'Deleted {deleted} orphaned tasks.')
@@ -0,0 +1,234 @@
+import json
+import queue
+import threading
+from flask import Response, current_app, has_request_context, request
+from flask_login import login_required
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from board import bp, db
+from board.boards import get_board_or_404
+from board.cache import board_version
+from board.changes import board_changes, task_state
+from board.models import Task, Team
+from board.shards import board_shards, use_shard
+
+# Server-Sent Events for the board pages. The changes logged by log_board_change are turned into events just before
+# the commit, in the same shape as the answers of the changes api, and published once the commit succeeded. Each
+# browser showing a board holds a stream that receives them from a bounded queue. The event id is the board version,
+# so a browser that reconnects with Last-Event-ID first gets what it missed from the change log.
+
+# how long a browser waits before reconnecting a closed stream
+RETRY_MS = 3000
+
+
+class Subscription:
+    # one open stream. dropped is set when the browser falls so far behind that its queue is full
+
+    def __init__(self, board_key, size):
+        self.board_key = board_key
+        self.queue = queue.Queue(size)
+        self.dropped = False
+
+
+class BoardEventHub:
+    # the streams open in this worker, by board. publishers never wait for a slow stream: one whose queue is full is
+    # dropped, and its browser reconnects and catches up from the change log
+
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, board_key):
+        subscription = Subscription(board_key, self.queue_size)
+        with self.lock:
+            self.subscribers.setdefault(board_key, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.subscribers.get(subscription.board_key, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self.subscribers.pop(subscription.board_key, None)
+
+    def has_subscribers(self, board_key):
+        return board_key in self.subscribers
+
+    def dispatch(self, board_key, version, message):
+        with self.lock:
+            subscribers = list(self.subscribers.get(board_key, ()))
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait((version, message))
+            except queue.Full:
+                subscription.dropped = True
+                self.unsubscribe(subscription)
+
+
+class LocalBroker:
+    # delivers events to the streams of this worker only, which is enough for a single (threaded) worker
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def wants(self, board_key):
+        return self.hub.has_subscribers(board_key)
+
+    def start(self):
+        pass
+
+    def publish(self, board_key, version, message):
+        self.hub.dispatch(board_key, version, message)
+
+
+class RedisBroker:
+    # fans events out to every worker through redis pub/sub. each worker listens to all boards with one pattern
+    # subscription and dispatches to its own streams. needs the optional redis package
+
+    def __init__(self, url, hub, prefix='kanban:board:'):
+        try:
+            import redis
+        except ImportError as error:
+            raise RuntimeError('EVENT_BROKER_URL is set but the redis package is not installed') from error
+        self.client = redis.Redis.from_url(url)
+        self.hub = hub
+        self.prefix = prefix
+        self.listener = None
+        self.lock = threading.Lock()
+
+    def wants(self, board_key):
+        # the streams of a board may be open in any worker
+        return True
+
+    def start(self):
+        # listen from the first stream on, so that workers nobody is connected to hold no redis subscription
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(target=self.listen, daemon=True)
+                self.listener.start()
+
+    def listen(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(f'{self.prefix}*')
+        for item in pubsub.listen():
+            version, message = json.loads(item['data'])
+            self.hub.dispatch(item['channel'].decode('utf-8')[len(self.prefix):], version, message)
+
+    def publish(self, board_key, version, message):
+        self.client.publish(f'{self.prefix}{board_key}', json.dumps([version, message]))
+
+
+def make_broker(config, hub):
+    # EVENT_BROKER_URL selects a broker shared by the workers, otherwise events stay in the worker that made them
+    if config['EVENT_BROKER_URL']:
+        return RedisBroker(config['EVENT_BROKER_URL'], hub)
+    return LocalBroker(hub)
+
+
+# the queue size and the broker are set by create_app
+board_events = BoardEventHub(0)
+broker = LocalBroker(board_events)
+
+
+def configure_events(app):
+    global broker
+    board_events.queue_size = app.config['EVENT_QUEUE_SIZE']
+    broker = make_broker(app.config, board_events)
+
+
+def event_message(version, data):
+    return f'id: {version}\ndata: {json.dumps(data)}\n\n'
+
+
+def change_event(session, board_key, version, tasks, deleted, team_changed):
+    # an event in the shape of a changes api answer
+    data = {'version': version, 'snapshot': False, 'tasks': [task_state(task) for task in tasks], 'deleted': deleted}
+    if team_changed:
+        data['team'] = {'name': session.get(Team, int(board_key.partition('-')[2])).name}
+    return event_message(version, data)
+
+
+@event.listens_for(Session, 'before_commit')
+def prepare_board_events(session):
+    # build the events of the boards someone is watching while the changed tasks can still be read in the transaction.
+    # writes made outside of a request (cli commands) are not pushed, browsers see them the next time they reconnect
+    changes = [change for change in session.info.pop('board_changes', []) if broker.wants(change[0])]
+    if not changes or not has_request_context():
+        return
+    ids_by_shard = {}
+    shards = board_shards(change[0] for change in changes)
+    for board_key, _, changed, _, _ in changes:
+        ids_by_shard.setdefault(shards[board_key], set()).update(changed)
+    # populate_existing so that tasks changed by bulk statements are not read from stale objects of the session
+    tasks = {}
+    for shard, ids in ids_by_shard.items():
+        if ids:
+            with use_shard(shard):
+                tasks.update((task.id, task) for task in session.query(Task).filter(Task.id.in_(ids)).populate_existing())
+
+    events = []
+    for board_key, version, changed, deleted, team_changed in changes:
+        message = change_event(session, board_key, version, [tasks[task_id] for task_id in changed if task_id in tasks],
+                               deleted + [task_id for task_id in changed if task_id not in tasks], team_changed)
+        events.append((board_key, version, message))
+    session.info['board_events'] = events
+
+
+@event.listens_for(Session, 'after_commit')
+def publish_board_events(session):
+    for board_key, version, message in session.info.pop('board_events', []):
+        broker.publish(board_key, version, message)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_board_events(session):
+    session.info.pop('board_changes', None)
+    session.info.pop('board_events', None)
+
+
+@bp.route('/api/boards/<board_key>/events')
+@login_required
+def board_event_stream(board_key):
+    # stream the changes of a board. a browser opening the stream with ?since=<version>, or reconnecting with a
+    # Last-Event-ID, first gets the changes it missed, or a snapshot event telling it to reload when the log is too short
+
+    get_board_or_404(board_key)
+    # subscribe before reading the version, so that nothing committed in between is missed
+    subscription = board_events.subscribe(board_key)
+    broker.start()
+    version = board_version(board_key)
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', type=int)
+
+    first = f'retry: {RETRY_MS}\n\n'
+    if since is not None and since != version:
+        changes = board_changes(board_key, since, version) if since >= 0 else None
+        if changes is None:
+            first += event_message(version, {'version': version, 'snapshot': True})
+        else:
+            first += change_event(db.session, board_key, version, *changes)
+
+    heartbeat = current_app.config['EVENT_HEARTBEAT_SECONDS']
+
+    def stream(last_version):
+        # runs after the request is over, so it only reads its queue and never touches the database
+        try:
+            yield first
+            while not subscription.dropped:
+                try:
+                    version, message = subscription.queue.get(timeout=heartbeat)
+                except queue.Empty:
+                    # keeps proxies from closing an idle stream, and finds out when the browser has gone
+                    yield ': heartbeat\n\n'
+                    continue
+                # events already covered by the catch up are skipped
+                if version > last_version:
+                    last_version = version
+                    yield message
+        finally:
+            board_events.unsubscribe(subscription)
+
+    return Response(stream(version), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
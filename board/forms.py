@@ -3,6 +3,7 @@ from wtforms import StringField, EmailField, PasswordField, SubmitField, TextAre
 from wtforms.validators import DataRequired, Length, EqualTo, ValidationError, NumberRange
 from flask_login import current_user
 from board.models import User
+from board.membership import parse_member_emails, resolve_members
 
 class RegistrationForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired(), Length(min=2, max=20)])
@@ -63,11 +64,13 @@ class TeamForm(FlaskForm):
     member_emails = StringField('Member Emails', validators=[DataRequired()])
     submit = SubmitField('Submit')
 
-    # Define custom validation method to make sure all member emails are valid
+    # Define custom validation method to make sure all member emails are valid.
+    # All the emails are resolved with one query and the users are kept in self.members for the view
 
     def validate_member_emails(self, member_emails):
-        member_emails = member_emails.data.split(',')
-        for email in member_emails:
-            user = User.query.filter_by(email=email).first()
-            if not user:
-                raise ValidationError(f'User with email {email} does not exist in the system. Please enter a valid email.')
\ No newline at end of file
+        emails = parse_member_emails(member_emails.data)
+        users = resolve_members(emails)
+        for email in emails:
+            if email not in users:
+                raise ValidationError(f'User with email {email} does not exist in the system. Please enter a valid email.')
+        self.members = [users[email] for email in emails]
\ No newline at end of file
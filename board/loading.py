@@ -0,0 +1,34 @@
+from flask import current_app, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session, configure_mappers, raiseload, selectinload
+from board.models import Team, User
+
+# Loading policy of the pages. The query of each page loads the relationships its template reads, with the options
+# below, and forbids every other relationship load, so rendering a page issues no queries of its own however many rows
+# it shows. The models keep their lazy relationships for cli commands and background jobs. With RAISE_ON_LAZY_LOAD set,
+# as in the tests, a view that still falls back on a lazy load fails instead of quietly adding a query per row.
+
+
+class UnplannedLazyLoad(Exception):
+    pass
+
+
+# sets up the backrefs, such as Team.members, that the options below refer to
+configure_mappers()
+
+# team.html lists the usernames of the members: one more query for all of them
+TEAM_PAGE = (selectinload(Team.members).load_only(User.username), raiseload('*'))
+# the task page, the task forms and the task deletion only read the columns of the task
+TASK_PAGE = (raiseload('*'),)
+# pages showing a team only read its columns: the team board, the team forms and teams.html
+TEAM_ONLY = (raiseload('*'),)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def check_lazy_load(orm_execute_state):
+    if not (has_request_context() and current_app.config['RAISE_ON_LAZY_LOAD'] and orm_execute_state.is_select):
+        return
+    state = orm_execute_state.lazy_loaded_from
+    if state is not None:
+        raise UnplannedLazyLoad(f'{request.endpoint} lazily loaded a relationship of {state.class_.__name__} '
+                                f'{state.identity}, add it to the loading policy of the view')
@@ -0,0 +1,55 @@
+from flask import abort, g
+from flask_login import current_user
+from sqlalchemy import exists
+from board import db
+from board.models import User, user_team_association
+
+
+def is_member(team_id, user=None):
+    # check that a user (the current user by default) belongs to a team with an indexed EXISTS query on the
+    # association table, instead of loading team.members. answers are remembered for the rest of the request
+    user = user or current_user
+    if not user.is_authenticated:
+        return False
+
+    memo = g.setdefault('team_memberships', {})
+    key = (user.id, team_id)
+    if key not in memo:
+        memo[key] = db.session.query(exists().where(user_team_association.c.user_id == user.id,
+                                                    user_team_association.c.team_id == team_id)).scalar()
+    return memo[key]
+
+
+def require_member(team_id):
+    if not is_member(team_id):
+        abort(403)
+
+
+def parse_member_emails(raw):
+    # split a comma separated list of emails, dropping blanks and repeated emails while keeping the order
+    emails = []
+    for email in raw.split(','):
+        email = email.strip()
+        if email and email not in emails:
+            emails.append(email)
+    return emails
+
+
+def resolve_members(emails):
+    # look up every user of a list of emails with one IN query on the unique email index
+    if not emails:
+        return {}
+    return {user.email: user for user in User.query.filter(User.email.in_(emails))}
+
+
+def add_members(team_id, user_ids):
+    # add users to a team with one bulk insert, skipping the users that are already members
+    user_ids = set(user_ids)
+    existing = {user_id for (user_id,) in db.session.query(user_team_association.c.user_id)
+                .filter(user_team_association.c.team_id == team_id, user_team_association.c.user_id.in_(user_ids))}
+    new_ids = user_ids - existing
+    if new_ids:
+        db.session.execute(user_team_association.insert(), [{'user_id': user_id, 'team_id': team_id} for user_id in sorted(new_ids)])
+        # memberships checked earlier in this request may have changed
+        g.pop('team_memberships', None)
+    return new_ids
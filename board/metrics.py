@@ -0,0 +1,142 @@
+import bisect
+import hmac
+import threading
+import time
+from flask import Response, abort, current_app, g, has_request_context, request
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from board import bp, passwords
+from board.sessions import user_cache
+
+# Per request SQL instrumentation. Every statement run during a request is counted and timed, the totals are sent back
+# in a Server-Timing header, statements slower than SLOW_QUERY_MS are logged with their route, and per endpoint
+# histograms are served in the Prometheus text format at /admin/metrics.
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    # cumulative histogram with fixed bucket bounds, one series per endpoint
+
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, endpoint, value):
+        with self.lock:
+            counts, total = self.series.get(endpoint, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.series[endpoint] = (counts, total + value)
+
+    def reset(self):
+        with self.lock:
+            self.series.clear()
+
+    def exposition(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            series = sorted(self.series.items())
+        for endpoint, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{endpoint="{endpoint}"}} {total}')
+            lines.append(f'{self.name}_count{{endpoint="{endpoint}"}} {cumulative}')
+        return lines
+
+
+request_duration = Histogram('kanban_request_duration_seconds', 'Time spent handling a request.', DURATION_BUCKETS)
+request_db_time = Histogram('kanban_request_db_seconds', 'Time spent in database statements per request.', DURATION_BUCKETS)
+request_queries = Histogram('kanban_request_queries', 'Number of database statements per request.', QUERY_BUCKETS)
+HISTOGRAMS = (request_duration, request_db_time, request_queries)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['query_start'].pop()
+    if not has_request_context() or 'sql_queries' not in g:
+        return
+    g.sql_queries += 1
+    g.sql_time += duration
+    if duration * 1000 >= current_app.config['SLOW_QUERY_MS']:
+        current_app.logger.warning('Slow query (%.1f ms) on %s %s: %s', duration * 1000, request.method, request.url_rule or request.path, statement)
+
+
+@bp.before_app_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.sql_queries = 0
+    g.sql_time = 0.0
+
+
+@bp.after_app_request
+def record_request(response):
+    if 'request_start' not in g:
+        return response
+    duration = time.perf_counter() - g.request_start
+    response.headers.add('Server-Timing', f'db;dur={g.sql_time * 1000:.1f};desc="{g.sql_queries} queries"')
+    response.headers.add('Server-Timing', f'app;dur={duration * 1000:.1f}')
+
+    endpoint = request.endpoint or 'unmatched'
+    request_duration.observe(endpoint, duration)
+    request_db_time.observe(endpoint, g.sql_time)
+    request_queries.observe(endpoint, g.sql_queries)
+    return response
+
+
+def can_read_metrics():
+    # admins are logged in users listed in ADMIN_EMAILS. scrapers can instead send "Authorization: Bearer <METRICS_TOKEN>"
+    token = current_app.config['METRICS_TOKEN']
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    return current_user.is_authenticated and current_user.email in current_app.config['ADMIN_EMAILS']
+
+
+@bp.route('/admin/metrics')
+def metrics():
+    # per endpoint request histograms in the prometheus text format
+
+    if not can_read_metrics():
+        abort(403)
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.exposition())
+    stats = user_cache.stats()
+    lines += ['# HELP kanban_user_cache_hits_total Requests whose user was found in the user cache.',
+              '# TYPE kanban_user_cache_hits_total counter',
+              f'kanban_user_cache_hits_total {stats["hits"]}',
+              '# HELP kanban_user_cache_misses_total Requests whose user had to be loaded from the database.',
+              '# TYPE kanban_user_cache_misses_total counter',
+              f'kanban_user_cache_misses_total {stats["misses"]}']
+    stats = passwords.stats()
+    lines += ['# HELP kanban_password_operations_total Password hashes and checks run by the password pool.',
+              '# TYPE kanban_password_operations_total counter',
+              f'kanban_password_operations_total{{operation="hash"}} {stats["hash"]}',
+              f'kanban_password_operations_total{{operation="check"}} {stats["check"]}',
+              '# HELP kanban_password_seconds_total Time spent hashing and checking passwords.',
+              '# TYPE kanban_password_seconds_total counter',
+              f'kanban_password_seconds_total {stats["seconds"]}',
+              '# HELP kanban_password_rehashes_total Stored hashes upgraded to the current cost at login.',
+              '# TYPE kanban_password_rehashes_total counter',
+              f'kanban_password_rehashes_total {stats["rehash"]}',
+              '# HELP kanban_password_rejected_total Requests turned away because the password pool was full.',
+              '# TYPE kanban_password_rejected_total counter',
+              f'kanban_password_rejected_total {stats["rejected"]}',
+              '# HELP kanban_password_in_flight Password operations running or waiting for a worker.',
+              '# TYPE kanban_password_in_flight gauge',
+              f'kanban_password_in_flight {stats["in_flight"]}',
+              '# HELP kanban_password_rounds The bcrypt cost of new hashes.',
+              '# TYPE kanban_password_rounds gauge',
+              f'kanban_password_rounds {stats["rounds"]}']
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,172 @@
+from sqlalchemy import func, inspect, select
+from sqlalchemy.schema import CreateTable
+from board import bp, db
+from board.boards import task_board_key
+from board.models import ArchivedTask, Task, Team, User, user_team_association
+from board.ranks import set_ranks
+from board.search import create_search_index
+from board.shards import create_shards, each_shard, shard_engine
+from board.stats import create_board_counters
+
+# schema upgrades for databases that were created before a model change. db.create_all() only creates missing tables,
+# so existing kanban.db files are brought up to date with `flask upgrade-db`. every step is idempotent and safe to re-run.
+# the steps run on the home database and on every shard, which only holds the task tables (see board/shards.py)
+
+MIGRATIONS = []
+
+
+def migration(func):
+    MIGRATIONS.append(func)
+    return func
+
+
+@migration
+def add_task_date_done(connection):
+    # the archive ages Done tasks by date_done. tasks that were already Done count from their creation.
+    # runs before the index step, which indexes the new column
+    if 'date_done' in {column['name'] for column in inspect(connection).get_columns('task')}:
+        return
+    connection.exec_driver_sql('ALTER TABLE task ADD COLUMN date_done DATETIME')
+    connection.exec_driver_sql("UPDATE task SET date_done = date_created WHERE status = 'Done'")
+
+
+@migration
+def add_task_rank(connection):
+    # cards start out in the order they were shown in before they could be moved, by priority and due date.
+    # runs before the index step, which indexes the new column
+    if 'rank' in {column['name'] for column in inspect(connection).get_columns('task')}:
+        return
+    connection.exec_driver_sql("ALTER TABLE task ADD COLUMN rank VARCHAR(64) NOT NULL DEFAULT ''")
+    rows = connection.execute(select(Task.id, Task.user_id, Task.team_id, Task.status)
+                              .order_by(Task.priority.desc(), Task.due_date, Task.id))
+    columns = {}
+    for row in rows:
+        columns.setdefault((task_board_key(row), row.status), []).append(row.id)
+    for ids in columns.values():
+        set_ranks(connection, ids)
+
+
+@migration
+def create_task_board_indexes(connection):
+    # composite indexes used by the single-query board loader, and the indexes of the archive job and the reminders.
+    # the board indexes on priority and due date were replaced by the rank indexes
+    for name in ('ix_task_team_board', 'ix_task_user_board'):
+        connection.exec_driver_sql(f'DROP INDEX IF EXISTS {name}')
+    for index in Task.__table__.indexes:
+        index.create(connection, checkfirst=True)
+
+
+@migration
+def key_user_team_association(connection):
+    # older databases have no primary key on the association table and may hold duplicate memberships.
+    # sqlite cannot add a primary key to an existing table, so the table is rebuilt with the duplicates removed
+    if not inspect(connection).has_table('user_team_association'):
+        return
+    if inspect(connection).get_pk_constraint('user_team_association')['constrained_columns']:
+        return
+    connection.exec_driver_sql('ALTER TABLE user_team_association RENAME TO user_team_association_old')
+    user_team_association.create(connection)
+    connection.exec_driver_sql('INSERT INTO user_team_association (user_id, team_id) '
+                               'SELECT DISTINCT user_id, team_id FROM user_team_association_old '
+                               'WHERE user_id IS NOT NULL AND team_id IS NOT NULL')
+    connection.exec_driver_sql('DROP TABLE user_team_association_old')
+
+
+@migration
+def create_task_search_index(connection):
+    # full-text index over task titles and descriptions, filled with the existing tasks
+    create_search_index(connection)
+
+
+@migration
+def create_task_board_counters(connection):
+    # per-board column and overdue counters, filled from the existing tasks
+    create_board_counters(connection)
+
+
+@migration
+def add_team_shard(connection):
+    # teams created before sharding keep their tasks in the home database until `flask rebalance-shards` moves them
+    if not inspect(connection).has_table('team'):
+        return
+    if 'shard' in {column['name'] for column in inspect(connection).get_columns('team')}:
+        return
+    connection.exec_driver_sql('ALTER TABLE team ADD COLUMN shard INTEGER NOT NULL DEFAULT 0')
+
+
+def rebuild_with_autoincrement(connection, table, last_id=0):
+    # sqlite only takes AUTOINCREMENT when a table is created, so the table is copied into a new one with the same
+    # columns, indexes and triggers. ids are then never handed out twice, and the first new one is above last_id
+    if connection.dialect.name != 'sqlite' or not inspect(connection).has_table(table.name):
+        return
+    sql = connection.exec_driver_sql("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table.name,)).scalar()
+    if 'AUTOINCREMENT' in sql.upper():
+        return
+    name = connection.dialect.identifier_preparer.quote(table.name)
+    columns = ', '.join(f'"{column["name"]}"' for column in inspect(connection).get_columns(table.name))
+    triggers = connection.exec_driver_sql("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ?",
+                                          (table.name,)).scalars().all()
+    create = str(CreateTable(table).compile(dialect=connection.dialect))
+    connection.exec_driver_sql(create.replace(f'CREATE TABLE {name} ', f'CREATE TABLE {table.name}_new ', 1))
+    connection.exec_driver_sql(f'INSERT INTO {table.name}_new ({columns}) SELECT {columns} FROM {name}')
+    connection.exec_driver_sql(f'DROP TABLE {name}')
+    connection.exec_driver_sql(f'ALTER TABLE {table.name}_new RENAME TO {name}')
+    for index in table.indexes:
+        index.create(connection, checkfirst=True)
+    for trigger in triggers:
+        connection.exec_driver_sql(trigger)
+    connection.exec_driver_sql('UPDATE sqlite_sequence SET seq = ? WHERE name = ? AND seq < ?', (last_id, table.name, last_id))
+    connection.exec_driver_sql('INSERT INTO sqlite_sequence (name, seq) SELECT ?, ? '
+                               'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)', (table.name, last_id, table.name))
+
+
+def highest(connection, *columns):
+    return max((connection.scalar(select(func.max(column))) or 0) for column in columns)
+
+
+@migration
+def autoincrement_user_and_team(connection):
+    # a deleted account or team keeps its tasks until the purge is done, so its id must not go to a new one.
+    # runs after the steps adding columns, which the copy needs. ids still found on tasks are not handed out again
+    if not inspect(connection).has_table('user'):
+        return
+    rebuild_with_autoincrement(connection, User.__table__,
+                               highest(connection, Task.__table__.c.user_id, ArchivedTask.__table__.c.user_id))
+    rebuild_with_autoincrement(connection, Team.__table__,
+                               highest(connection, Task.__table__.c.team_id, ArchivedTask.__table__.c.team_id))
+
+
+@migration
+def autoincrement_task(connection):
+    # archived tasks keep their id and get it back when restored, so no new task may take it in the meantime.
+    # shards are created with AUTOINCREMENT and are left as they are
+    rebuild_with_autoincrement(connection, Task.__table__,
+                               highest(connection, Task.__table__.c.id, ArchivedTask.__table__.c.id))
+
+
+@migration
+def collate_task_rank(connection):
+    # ranks compare byte by byte (see board/ranks.py). a postgresql database created with a locale collation would sort
+    # 'a' before 'V', so the column and the indexes on it are switched to the C collation. sqlite compares bytes anyway
+    if connection.dialect.name != 'postgresql':
+        return
+    collation = connection.exec_driver_sql("SELECT collation_name FROM information_schema.columns "
+                                           "WHERE table_name = 'task' AND column_name = 'rank'").scalar()
+    if collation != 'C':
+        connection.exec_driver_sql('ALTER TABLE task ALTER COLUMN rank TYPE VARCHAR(64) COLLATE "C"')
+
+
+def upgrade():
+    db.create_all()
+    create_shards()
+    for shard in each_shard():
+        with shard_engine(shard).begin() as connection:
+            for step in MIGRATIONS:
+                step(connection)
+
+
+@bp.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Create missing tables and apply schema upgrades to an existing database."""
+    upgrade()
+    print(f'Applied {len(MIGRATIONS)} migration steps.')
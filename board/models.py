@@ -1,18 +1,17 @@
-from board import db, login_manager
+from board import db
 from flask_login import UserMixin
 from datetime import datetime
 
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
-
-# Define the association table for the many-to-many relationship between users and teams
+# Define the association table for the many-to-many relationship between users and teams.
+# The composite primary key makes memberships unique and serves "is this user in this team" lookups, the team_id index serves member listings
 user_team_association = db.Table('user_team_association',
-        db.Column('user_id', db.Integer, db.ForeignKey('user.id')),
-        db.Column('team_id', db.Integer, db.ForeignKey('team.id'))
+        db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
+        db.Column('team_id', db.Integer, db.ForeignKey('team.id'), primary_key=True, index=True)
 )
 
 class User(db.Model, UserMixin):
+    # ids are never reused, so tasks of a deleted account that are still being purged never show up for a new one
+    __table_args__ = {'sqlite_autoincrement': True}
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(50), unique=True, nullable=False)
     email = db.Column(db.String(200), unique=True, nullable=False)
@@ -28,6 +27,8 @@ class User(db.Model, UserMixin):
 
     
 class Task(db.Model):
+    # ids are never reused. each shard hands out ids from its own range, so the id of a task tells its shard (see board/shards.py)
+    __table_args__ = {'sqlite_autoincrement': True}
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     description = db.Column(db.String(500), nullable=False)
@@ -37,18 +38,137 @@ class Task(db.Model):
     status = db.Column(db.Enum('To Do', 'In Progress', 'Done', name='task_status'))
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     team_id = db.Column(db.Integer, db.ForeignKey('team.id'))
+    # when the task was last moved to Done. Done tasks are moved to the archive some time after this (see board/archive.py)
+    date_done = db.Column(db.DateTime)
+    # position of the card in its column, compared as a string. set when the task is created or moved (see board/ranks.py).
+    # ranks must compare byte by byte, which sqlite does by default and a database server does with the C collation
+    rank = db.Column(db.String(64).with_variant(db.String(64, collation='C'), 'postgresql'), nullable=False)
 
 
     def __repr__(self):
         return f"Task('{self.id}', '{self.title}')"
+
+# Composite indexes matching the board ordering (status, rank) so a whole board is read with one index range scan.
+# The first serves team boards, the second personal boards, which filter on user_id and team_id IS NULL.
+db.Index('ix_task_team_rank', Task.team_id, Task.status, Task.rank)
+db.Index('ix_task_user_rank', Task.user_id, Task.team_id, Task.status, Task.rank)
+# Finds the Done tasks due for the archive without scanning the other columns.
+db.Index('ix_task_done', Task.status, Task.date_done)
+# Finds the open tasks coming due in the next window of the reminder scheduler (see board/reminders.py).
+db.Index('ix_task_due', Task.status, Task.due_date)
     
 class Team(db.Model):
+    # ids are never reused, like the ids of users
+    __table_args__ = {'sqlite_autoincrement': True}
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     date_created = db.Column(db.DateTime, default=datetime.utcnow)
+    # the shard database holding the tasks of the team, 0 for the home database. new teams are placed by board/shards.py
+    shard = db.Column(db.Integer, nullable=False, default=0)
     tasks = db.relationship('Task', backref='team', lazy=True)
 
 
 
     def __repr__(self):
-        return f"Team('{self.id}', '{self.name}')"
\ No newline at end of file
+        return f"Team('{self.id}', '{self.name}')"
+
+class ArchivedTask(db.Model):
+    # Done tasks moved out of the task table once they are old, so that board queries only read live tasks.
+    # A task keeps its id in the archive and when it is restored.
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    title = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.String(500), nullable=False)
+    date_created = db.Column(db.DateTime)
+    due_date = db.Column(db.DateTime, nullable=False)
+    priority = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20))
+    user_id = db.Column(db.Integer)
+    team_id = db.Column(db.Integer)
+    date_done = db.Column(db.DateTime)
+    date_archived = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"ArchivedTask('{self.id}', '{self.title}')"
+
+# The archive pages list the tasks of a board newest first, a page at a time.
+db.Index('ix_archived_task_team', ArchivedTask.team_id, ArchivedTask.id)
+db.Index('ix_archived_task_user', ArchivedTask.user_id, ArchivedTask.team_id, ArchivedTask.id)
+
+class BoardVersion(db.Model):
+    # Counter bumped in the same transaction as every write that changes what a board page shows.
+    # Rendered boards are cached and tagged by (board_key, version), so an unchanged version means an unchanged page.
+    board_key = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"BoardVersion('{self.board_key}', '{self.version}')"
+
+class BoardChange(db.Model):
+    # Append-only log of the changes made to each board, written in the same transaction as the change.
+    # version is the board version the change produced, so a client at version v needs the rows with a greater version.
+    # op is 'task' for a created or updated task, 'delete' for a deleted one and 'team' for a change of the team itself
+    id = db.Column(db.Integer, primary_key=True)
+    board_key = db.Column(db.String(50), nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)
+    task_id = db.Column(db.Integer)
+    date_created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f"BoardChange('{self.board_key}', '{self.version}', '{self.op}', '{self.task_id}')"
+
+db.Index('ix_board_change_board', BoardChange.board_key, BoardChange.version)
+
+class BoardCount(db.Model):
+    # Number of tasks per board and column, kept up to date by triggers on the task table (see board/stats.py).
+    board_key = db.Column(db.String(50), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"BoardCount('{self.board_key}', '{self.status}', '{self.count}')"
+
+class BoardDueCount(db.Model):
+    # Number of open (not Done) tasks per board and due day. Summing the days before today gives the overdue tasks
+    # of a board without reading the task table, and the rows for past days stay valid as time goes by.
+    board_key = db.Column(db.String(50), primary_key=True)
+    due_day = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"BoardDueCount('{self.board_key}', '{self.due_day}', '{self.count}')"
+
+class MovedTask(db.Model):
+    # Tasks get a new id when their team is moved to another shard. The old id is kept here so that links to it still work.
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    new_id = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f"MovedTask('{self.id}', '{self.new_id}')"
+
+
+class Reminder(db.Model):
+    # Outbox of the due date reminders, written by the reminder scheduler (see board/reminders.py) in the transaction
+    # that records them as sent. Whatever delivers them to people reads the rows without a date_sent and stamps it.
+    # kind is 'due soon' before the due day ends and 'overdue' once it has ended
+    id = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.Integer, nullable=False)
+    board_key = db.Column(db.String(50), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    title = db.Column(db.String(100), nullable=False)
+    due_date = db.Column(db.DateTime, nullable=False)
+    date_created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    date_sent = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f"Reminder('{self.task_id}', '{self.kind}')"
+
+db.Index('ix_reminder_unsent', Reminder.date_sent, Reminder.id)
+
+class ReminderState(db.Model):
+    # How far the reminder scheduler got in each shard: every reminder due up to fired_until has been sent.
+    shard = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    fired_until = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"ReminderState('{self.shard}', '{self.fired_until}')"
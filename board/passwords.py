@@ -0,0 +1,122 @@
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt as pybcrypt
+
+# Password hashing settings and the pool that runs the hashing. bcrypt is slow on purpose, so hashes run on a fixed number
+# of worker threads (the bcrypt extension releases the GIL while hashing) with a bounded number of waiting requests.
+# A login burst then uses at most PASSWORD_HASH_WORKERS cores, requests past the queue limit are turned away at once
+# with 503, and board requests keep being served. The cost is BCRYPT_ROUNDS, or else the highest cost whose hash
+# takes at most BCRYPT_TARGET_MS on this machine, measured at startup.
+
+# cost used to time this machine. every extra round doubles the work of a hash
+CALIBRATION_ROUNDS = 8
+
+
+class PasswordHasherBusy(Exception):
+    # raised instead of queueing when every worker is busy and the queue is full
+    pass
+
+
+def calibrate_rounds(target_ms, min_rounds):
+    # the highest cost whose hash takes at most target_ms, but never less than min_rounds
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        pybcrypt.hashpw(b'calibration', pybcrypt.gensalt(CALIBRATION_ROUNDS))
+        timings.append(time.perf_counter() - start)
+    per_hash_ms = sorted(timings)[1] * 1000
+    rounds = CALIBRATION_ROUNDS + math.floor(math.log2(target_ms / per_hash_ms))
+    return max(min_rounds, min(rounds, 31))
+
+
+def hash_rounds(hashed):
+    # the cost a bcrypt hash ($2b$<rounds>$<salt and hash>) was made with, or None if it is not a bcrypt hash
+    parts = hashed.split('$')
+    if len(parts) != 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+def configure_passwords(app, environ=None):
+    # call before the Bcrypt extension is initialized, it reads its cost from BCRYPT_LOG_ROUNDS. settings already in the
+    # config of the app are kept
+    environ = os.environ if environ is None else environ
+    if 'BCRYPT_LOG_ROUNDS' not in app.config:
+        if environ.get('BCRYPT_ROUNDS'):
+            rounds = int(environ['BCRYPT_ROUNDS'])
+        else:
+            rounds = calibrate_rounds(float(environ.get('BCRYPT_TARGET_MS', 250)), int(environ.get('BCRYPT_MIN_ROUNDS', 10)))
+        app.config['BCRYPT_LOG_ROUNDS'] = rounds
+    app.config.setdefault('PASSWORD_HASH_WORKERS', int(environ.get('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2))))
+    app.config.setdefault('PASSWORD_HASH_QUEUE', int(environ.get('PASSWORD_HASH_QUEUE', 32)))
+
+
+class PasswordHasher:
+    # hashes and checks passwords on a bounded thread pool. counts what it did so login throughput can be measured
+
+    def __init__(self, bcrypt, rounds=None, workers=1, queue_size=0):
+        self.bcrypt = bcrypt
+        self.executor = None
+        self.lock = threading.Lock()
+        self.counts = {'hash': 0, 'check': 0, 'rehash': 0, 'rejected': 0}
+        self.in_flight = 0
+        self.seconds = 0.0
+        self.configure(rounds, workers, queue_size)
+
+    def configure(self, rounds, workers, queue_size):
+        # set the cost and size the pool, create_app calls this once the settings are known
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        self.rounds = rounds
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='password-hash')
+        # one slot per running or waiting hash
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def run(self, operation, func, *args):
+        if not self.slots.acquire(blocking=False):
+            self.count('rejected')
+            raise PasswordHasherBusy()
+        with self.lock:
+            self.in_flight += 1
+        try:
+            return self.executor.submit(self.timed, operation, func, *args).result()
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+            self.slots.release()
+
+    def timed(self, operation, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            duration = time.perf_counter() - start
+            with self.lock:
+                self.counts[operation] += 1
+                self.seconds += duration
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def hash(self, password):
+        return self.run('hash', self.bcrypt.generate_password_hash, password, self.rounds).decode('utf-8')
+
+    def check(self, hashed, password):
+        return self.run('check', self.bcrypt.check_password_hash, hashed, password)
+
+    def needs_rehash(self, hashed):
+        # hashes made at a lower cost than the current one are upgraded when their user logs in
+        rounds = hash_rounds(hashed)
+        return rounds is not None and rounds < self.rounds
+
+    def rehash(self, password):
+        self.count('rehash')
+        return self.hash(password)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts, in_flight=self.in_flight, seconds=self.seconds, rounds=self.rounds)
@@ -0,0 +1,159 @@
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask import current_app
+from sqlalchemy import bindparam, event, func, inspect, select, update
+from sqlalchemy.orm import Session, object_session
+from board import bp, db
+from board.boards import STATUSES, task_board_key
+from board.changes import log_board_change
+from board.models import Task
+from board.shards import board_shard, use_shard
+
+# Manual order of the cards in a column. Every task has a rank, a string of base 62 digits read as a fraction, and a
+# column lists its cards by rank. Moving a card gives it a rank between the ranks of its new neighbours, a single-row
+# update whatever the size of the column. Ranks get longer as cards are squeezed into the same gap, so a column holding
+# a rank longer than RANK_REBALANCE_LENGTH is given fresh, evenly spaced ranks on a background thread after the commit.
+
+# digits in ascii order, so comparing ranks as strings compares the fractions they stand for. the rank column uses a
+# byte order collation for that, a locale one would put 'a' before 'V'
+DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+# one background thread, rebalancing is rare and writes a whole column
+rebalance_worker = ThreadPoolExecutor(1, thread_name_prefix='rebalance')
+
+
+def rank_between(before, after):
+    # a rank that sorts after before and ahead of after. before is '' for the top of a column, after is None for the
+    # bottom. ranks never end in '0', so there is always room between two of them
+    if after is not None and before >= after:
+        raise ValueError(f'No rank between {before!r} and {after!r}')
+    if after is not None:
+        shared = 0
+        while shared < len(after) and (before[shared] if shared < len(before) else '0') == after[shared]:
+            shared += 1
+        if shared:
+            return after[:shared] + rank_between(before[shared:], after[shared:])
+    low = DIGITS.index(before[0]) if before else 0
+    high = DIGITS.index(after[0]) if after is not None else len(DIGITS)
+    if high - low > 1:
+        return DIGITS[(low + high) // 2]
+    if after is not None and len(after) > 1:
+        return after[0]
+    return DIGITS[low] + rank_between(before[1:], None)
+
+
+def ranks_between(before, after, count):
+    # count ranks in order between before and after, spread out so that the gaps stay wide
+    if count == 0:
+        return []
+    middle = rank_between(before, after)
+    half = count // 2
+    return ranks_between(before, middle, half) + [middle] + ranks_between(middle, after, count - half - 1)
+
+
+def spread_ranks(count):
+    # count evenly spaced ranks of at most the same length, leaving gaps of at least len(DIGITS) between them
+    width = 1
+    while len(DIGITS) ** width < (count + 1) * len(DIGITS):
+        width += 1
+    step = len(DIGITS) ** width // (count + 1)
+    ranks = []
+    for position in range(1, count + 1):
+        value, digits = position * step, []
+        for _ in range(width):
+            value, digit = divmod(value, len(DIGITS))
+            digits.append(DIGITS[digit])
+        ranks.append(''.join(reversed(digits)).rstrip('0'))
+    return ranks
+
+
+def column_condition(board_key, status):
+    # the tasks of one column of a board, as selected by board_query. served by the (board, status, rank) indexes
+    kind, _, owner_id = board_key.partition('-')
+    if kind == 'team':
+        return (Task.team_id == int(owner_id)) & (Task.status == status)
+    return (Task.user_id == int(owner_id)) & Task.team_id.is_(None) & (Task.status == status)
+
+
+def first_rank(connection, board_key, status):
+    # the rank of the top card of a column, or None for an empty column. connection is a session or a connection
+    return connection.scalar(select(func.min(Task.rank)).where(column_condition(board_key, status)))
+
+
+def top_ranks(connection, board_key, status, count):
+    # ranks for count cards put on top of a column, in order
+    with use_shard(board_shard(board_key)):
+        return ranks_between('', first_rank(connection, board_key, status), count)
+
+
+def set_ranks(connection, ids):
+    # give the tasks fresh ranks in the order of ids with one executemany statement
+    table = Task.__table__
+    statement = update(table).where(table.c.id == bindparam('task_id')).values(rank=bindparam('new_rank'))
+    rows = [{'task_id': task_id, 'new_rank': rank} for task_id, rank in zip(ids, spread_ranks(len(ids)))]
+    if rows:
+        connection.execute(statement, rows)
+
+
+def check_rank(session, board_key, status, rank):
+    # rebalance the column after the commit when a rank grew too long
+    if len(rank) > current_app.config['RANK_REBALANCE_LENGTH']:
+        session.info.setdefault('rank_rebalance', set()).add((board_key, status))
+
+
+@event.listens_for(Task, 'before_insert')
+@event.listens_for(Task, 'before_update')
+def place_task(mapper, connection, task):
+    # tasks created or moved to another column through the orm go on top of the column, unless they were given a rank
+    state = inspect(task)
+    if task.rank is not None:
+        if state.attrs.rank.history.has_changes():
+            return
+        if not any(state.attrs[name].history.has_changes() for name in ('status', 'user_id', 'team_id')):
+            return
+    key = task_board_key(task)
+    task.rank = rank_between('', first_rank(connection, key, task.status))
+    check_rank(object_session(task), key, task.status, task.rank)
+
+
+def rebalance_column(board_key, status):
+    # give every card of a column a fresh rank, keeping their order. the cards are sent to open boards with new ranks
+    with use_shard(board_shard(board_key)):
+        ids = db.session.scalars(select(Task.id).where(column_condition(board_key, status)).order_by(Task.rank, Task.id)).all()
+        set_ranks(db.session, ids)
+        log_board_change(board_key, changed=ids)
+        db.session.commit()
+    return len(ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def schedule_rebalance(session):
+    columns = session.info.pop('rank_rebalance', None)
+    if not columns:
+        return
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            for board_key, status in columns:
+                try:
+                    rebalance_column(board_key, status)
+                except Exception:
+                    # long ranks still sort correctly, the column is rebalanced on a later move
+                    db.session.rollback()
+                    app.logger.exception('Rebalancing %s %s failed', board_key, status)
+
+    rebalance_worker.submit(run)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_rebalance(session):
+    session.info.pop('rank_rebalance', None)
+
+
+@bp.cli.command('rebalance-ranks')
+@click.argument('board_key')
+def rebalance_ranks_command(board_key):
+    """Give the cards of every column of a board fresh, evenly spaced ranks."""
+    moved = sum(rebalance_column(board_key, status) for status in STATUSES)
+    print(f'Rebalanced {moved} tasks.')
@@ -0,0 +1,220 @@
+import heapq
+import json
+import time
+import urllib.request
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from sqlalchemy import func, select
+from board import bp, db
+from board.boards import task_board_key
+from board.models import BoardChange, Reminder, ReminderState, Task
+from board.shards import each_shard, shard_count, use_shard
+
+# Due date reminders. A task gets a 'due soon' reminder REMINDER_LEAD_HOURS before its due day ends and an 'overdue'
+# one when it has ended, as long as it is open. `flask send-reminders` keeps, per shard, a heap of the reminders due in
+# the next REMINDER_WINDOW_MINUTES, loaded with one range scan of the (status, due_date) index, and sends them as they
+# come due. Between windows it follows the change log (see board/changes.py) to add the tasks created or given a new
+# due date since, and checks every reminder against its task just before sending it, so a task that was done, deleted
+# or rescheduled in the meantime is skipped. The work is proportional to the tasks coming due and the tasks changed,
+# never to the size of the task table. Reminders go to a sink in batches, by default to the reminder table; a batch
+# that failed is sent again, and a batch that was sent but not yet recorded may be sent again after a crash.
+
+OPEN_STATUSES = ('To Do', 'In Progress')
+DUE_SOON = 'due soon'
+OVERDUE = 'overdue'
+
+
+def day_start(moment):
+    return datetime.combine(moment.date(), datetime.min.time())
+
+
+def deadline(due_date):
+    # a task becomes overdue when its utc due day has passed, as on the board headers (see board/stats.py)
+    return day_start(due_date) + timedelta(days=1)
+
+
+class OutboxSink:
+    # adds the reminders to the reminder table, committed in the transaction that records how far the scheduler got
+
+    def send(self, reminders):
+        db.session.execute(Reminder.__table__.insert(), reminders)
+
+
+class WebhookSink:
+    # posts each batch as json to REMINDER_WEBHOOK_URL. an error or a non 2xx answer fails the batch, which is sent again
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, reminders):
+        body = json.dumps({'reminders': [dict(reminder, due_date=reminder['due_date'].strftime('%Y-%m-%d'))
+                                         for reminder in reminders]}).encode('utf-8')
+        request = urllib.request.Request(self.url, data=body, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+def make_sink(config):
+    # REMINDER_WEBHOOK_URL sends the reminders to another service, otherwise they are kept in the reminder table
+    if config['REMINDER_WEBHOOK_URL']:
+        return WebhookSink(config['REMINDER_WEBHOOK_URL'])
+    return OutboxSink()
+
+
+class ShardSchedule:
+    # the reminders of one shard due after fired_until and up to horizon, as (time, task id, kind, due date) in a heap.
+    # change_id and task_id are the last change log row and task id seen, the next refresh reads what came after them
+
+    def __init__(self, shard, fired_until):
+        self.shard = shard
+        self.fired_until = fired_until
+        self.horizon = fired_until
+        self.heap = []
+        self.queued = set()
+        self.change_id = 0
+        self.task_id = 0
+
+
+class ReminderScheduler:
+    def __init__(self, sink, lead, window, batch_size):
+        self.sink = sink
+        self.lead = lead
+        self.window = window
+        self.batch_size = batch_size
+        self.schedules = []
+
+    def start(self, now):
+        # pick up after the last reminder recorded as sent, or at now on the first run, and load the first window of
+        # every shard
+        states = {state.shard: state for state in db.session.scalars(select(ReminderState))}
+        for shard in range(shard_count() + 1):
+            if shard not in states:
+                states[shard] = ReminderState(shard=shard, fired_until=now)
+                db.session.add(states[shard])
+            schedule = ShardSchedule(shard, states[shard].fired_until)
+            with use_shard(shard):
+                # read before the window, so that what changes while it loads is seen again by the next refresh
+                schedule.change_id, schedule.task_id = self.latest_ids()
+                self.load(schedule, now + self.window)
+            self.schedules.append(schedule)
+        db.session.commit()
+
+    def tick(self, now):
+        # bring every shard up to date and send the reminders due by now. returns the number sent
+        sent = 0
+        for shard in each_shard():
+            schedule = self.schedules[shard]
+            self.refresh(schedule)
+            if schedule.horizon <= now:
+                self.load(schedule, now + self.window)
+            sent += self.fire(schedule, now)
+        db.session.commit()
+        return sent
+
+    def reminders_of(self, task):
+        yield deadline(task.due_date) - self.lead, DUE_SOON
+        yield deadline(task.due_date), OVERDUE
+
+    def push(self, schedule, tasks, start):
+        for task in tasks:
+            for when, kind in self.reminders_of(task):
+                entry = (when, task.id, kind, task.due_date)
+                if start < when <= schedule.horizon and entry not in schedule.queued:
+                    heapq.heappush(schedule.heap, entry)
+                    schedule.queued.add(entry)
+
+    def open_tasks(self, *conditions):
+        return db.session.execute(select(Task.id, Task.due_date)
+                                  .where(Task.status.in_(OPEN_STATUSES), *conditions)).all()
+
+    def load(self, schedule, until):
+        # the reminders due after the horizon and up to until, read with one range scan of ix_task_due
+        start, schedule.horizon = schedule.horizon, until
+        tasks = self.open_tasks(Task.due_date >= day_start(start), Task.due_date < day_start(until + self.lead))
+        self.push(schedule, tasks, start)
+
+    def latest_ids(self):
+        latest_change = db.session.scalar(select(func.max(BoardChange.id))) or 0
+        return latest_change, db.session.scalar(select(func.max(Task.id))) or 0
+
+    def refresh(self, schedule):
+        # add the reminders of the tasks changed since the last refresh, and of tasks with new ids, which were created
+        # or moved in from another shard. reminders of a time the scheduler has already gone past are not sent
+        latest_change, latest_task = self.latest_ids()
+        if latest_change < schedule.change_id:
+            # the change log was compacted down to nothing and its ids started over
+            schedule.change_id = 0
+        changed = db.session.scalars(select(BoardChange.task_id).where(
+            BoardChange.id > schedule.change_id, BoardChange.id <= latest_change, BoardChange.op == 'task')).all()
+        if changed or latest_task > schedule.task_id:
+            tasks = self.open_tasks(Task.id.in_(set(changed)) | (Task.id > schedule.task_id),
+                                    Task.due_date < day_start(schedule.horizon + self.lead))
+            self.push(schedule, tasks, schedule.fired_until)
+        schedule.change_id, schedule.task_id = latest_change, latest_task
+
+    def check(self, batch, now):
+        # the reminders of the batch whose task is still open with the same due date
+        rows = db.session.execute(select(Task.id, Task.title, Task.due_date, Task.status, Task.user_id, Task.team_id)
+                                  .where(Task.id.in_({entry[1] for entry in batch}))).all()
+        tasks = {row.id: row for row in rows}
+        reminders = []
+        for when, task_id, kind, due_date in batch:
+            task = tasks.get(task_id)
+            if task is None or task.status not in OPEN_STATUSES or task.due_date != due_date:
+                continue
+            if kind == DUE_SOON and deadline(due_date) <= now:
+                # sent late, e.g. after the scheduler was stopped: the overdue reminder says more
+                continue
+            reminders.append({'task_id': task_id, 'board_key': task_board_key(task), 'kind': kind,
+                              'title': task.title, 'due_date': due_date})
+        return reminders
+
+    def fire(self, schedule, now):
+        # send the reminders due by now, batch_size at a time, recording after each batch how far the shard got
+        sent = 0
+        while schedule.heap and schedule.heap[0][0] <= now:
+            batch = [heapq.heappop(schedule.heap) for _ in range(self.batch_size)
+                     if schedule.heap and schedule.heap[0][0] <= now]
+            reminders = self.check(batch, now)
+            # reminders of the same time as the last of the batch may be left for the next batch
+            done = not schedule.heap or schedule.heap[0][0] > batch[-1][0]
+            try:
+                if reminders:
+                    self.sink.send(reminders)
+                if done:
+                    db.session.get(ReminderState, schedule.shard).fired_until = batch[-1][0]
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                for entry in batch:
+                    heapq.heappush(schedule.heap, entry)
+                current_app.logger.exception('Sending reminders failed, trying again at the next tick')
+                return sent
+            schedule.queued.difference_update(batch)
+            sent += len(reminders)
+        # nothing else is due by now. the time is recorded with the next batch sent, a restart before that checks the
+        # tasks of the time in between again
+        schedule.fired_until = now
+        return sent
+
+
+def make_scheduler(config):
+    return ReminderScheduler(make_sink(config), timedelta(hours=config['REMINDER_LEAD_HOURS']),
+                             timedelta(minutes=config['REMINDER_WINDOW_MINUTES']), config['REMINDER_BATCH_SIZE'])
+
+
+@bp.cli.command('send-reminders')
+@click.option('--once', is_flag=True, help='Send the reminders due now and stop.')
+def send_reminders_command(once):
+    """Send due date reminders as tasks come due, to the reminder table or REMINDER_WEBHOOK_URL."""
+    scheduler = make_scheduler(current_app.config)
+    scheduler.start(datetime.utcnow())
+    while True:
+        sent = scheduler.tick(datetime.utcnow())
+        if sent:
+            print(f'Sent {sent} reminders.')
+        if once:
+            return
+        time.sleep(current_app.config['REMINDER_POLL_SECONDS'])
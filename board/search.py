@@ -0,0 +1,79 @@
+import re
+from sqlalchemy import DDL, event, or_, text
+from board import bp, db
+from board.boards import COLUMN_ORDER, board_query
+from board.models import Task
+from board.shards import each_shard, shard_engine
+
+# Full-text search over task titles and descriptions. On SQLite the tasks are indexed in an FTS5 table that uses the task
+# table as its external content, so it stores only the index. Triggers keep it in sync with every insert, update and
+# delete, including the bulk statements of the batch api. The index exists only on SQLite: other databases fall back to
+# an unindexed LIKE '%word%' scan of every task of the board, which gets slower as the board grows.
+
+CREATE_SEARCH_INDEX = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS task_fts USING fts5(title, description, content='task', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_insert AFTER INSERT ON task BEGIN "
+    "INSERT INTO task_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_delete AFTER DELETE ON task BEGIN "
+    "INSERT INTO task_fts(task_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_update AFTER UPDATE OF title, description ON task BEGIN "
+    "INSERT INTO task_fts(task_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO task_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+]
+
+for statement in CREATE_SEARCH_INDEX:
+    event.listen(Task.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+# the triggers go away with the task table, the index table has to be dropped with it
+event.listen(Task.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS task_fts').execute_if(dialect='sqlite'))
+
+
+def create_search_index(connection, rebuild=False):
+    # create the index and its triggers on an existing database. a new index is filled with the tasks already there
+    if connection.dialect.name != 'sqlite':
+        return
+    exists = connection.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'task_fts'").first()
+    for statement in CREATE_SEARCH_INDEX:
+        connection.exec_driver_sql(statement)
+    if rebuild or not exists:
+        connection.exec_driver_sql("INSERT INTO task_fts(task_fts) VALUES ('rebuild')")
+
+
+def match_expression(query):
+    # turn what the user typed into an FTS5 query: every word must appear, the last one may be a prefix.
+    # words are quoted so FTS5 operators and punctuation in the input are searched for literally
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    terms = ['"' + word.replace('"', '""') + '"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_tasks(query, user=None, team=None, page=1, per_page=20):
+    # one page of the tasks of a board that match the query, best matches first. returns the tasks and whether
+    # there is a next page
+    expression = match_expression(query)
+    if expression is None:
+        return [], False
+
+    tasks = board_query(user, team)
+    if db.engine.dialect.name == 'sqlite':
+        matches = text('SELECT rowid AS task_id, rank FROM task_fts WHERE task_fts MATCH :expression') \
+            .bindparams(expression=expression).columns(task_id=db.Integer, rank=db.Float).subquery()
+        tasks = tasks.join(matches, matches.c.task_id == Task.id).order_by(matches.c.rank, Task.id)
+    else:
+        for word in re.findall(r'\w+', query):
+            tasks = tasks.filter(or_(Task.title.ilike(f'%{word}%'), Task.description.ilike(f'%{word}%')))
+        tasks = tasks.order_by(*COLUMN_ORDER)
+
+    results = tasks.offset((page - 1) * per_page).limit(per_page + 1).all()
+    return results[:per_page], len(results) > per_page
+
+
+@bp.cli.command('rebuild-search')
+def rebuild_search_command():
+    """Rebuild the full-text search index from the task table."""
+    for shard in each_shard():
+        with shard_engine(shard).begin() as connection:
+            create_search_index(connection, rebuild=True)
+    print('Rebuilt the task search index.')
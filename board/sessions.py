@@ -0,0 +1,142 @@
+import json
+import threading
+import time
+from flask_login import UserMixin
+from board import db, login_manager
+from board.cache import LRUCache
+from board.models import User
+
+
+class UserSnapshot(UserMixin):
+    # lightweight copy of the User columns that requests need, used as current_user instead of a User row.
+    # views that need to change the user or follow its relationships load the User row by id
+
+    def __init__(self, id, username, email):
+        self.id = id
+        self.username = username
+        self.email = email
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.username, user.email)
+
+    def to_dict(self):
+        return {'id': self.id, 'username': self.username, 'email': self.email}
+
+    def __eq__(self, other):
+        return isinstance(other, (UserSnapshot, User)) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f"UserSnapshot('{self.username}', '{self.email}')"
+
+
+class LocalUserCache:
+    # per worker cache of user snapshots with a time to live, evicting the least recently used users when full.
+    # invalidations only reach the worker that made them, so the ttl bounds how stale other workers can be
+
+    def __init__(self, max_users, ttl):
+        self.ttl = ttl
+        self.entries = LRUCache(max_users)
+
+    def get(self, user_id):
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+        expires_at, snapshot = entry
+        if expires_at < time.monotonic():
+            self.entries.pop(user_id)
+            return None
+        return snapshot
+
+    def set(self, snapshot):
+        self.entries.set(snapshot.id, (time.monotonic() + self.ttl, snapshot))
+
+    def delete(self, user_id):
+        self.entries.pop(user_id)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class RedisUserCache:
+    # user snapshots shared by every worker through a redis (or redis compatible) server, so invalidations are
+    # seen by all workers at once. needs the optional redis package
+
+    def __init__(self, url, ttl, prefix='kanban:user:'):
+        try:
+            import redis
+        except ImportError as error:
+            raise RuntimeError('USER_CACHE_URL is set but the redis package is not installed') from error
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, user_id):
+        raw = self.client.get(f'{self.prefix}{user_id}')
+        return UserSnapshot(**json.loads(raw)) if raw else None
+
+    def set(self, snapshot):
+        self.client.set(f'{self.prefix}{snapshot.id}', json.dumps(snapshot.to_dict()), ex=max(1, int(self.ttl)))
+
+    def delete(self, user_id):
+        self.client.delete(f'{self.prefix}{user_id}')
+
+    def clear(self):
+        for key in self.client.scan_iter(f'{self.prefix}*'):
+            self.client.delete(key)
+
+
+class UserSessionCache:
+    # loads the user of each authenticated request from a cache backend, falling back to the database on a miss.
+    # hits and misses are counted so the saved lookups can be checked
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def load(self, user_id):
+        snapshot = self.backend.get(user_id)
+        with self.lock:
+            if snapshot is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if snapshot is None:
+            user = db.session.get(User, user_id)
+            if user is None:
+                return None
+            snapshot = UserSnapshot.from_user(user)
+            self.backend.set(snapshot)
+        return snapshot
+
+    def invalidate(self, user_id):
+        # call after committing a change to (or the deletion of) a user
+        self.backend.delete(user_id)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+def make_backend(config):
+    # USER_CACHE_URL selects a shared backend, otherwise each worker keeps its own cache
+    if config['USER_CACHE_URL']:
+        return RedisUserCache(config['USER_CACHE_URL'], config['USER_CACHE_TTL'])
+    return LocalUserCache(config['USER_CACHE_SIZE'], config['USER_CACHE_TTL'])
+
+
+# the backend is chosen by create_app
+user_cache = UserSessionCache(None)
+
+
+def configure_user_cache(app):
+    user_cache.backend = make_backend(app.config)
+
+
+@login_manager.user_loader
+def load_user(user_id):
+    return user_cache.load(int(user_id))
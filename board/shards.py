@@ -0,0 +1,312 @@
+from contextlib import contextmanager
+import click
+from flask import current_app, g, redirect, request, url_for
+from sqlalchemy import delete, event, func, select, update
+from werkzeug.exceptions import NotFound
+from board import bp, db
+from board.models import ArchivedTask, BoardChange, BoardVersion, MovedTask, Task, Team
+from board.storage import HOME, SHARDED_TABLES, create_shard_engines, current_shard
+
+# Team boards spread over several databases. With SHARD_COUNT set, the tasks of each team, with its archive, change log
+# and counters, live in one of the shard databases, so writes to teams on different shards run side by side instead of
+# queuing for the single sqlite writer. Users, teams, memberships and personal boards stay in the home database. The
+# shard of a team is recorded in team.shard, the directory, and a task id carries the shard it was created in. Each
+# request picks its shard from its url before the view runs, and the session sends the task tables there (see
+# board/storage.py), so views query tasks as they always did. Helpers reading several boards, like the batch api and
+# the board statistics, group their work by shard. `flask rebalance-shards` moves teams between shards, new ones too.
+
+# a task id holds its shard above this many bits: shard k hands out the ids from k << SHARD_ID_BITS on
+SHARD_ID_BITS = 40
+
+
+def configure_shards(app):
+    # call once the SQLAlchemy extension is initialized, so that the default shard files sit next to the home database
+    # wherever the extension put it
+    with app.app_context():
+        home_uri = db.engine.url.render_as_string(hide_password=False)
+    app.extensions['shards'] = create_shard_engines(home_uri, app.config['SHARD_COUNT'], app.config['SHARD_URL'])
+
+
+def shard_count():
+    return current_app.config['SHARD_COUNT']
+
+
+def shard_engine(shard):
+    return db.engine if shard == HOME else current_app.extensions['shards'][shard]
+
+
+@contextmanager
+def use_shard(shard):
+    # send the sharded tables to shard for the body of the with statement
+    previous = current_shard()
+    g.shard = shard
+    try:
+        yield shard
+    finally:
+        g.shard = previous
+
+
+def each_shard():
+    # every database holding the sharded tables, home first, each one routed to while the body of the loop runs
+    for shard in range(shard_count() + 1):
+        with use_shard(shard):
+            yield shard
+
+
+def group_by_shard(items, shard_of):
+    groups = {}
+    for item in items:
+        groups.setdefault(shard_of(item), []).append(item)
+    return groups
+
+
+def task_shard(task_id):
+    shard = task_id >> SHARD_ID_BITS
+    return shard if 0 < shard <= shard_count() else HOME
+
+
+def team_shards(team_ids):
+    # the shard of each team, read from the directory with one query and remembered for the rest of the request
+    team_ids = set(team_ids)
+    if not shard_count():
+        return dict.fromkeys(team_ids, HOME)
+    memo = g.setdefault('team_shards', {})
+    missing = team_ids - memo.keys()
+    if missing:
+        # teams that no longer exist have nothing left in any shard
+        memo.update(dict.fromkeys(missing, HOME))
+        memo.update(db.session.execute(select(Team.id, Team.shard).where(Team.id.in_(missing))).all())
+    return {team_id: memo[team_id] for team_id in team_ids}
+
+
+def board_shards(board_keys):
+    # the shard of each board, by board key. personal boards are at home
+    teams = {}
+    for key in set(board_keys):
+        kind, _, owner_id = key.partition('-')
+        teams[key] = int(owner_id) if kind == 'team' and owner_id.isdigit() else None
+    shards = team_shards(team_id for team_id in teams.values() if team_id is not None)
+    return {key: HOME if team_id is None else shards[team_id] for key, team_id in teams.items()}
+
+
+def board_shard(board_key):
+    return board_shards([board_key])[board_key]
+
+
+@bp.url_value_preprocessor
+def route_request(endpoint, values):
+    # task ids carry their shard, teams and board keys are looked up in the directory. everything else, personal boards
+    # included, is at home. board keys given as a query argument are routed by boards.get_board_or_404
+    g.shard = HOME
+    if not values or not shard_count():
+        return
+    if 'task_id' in values:
+        g.shard = task_shard(values['task_id'])
+    elif 'team_id' in values:
+        g.shard = team_shards([values['team_id']])[values['team_id']]
+    elif 'board_key' in values:
+        g.shard = board_shard(values['board_key'])
+
+
+@event.listens_for(Team, 'before_insert')
+def place_team(mapper, connection, team):
+    # new teams are dealt round-robin over the shards by the id they get. afterwards the directory is what counts,
+    # so a team can be moved without changing its id
+    count = shard_count()
+    if team.shard is not None or not count:
+        return
+    team_id = team.id or (connection.scalar(select(func.max(Team.id))) or 0) + 1
+    team.shard = 1 + (team_id - 1) % count
+
+
+def moved_task_id(task_id):
+    # the id a task has now if it was moved with its team, following later moves, or None
+    new_id = None
+    moved = db.session.get(MovedTask, task_id)
+    while moved is not None:
+        new_id = moved.new_id
+        moved = db.session.get(MovedTask, new_id)
+    return new_id
+
+
+@bp.app_errorhandler(NotFound)
+def follow_moved_task(error):
+    # links to a task from before its team was moved are sent on to its new id, keeping the method of the request
+    task_id = (request.view_args or {}).get('task_id')
+    new_id = moved_task_id(task_id) if task_id is not None else None
+    if new_id is None:
+        return error
+    url = url_for(request.endpoint, **dict(request.view_args, task_id=new_id))
+    if request.query_string:
+        url += '?' + request.query_string.decode('ascii')
+    return redirect(url, 308)
+
+
+def sqlite_sequence_exists(connection):
+    return connection.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence'").first() is not None
+
+
+def reserve_task_ids(connection, last_id):
+    # make a sqlite database hand out task ids above last_id from now on
+    if connection.dialect.name != 'sqlite' or not sqlite_sequence_exists(connection):
+        return
+    connection.exec_driver_sql("UPDATE sqlite_sequence SET seq = ? WHERE name = 'task' AND seq < ?", (last_id, last_id))
+    connection.exec_driver_sql("INSERT INTO sqlite_sequence (name, seq) SELECT 'task', ? "
+                               "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'task')", (last_id,))
+
+
+def next_task_id(connection, shard):
+    # the first id of a shard that was never handed out, counting deleted and archived tasks
+    used = [shard << SHARD_ID_BITS, connection.scalar(select(func.max(Task.__table__.c.id))),
+            connection.scalar(select(func.max(ArchivedTask.__table__.c.id)))]
+    if connection.dialect.name == 'sqlite' and sqlite_sequence_exists(connection):
+        used.append(connection.exec_driver_sql("SELECT seq FROM sqlite_sequence WHERE name = 'task'").scalar())
+    return max(value for value in used if value is not None) + 1
+
+
+def create_shards():
+    # create the sharded tables, with their search index and counter triggers, in every shard database
+    tables = [db.metadata.tables[name] for name in sorted(SHARDED_TABLES)]
+    for shard in range(1, shard_count() + 1):
+        with shard_engine(shard).begin() as connection:
+            db.metadata.create_all(connection, tables=tables)
+            reserve_task_ids(connection, shard << SHARD_ID_BITS)
+
+
+def team_rows(connection, table, team_id):
+    return [dict(row) for row in connection.execute(select(table).where(table.c.team_id == team_id)
+                                                    .order_by(table.c.id)).mappings()]
+
+
+def delete_team_tasks(connection, team_id):
+    # everything a database holds for a team board. the counters and the search index follow through the task triggers
+    key = f'team-{team_id}'
+    for table in (Task.__table__, ArchivedTask.__table__):
+        connection.execute(delete(table).where(table.c.team_id == team_id))
+    for table in (BoardVersion.__table__, BoardChange.__table__):
+        connection.execute(delete(table).where(table.c.board_key == key))
+
+
+def point_directory(connection, team_id, shard, moved):
+    connection.execute(update(Team.__table__).where(Team.__table__.c.id == team_id).values(shard=shard))
+    if moved:
+        connection.execute(MovedTask.__table__.insert(), moved)
+
+
+def move_team(team_id, target):
+    # copy the live and archived tasks of a team to another shard, point the directory at it and delete the tasks from
+    # the old shard. the tasks get ids from the range of the new shard, and moved_task keeps the old ones. the old
+    # shard takes no writes while the team is copied. returns the number of tasks moved
+    with db.engine.connect() as home:
+        source = home.scalar(select(Team.shard).where(Team.id == team_id))
+    if source is None:
+        raise ValueError(f'No team {team_id}')
+    if target != HOME and not 0 < target <= shard_count():
+        raise ValueError(f'No shard {target}')
+    g.pop('team_shards', None)
+    if source == target:
+        return 0
+
+    key = f'team-{team_id}'
+    versions = BoardVersion.__table__
+    with shard_engine(source).begin() as source_db:
+        # writing first takes the write lock of the old shard, so the team cannot change while it is copied
+        source_db.execute(update(versions).where(versions.c.board_key == key).values(version=versions.c.version + 1))
+        version = source_db.scalar(select(versions.c.version).where(versions.c.board_key == key)) or 0
+        tasks = team_rows(source_db, Task.__table__, team_id)
+        archived = team_rows(source_db, ArchivedTask.__table__, team_id)
+
+        with shard_engine(target).begin() as target_db:
+            # leftovers of an interrupted move are replaced
+            delete_team_tasks(target_db, team_id)
+            first = next_task_id(target_db, target)
+            new_ids = {row['id']: first + position for position, row in enumerate(tasks + archived)}
+            for table, rows in ((Task.__table__, tasks), (ArchivedTask.__table__, archived)):
+                if rows:
+                    target_db.execute(table.insert(), [dict(row, id=new_ids[row['id']]) for row in rows])
+            # the change log stays behind, so browsers showing the board get a snapshot at the next version
+            target_db.execute(versions.insert(), {'board_key': key, 'version': version + 1})
+            moved = [{'id': old_id, 'new_id': new_id} for old_id, new_id in new_ids.items()]
+            if target == HOME:
+                point_directory(target_db, team_id, target, moved)
+
+        if source == HOME:
+            point_directory(source_db, team_id, target, moved)
+        elif target != HOME:
+            with db.engine.begin() as home:
+                point_directory(home, team_id, target, moved)
+        delete_team_tasks(source_db, team_id)
+    return len(new_ids)
+
+
+def team_sizes():
+    # the shard and number of tasks of every team, by team id. tasks left in a shard the team is not on are not counted
+    teams = {team_id: [shard, 0] for team_id, shard in db.session.execute(select(Team.id, Team.shard))}
+    for shard in each_shard():
+        for team_id, count in db.session.execute(select(Task.team_id, func.count()).where(Task.team_id.isnot(None))
+                                                 .group_by(Task.team_id)):
+            if team_id in teams and teams[team_id][0] == shard:
+                teams[team_id][1] = count
+    return {team_id: tuple(value) for team_id, value in teams.items()}
+
+
+def plan_moves(teams, count):
+    # where to move teams, given their (shard, size) by id, so that the shards hold about as many tasks. teams outside
+    # the shards, at home or on a shard that was removed, go to the least loaded shard, largest first.
+    # then, while the gap between the most and the least loaded shard can be narrowed, the team whose size is closest
+    # to half the gap moves across. returns (team id, new shard) pairs
+    load = dict.fromkeys(range(1, count + 1), 0)
+    placement = {}
+    for team_id, (shard, size) in sorted(teams.items(), key=lambda item: (item[1][0] not in load, -item[1][1])):
+        if shard not in load:
+            shard = min(load, key=load.get)
+        placement[team_id] = shard
+        load[shard] += size
+    while load:
+        high, low = max(load, key=load.get), min(load, key=load.get)
+        gap = load[high] - load[low]
+        candidates = [team_id for team_id, shard in placement.items() if shard == high and 0 < teams[team_id][1] < gap]
+        if not candidates:
+            break
+        team_id = min(candidates, key=lambda team_id: (abs(gap - 2 * teams[team_id][1]), team_id))
+        placement[team_id] = low
+        load[high] -= teams[team_id][1]
+        load[low] += teams[team_id][1]
+    return sorted((team_id, shard) for team_id, shard in placement.items() if shard != teams[team_id][0])
+
+
+@bp.cli.command('shards')
+def shards_command():
+    """List the shards with the number of teams and tasks they hold."""
+    teams = team_sizes()
+    for shard in range(shard_count() + 1):
+        placed = [size for team_shard, size in teams.values() if team_shard == shard]
+        name = 'home' if shard == HOME else f'shard {shard}'
+        print(f'{name}: {len(placed)} teams, {sum(placed)} team tasks')
+
+
+@bp.cli.command('move-team')
+@click.argument('team_id', type=int)
+@click.argument('shard', type=int)
+def move_team_command(team_id, shard):
+    """Move the tasks of a team to another shard (0 for the home database)."""
+    try:
+        moved = move_team(team_id, shard)
+    except ValueError as error:
+        raise click.BadParameter(str(error))
+    print(f'Moved {moved} tasks of team {team_id} to shard {shard}.')
+
+
+@bp.cli.command('rebalance-shards')
+@click.option('--dry-run', is_flag=True, help='Only list the moves.')
+def rebalance_shards_command(dry_run):
+    """Place the teams still in the home database on the shards and even out the shards."""
+    if not shard_count():
+        raise click.UsageError('SHARD_COUNT is not set.')
+    teams = team_sizes()
+    moves = plan_moves(teams, shard_count())
+    for team_id, shard in moves:
+        print(f'team {team_id}: shard {teams[team_id][0]} -> {shard}, {teams[team_id][1]} tasks')
+        if not dry_run:
+            move_team(team_id, shard)
+    print(f'{"Planned" if dry_run else "Made"} {len(moves)} moves.')
@@ -0,0 +1,67 @@
+import os
+import time
+from contextlib import ExitStack
+from flask import current_app
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import text
+from board import bp, db
+
+# Getting a worker ready to serve. Jinja compiles a template to python the first time it is rendered, which made the
+# first requests of every new worker slow. The compiled code is kept in a bytecode cache on disk, TEMPLATE_CACHE_DIR,
+# shared by the workers and by restarts, and `flask compile-templates` fills it at build or deploy time. Jinja checks
+# the source checksum of every cached template, so a changed template is simply compiled again. With WARM_UP set, a new
+# app also loads every template and opens its pooled database connections before it is handed to the server.
+
+
+def configure_templates(app):
+    # call before the jinja environment of the app is first used
+    folder = app.config['TEMPLATE_CACHE_DIR']
+    if not folder:
+        return
+    os.makedirs(folder, exist_ok=True)
+    app.jinja_options = dict(app.jinja_options, bytecode_cache=FileSystemBytecodeCache(folder))
+
+
+def load_templates(app):
+    # compile, or read from the bytecode cache, every template of the app into its jinja environment
+    names = app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        app.jinja_env.get_template(name)
+    return names
+
+
+def open_connections(app):
+    # check out as many connections as the pools of the home database and of the shards keep, so none of them is
+    # opened during a request. pools without a size, e.g. for in-memory sqlite, open their one connection
+    opened = 0
+    with app.app_context():
+        for engine in [db.engine, *app.extensions['shards'].values()]:
+            size = getattr(engine.pool, 'size', lambda: 1)()
+            with ExitStack() as stack:
+                for _ in range(size):
+                    stack.enter_context(engine.connect()).execute(text('SELECT 1'))
+            opened += size
+    return opened
+
+
+def warm_up(app):
+    start = time.perf_counter()
+    templates = load_templates(app)
+    connections = open_connections(app)
+    app.logger.info('Warmed up %d templates and %d connections in %.0f ms', len(templates), connections,
+                    (time.perf_counter() - start) * 1000)
+
+
+@bp.cli.command('compile-templates')
+def compile_templates_command():
+    """Compile every template into the bytecode cache (TEMPLATE_CACHE_DIR)."""
+    folder = current_app.config['TEMPLATE_CACHE_DIR']
+    if not folder:
+        raise SystemExit('TEMPLATE_CACHE_DIR is empty, there is no cache to fill.')
+    # a fresh environment, so templates already loaded by this process are compiled and written out as well
+    environment = current_app.create_jinja_environment()
+    environment.bytecode_cache.clear()
+    names = environment.list_templates(extensions=['html'])
+    for name in names:
+        environment.get_template(name)
+    print(f'Compiled {len(names)} templates into {folder}.')
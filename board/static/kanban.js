@@ -0,0 +1,145 @@
+// Build the link and card drawn for a task, as the board templates do.
+function makeCard(task) {
+  var link = document.createElement('a');
+  link.href = task.url;
+  link.dataset.id = task.id;
+  link.dataset.rank = task.rank;
+  link.draggable = true;
+  var card = document.createElement('div');
+  card.className = 'task';
+  card.textContent = task.title;
+  link.appendChild(card);
+  return link;
+}
+
+// Cards are ordered by rank, then id, like the column queries. Ranks are compared as strings.
+function comesBefore(task, link) {
+  if (task.rank !== link.dataset.rank) {
+    return task.rank < link.dataset.rank;
+  }
+  return task.id < Number(link.dataset.id);
+}
+
+// Board columns only render their first page of cards. When the bottom of a column scrolls into view,
+// fetch the next page from the column api and append it, until the column has no next page.
+document.querySelectorAll('.column[data-next]').forEach(function (column) {
+  var sentinel = document.createElement('div');
+  sentinel.className = 'column-end';
+  column.appendChild(sentinel);
+
+  var loading = false;
+  var observer = new IntersectionObserver(function (entries) {
+    if (!entries[0].isIntersecting || loading || !column.dataset.next) {
+      return;
+    }
+    loading = true;
+    fetch(column.dataset.next, {credentials: 'same-origin'})
+      .then(function (response) { return response.json(); })
+      .then(function (page) {
+        page.tasks.forEach(function (task) {
+          // a card pushed by the event stream may already be there
+          if (!column.querySelector('a[data-id="' + task.id + '"]')) {
+            column.insertBefore(makeCard(task), sentinel);
+          }
+        });
+        if (page.next) {
+          column.dataset.next = page.next;
+        } else {
+          delete column.dataset.next;
+          observer.disconnect();
+        }
+      })
+      .finally(function () { loading = false; });
+  });
+  observer.observe(sentinel);
+});
+
+// Keep the board up to date with the changes pushed by the server, instead of reloading the page.
+// Each event holds the cards created or changed since the previous one and the ids of the deleted cards.
+document.querySelectorAll('.whole[data-events]').forEach(function (board) {
+  function applyChanges(change) {
+    if (change.snapshot) {
+      // the server no longer has the changes since this page was rendered
+      window.location.reload();
+      return;
+    }
+    change.deleted.concat(change.tasks.map(function (task) { return task.id; })).forEach(function (id) {
+      var link = board.querySelector('a[data-id="' + id + '"]');
+      if (link) {
+        link.remove();
+      }
+    });
+    change.tasks.forEach(function (task) {
+      var column = board.querySelector('.column[data-status="' + task.status + '"]');
+      if (!column) {
+        return;
+      }
+      var links = column.querySelectorAll('a[data-id]');
+      for (var i = 0; i < links.length; i++) {
+        if (comesBefore(task, links[i])) {
+          column.insertBefore(makeCard(task), links[i]);
+          return;
+        }
+      }
+      // past the loaded cards of a column that has more pages, the card arrives with its page on scroll
+      if (!column.dataset.next) {
+        column.insertBefore(makeCard(task), column.querySelector('.column-end'));
+      }
+    });
+    board.dataset.version = change.version;
+  }
+
+  // the browser reconnects on its own and sends the id of the last event, so nothing is missed
+  var source = new EventSource(board.dataset.events + '?since=' + board.dataset.version);
+  source.onmessage = function (message) {
+    applyChanges(JSON.parse(message.data));
+  };
+});
+
+// Drag a card within its column or to another one. The card is dropped below the card under the pointer, and the
+// server gives it a rank between its new neighbours; the change then comes back through the event stream.
+document.querySelectorAll('.whole[data-move]').forEach(function (board) {
+  var dragged = null;
+  board.addEventListener('dragstart', function (event) {
+    dragged = event.target.closest('a[data-id]');
+  });
+  board.querySelectorAll('.column').forEach(function (column) {
+    column.addEventListener('dragover', function (event) {
+      if (dragged) {
+        event.preventDefault();
+      }
+    });
+    column.addEventListener('drop', function (event) {
+      event.preventDefault();
+      if (!dragged) {
+        return;
+      }
+      // the card above the drop point, or none to drop on top of the column
+      var above = null;
+      var first = null;
+      column.querySelectorAll('a[data-id]').forEach(function (link) {
+        if (link === dragged) {
+          return;
+        }
+        first = first || link;
+        if (link.getBoundingClientRect().top < event.clientY) {
+          above = link;
+        }
+      });
+      var card = dragged;
+      dragged = null;
+      // the top of a column without other cards is before its sentinel, if it has one, not after it
+      column.insertBefore(card, above ? above.nextSibling : first || column.querySelector('.column-end'));
+      fetch(board.dataset.move.replace('/0/', '/' + card.dataset.id + '/'), {
+        method: 'POST',
+        credentials: 'same-origin',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({status: column.dataset.status, after: above ? Number(above.dataset.id) : null})
+      })
+        .then(function (response) { return response.ok ? response.json() : Promise.reject(response); })
+        .then(function (task) { card.dataset.rank = task.rank; })
+        // the card could not be moved there, show the board as the server has it
+        .catch(function () { window.location.reload(); });
+    });
+  });
+});
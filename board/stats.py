@@ -0,0 +1,172 @@
+import sys
+from collections import Counter, namedtuple
+from datetime import datetime
+import click
+from sqlalchemy import DDL, case, cast, event, func, literal
+from board import bp, db
+from board.boards import STATUSES
+from board.models import BoardCount, BoardDueCount, Task
+from board.shards import board_shards, each_shard, group_by_shard, shard_engine, use_shard
+
+# Per-board task counts for the board headers and the team listing. On SQLite, triggers on the task table keep a count
+# per (board, column) and a count of open tasks per (board, due day) in the same transaction as every task write, bulk
+# statements of the batch api included. Reading the statistics of n boards is then two index range scans of the
+# counter tables. The counters exist only on SQLite: other databases have no triggers and no counter rows, and count the
+# tasks of the boards at read time with a GROUP BY over the task table on every request.
+
+# the board key of a task row, as computed by boards.task_board_key. NULL for tasks that belong to no board
+BOARD_KEY = ("CASE WHEN {row}.team_id IS NOT NULL THEN 'team-' || {row}.team_id "
+             "WHEN {row}.user_id IS NOT NULL THEN 'user-' || {row}.user_id END")
+
+
+def add_task_sql(row):
+    key = BOARD_KEY.format(row=row)
+    return (f"INSERT INTO board_count (board_key, status, count) SELECT {key}, {row}.status, 1 "
+            f"WHERE {key} IS NOT NULL AND {row}.status IS NOT NULL "
+            f"ON CONFLICT (board_key, status) DO UPDATE SET count = count + 1; "
+            f"INSERT INTO board_due_count (board_key, due_day, count) SELECT {key}, date({row}.due_date), 1 "
+            f"WHERE {key} IS NOT NULL AND {row}.status != 'Done' "
+            f"ON CONFLICT (board_key, due_day) DO UPDATE SET count = count + 1; ")
+
+
+def remove_task_sql(row):
+    key = BOARD_KEY.format(row=row)
+    return (f"UPDATE board_count SET count = count - 1 WHERE board_key = {key} AND status = {row}.status; "
+            f"DELETE FROM board_count WHERE board_key = {key} AND status = {row}.status AND count <= 0; "
+            f"UPDATE board_due_count SET count = count - 1 "
+            f"WHERE board_key = {key} AND due_day = date({row}.due_date) AND {row}.status != 'Done'; "
+            f"DELETE FROM board_due_count WHERE board_key = {key} AND due_day = date({row}.due_date) AND count <= 0; ")
+
+
+CREATE_COUNTER_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS task_count_insert AFTER INSERT ON task BEGIN {add_task_sql('new')}END",
+    f"CREATE TRIGGER IF NOT EXISTS task_count_delete AFTER DELETE ON task BEGIN {remove_task_sql('old')}END",
+    # only changes that move a task to another board, column or due day touch the counters
+    "CREATE TRIGGER IF NOT EXISTS task_count_update AFTER UPDATE OF status, due_date, user_id, team_id ON task "
+    "WHEN old.status IS NOT new.status OR old.due_date IS NOT new.due_date "
+    "OR old.user_id IS NOT new.user_id OR old.team_id IS NOT new.team_id "
+    f"BEGIN {remove_task_sql('old')}{add_task_sql('new')}END",
+]
+
+# the triggers write to the counter tables, so they are created once every table of the metadata exists
+for statement in CREATE_COUNTER_TRIGGERS:
+    event.listen(db.metadata, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+# what the board headers show: the number of tasks in each column and how many open tasks are past their due day
+BoardStats = namedtuple('BoardStats', ['counts', 'overdue'])
+
+
+def today():
+    # due dates are calendar days and task timestamps are utc, so a task becomes overdue when its utc due day has passed
+    return datetime.utcnow().date()
+
+
+def board_stats(board_keys):
+    # statistics of several boards, by board key, with two queries per shard whatever the number of boards
+    board_keys = list(board_keys)
+    stats = {key: BoardStats({status: 0 for status in STATUSES}, 0) for key in board_keys}
+    shards = board_shards(board_keys)
+    for shard, keys in group_by_shard(board_keys, shards.get).items():
+        with use_shard(shard):
+            if db.engine.dialect.name != 'sqlite':
+                count_boards(keys, stats)
+            else:
+                read_board_counters(keys, stats)
+    return stats
+
+
+def read_board_counters(board_keys, stats):
+    # the counts of boards in one database, from the counter tables
+    for key, status, count in db.session.query(BoardCount.board_key, BoardCount.status, BoardCount.count) \
+            .filter(BoardCount.board_key.in_(board_keys)):
+        stats[key].counts[status] = count
+    overdue = db.session.query(BoardDueCount.board_key, func.sum(BoardDueCount.count)) \
+        .filter(BoardDueCount.board_key.in_(board_keys), BoardDueCount.due_day < today()) \
+        .group_by(BoardDueCount.board_key)
+    for key, count in overdue:
+        stats[key] = stats[key]._replace(overdue=count)
+
+
+def task_board_key_column():
+    # sql expression equivalent to BOARD_KEY, for queries built with sqlalchemy
+    return case((Task.team_id.isnot(None), literal('team-') + cast(Task.team_id, db.String)),
+                (Task.user_id.isnot(None), literal('user-') + cast(Task.user_id, db.String)))
+
+
+def count_boards(board_keys, stats):
+    # fallback for databases without the counter triggers: group the tasks of the boards by column
+    key = task_board_key_column()
+    start_of_today = datetime.combine(today(), datetime.min.time())
+    overdue = func.sum(case((db.and_(Task.status != 'Done', Task.due_date < start_of_today), 1), else_=0))
+    rows = db.session.query(key, Task.status, func.count(), overdue).filter(key.in_(board_keys)).group_by(key, Task.status)
+    for board, status, count, late in rows:
+        stats[board].counts[status] = count
+        stats[board] = stats[board]._replace(overdue=stats[board].overdue + (late or 0))
+    return stats
+
+
+def counted_tasks(connection):
+    # the counters recomputed from the task table
+    key = BOARD_KEY.format(row='task')
+    counts = connection.exec_driver_sql(f"SELECT {key}, status, count(*) FROM task "
+                                        f"WHERE {key} IS NOT NULL AND status IS NOT NULL GROUP BY 1, 2")
+    due = connection.exec_driver_sql(f"SELECT {key}, date(due_date), count(*) FROM task "
+                                     f"WHERE {key} IS NOT NULL AND status != 'Done' GROUP BY 1, 2")
+    return Counter({(board, status): n for board, status, n in counts}), Counter({(board, day): n for board, day, n in due})
+
+
+def stored_counts(connection):
+    counts = connection.exec_driver_sql('SELECT board_key, status, count FROM board_count')
+    due = connection.exec_driver_sql('SELECT board_key, due_day, count FROM board_due_count')
+    return Counter({(board, status): n for board, status, n in counts}), Counter({(board, day): n for board, day, n in due})
+
+
+def drifted_boards(expected, stored):
+    # boards with at least one counter that differs. zero counters are deleted, so a missing row counts as 0
+    return {key[0] for key in set(expected) | set(stored) if expected[key] != stored[key]}
+
+
+def reconcile_board_counts(connection, repair=True):
+    # compare the counters with the task table and rewrite those of the boards that drifted, e.g. after writes made
+    # with the triggers disabled or tasks imported with another tool. returns the keys of the drifted boards
+    if connection.dialect.name != 'sqlite':
+        return []
+    expected_counts, expected_due = counted_tasks(connection)
+    stored, stored_due = stored_counts(connection)
+    drifted = drifted_boards(expected_counts, stored) | drifted_boards(expected_due, stored_due)
+    if repair and drifted:
+        boards = list(drifted)
+        connection.execute(BoardCount.__table__.delete().where(BoardCount.board_key.in_(boards)))
+        connection.execute(BoardDueCount.__table__.delete().where(BoardDueCount.board_key.in_(boards)))
+        counts = [(board, status, n) for (board, status), n in expected_counts.items() if board in drifted]
+        due = [(board, day, n) for (board, day), n in expected_due.items() if board in drifted]
+        if counts:
+            connection.exec_driver_sql('INSERT INTO board_count (board_key, status, count) VALUES (?, ?, ?)', counts)
+        if due:
+            connection.exec_driver_sql('INSERT INTO board_due_count (board_key, due_day, count) VALUES (?, ?, ?)', due)
+    return sorted(drifted)
+
+
+def create_board_counters(connection):
+    # create the counter triggers on an existing database and fill the counters with the tasks already there
+    if connection.dialect.name != 'sqlite':
+        return
+    for statement in CREATE_COUNTER_TRIGGERS:
+        connection.exec_driver_sql(statement)
+    reconcile_board_counts(connection)
+
+
+@bp.cli.command('reconcile-board-counts')
+@click.option('--check', is_flag=True, help='Only report drift, exit with status 1 if there is any.')
+def reconcile_board_counts_command(check):
+    """Compare the board counters with the task table and repair the boards that drifted."""
+    drifted = []
+    for shard in each_shard():
+        with shard_engine(shard).begin() as connection:
+            drifted += reconcile_board_counts(connection, repair=not check)
+    if not drifted:
+        print('The board counters match the task table.')
+        return
+    print(f'{"Found" if check else "Repaired"} drift on {len(drifted)} boards: {", ".join(drifted)}')
+    if check:
+        sys.exit(1)
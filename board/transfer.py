@@ -0,0 +1,240 @@
+import codecs
+import csv
+import io
+import json
+import sys
+import click
+from flask import current_app, g, jsonify, request, stream_with_context
+from flask_login import login_required
+from sqlalchemy import func, select
+from board import bp, db
+from board.api import TASK_FIELDS, batch_errors, validate_task_fields
+from board.forms import TaskForm
+from board.archive import done_date
+from board.boards import STATUSES, board_query, get_board_or_404
+from board.changes import log_board_change
+from board.models import Task, Team, User
+from board.ranks import DIGITS, check_rank, column_condition
+from board.storage import HOME
+
+# Moving boards in and out of the app. An export streams the tasks of a board as CSV or JSON Lines (one JSON object per
+# line) straight from the database cursor, EXPORT_CHUNK_SIZE rows at a time, so memory does not grow with the board.
+# An import reads such a file line by line and inserts its tasks in transactions of IMPORT_BATCH_SIZE, below the cards
+# already on the board and in the order of the file.
+
+# columns of an export. an import only reads the TASK_FIELDS among them, ids and dates are given by the board
+EXPORT_FIELDS = ('id', 'title', 'description', 'status', 'priority', 'due_date', 'date_created', 'date_done', 'rank')
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+# rows of invalid lines listed in an import report
+MAX_REPORTED_ERRORS = 20
+
+
+def export_row(row):
+    # due dates are days, like in the task form
+    values = dict(zip(EXPORT_FIELDS, row))
+    values['due_date'] = values['due_date'].strftime('%Y-%m-%d')
+    for name in ('date_created', 'date_done'):
+        if values[name] is not None:
+            values[name] = values[name].isoformat(sep=' ')
+    return values
+
+
+def export_rows(user=None, team=None):
+    # the tasks of a board column by column, read through a server side cursor EXPORT_CHUNK_SIZE rows at a time
+    query = board_query(user, team).with_entities(*[getattr(Task, name) for name in EXPORT_FIELDS]) \
+        .order_by(Task.status, Task.rank, Task.id).yield_per(current_app.config['EXPORT_CHUNK_SIZE'])
+    for row in query:
+        yield export_row(row)
+
+
+def export_lines(rows, fmt):
+    # encode rows as the lines of a csv or json lines file, a chunk of lines at a time
+    chunk = current_app.config['EXPORT_CHUNK_SIZE']
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, EXPORT_FIELDS, lineterminator='\n') if fmt == 'csv' else None
+    if writer:
+        writer.writeheader()
+    for count, row in enumerate(rows, start=1):
+        if writer:
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(row) + '\n')
+        if count % chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def board_owner(board_key):
+    # the owner of a board given by its key, as keyword arguments for board_query, or None if there is no such board.
+    # like get_board_or_404, routes the rest of the command to the shard of the board
+    kind, _, owner_id = board_key.partition('-')
+    if not owner_id.isdigit():
+        return None
+    if kind == 'team':
+        team = db.session.get(Team, int(owner_id))
+        g.shard = team.shard if team else HOME
+        return team and {'team': team}
+    if kind == 'user':
+        user = db.session.get(User, int(owner_id))
+        g.shard = HOME
+        return user and {'user': user}
+    return None
+
+
+def read_items(lines, fmt):
+    # parse the lines of an uploaded file one at a time. yields (line number, item), the item is None for a line that
+    # cannot be parsed
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for item in reader:
+            yield reader.line_num, item
+        return
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            item = None
+        yield number, item if isinstance(item, dict) else None
+
+
+def appended_rank(last, position):
+    # the rank of the card at position (from 1) in a run of cards put below last, the lowest card of a column.
+    # the position is written after a digit giving its length, so that longer positions sort after shorter ones
+    digits = ''
+    while position:
+        position, digit = divmod(position, len(DIGITS))
+        digits = DIGITS[digit] + digits
+    return (last + DIGITS[len(digits)] + digits).rstrip('0')
+
+
+def import_tasks(board_key, lines, fmt, progress=None):
+    # add the tasks read from lines to a board. invalid lines are skipped and reported, the others are inserted and
+    # committed IMPORT_BATCH_SIZE at a time. progress, if given, is called with the report after every batch
+    kind, _, owner_id = board_key.partition('-')
+    owner = {'user_id': None, 'team_id': int(owner_id)} if kind == 'team' else {'user_id': int(owner_id), 'team_id': None}
+    last_ranks = {status: db.session.scalar(select(func.max(Task.rank)).where(column_condition(board_key, status))) or ''
+                  for status in STATUSES}
+    positions = dict.fromkeys(STATUSES, 0)
+    report = {'imported': 0, 'skipped': 0, 'errors': []}
+    batch_size = current_app.config['IMPORT_BATCH_SIZE']
+    table = Task.__table__
+    form = TaskForm(formdata=None, meta={'csrf': False})
+    rows = []
+
+    def flush():
+        ids = db.session.scalars(table.insert().returning(table.c.id), rows).all()
+        log_board_change(board_key, changed=ids)
+        for status in STATUSES:
+            if positions[status]:
+                check_rank(db.session, board_key, status, appended_rank(last_ranks[status], positions[status]))
+        db.session.commit()
+        report['imported'] += len(rows)
+        rows.clear()
+        if progress:
+            progress(report)
+
+    for line, item in read_items(lines, fmt):
+        if item is None:
+            errors = {'line': ['Cannot be parsed']}
+        else:
+            values, errors = validate_task_fields(item, TASK_FIELDS, form)
+        if errors:
+            report['skipped'] += 1
+            if len(report['errors']) < MAX_REPORTED_ERRORS:
+                report['errors'].append({'line': line, 'errors': errors})
+            continue
+        positions[values['status']] += 1
+        values.update(owner, date_done=done_date(values['status']),
+                      rank=appended_rank(last_ranks[values['status']], positions[values['status']]))
+        rows.append(values)
+        if len(rows) == batch_size:
+            flush()
+    if rows:
+        flush()
+    return report
+
+
+def import_format(filename, fmt=None):
+    # the format of an import, given or else taken from the file name
+    fmt = fmt or filename.rpartition('.')[2].lower()
+    return fmt if fmt in FORMATS else None
+
+
+@bp.route('/api/boards/<board_key>/export')
+@login_required
+def export_board(board_key):
+    # download every task of a board as ?format=csv (the default) or jsonl
+
+    board = get_board_or_404(board_key)
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        return batch_errors([{'error': f'Unknown format {fmt!r}, use one of {", ".join(FORMATS)}'}])
+    response = current_app.response_class(stream_with_context(export_lines(export_rows(**board), fmt)), mimetype=FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={board_key}.{fmt}'
+    return response
+
+
+@bp.route('/api/boards/<board_key>/import', methods=['POST'])
+@login_required
+def import_board(board_key):
+    # add the tasks of an uploaded csv or json lines file (multipart field "file") to a board. the format is taken from
+    # ?format= or from the file name. answers with the number of tasks imported and the lines that were skipped.
+    # a multipart form can be posted from another site with the session cookie, but it cannot set a header without the
+    # browser asking this site first, so the request has to carry X-Requested-With
+
+    if not request.headers.get('X-Requested-With'):
+        return jsonify(errors=[{'error': 'Imports need an X-Requested-With header'}]), 403
+    get_board_or_404(board_key)
+    upload = request.files.get('file')
+    if upload is None:
+        return batch_errors([{'error': 'Expected a file upload in the "file" field'}])
+    fmt = import_format(upload.filename or '', request.args.get('format'))
+    if fmt is None:
+        return batch_errors([{'error': f'Unknown format, use one of {", ".join(FORMATS)}'}])
+    lines = codecs.iterdecode(upload.stream, 'utf-8-sig')
+    try:
+        report = import_tasks(board_key, lines, fmt)
+    except UnicodeDecodeError:
+        db.session.rollback()
+        return batch_errors([{'error': 'The file is not utf-8 text'}])
+    return jsonify(report)
+
+
+@bp.cli.command('export-board')
+@click.argument('board_key')
+@click.option('--format', 'fmt', type=click.Choice(list(FORMATS)), default='csv')
+@click.option('--output', type=click.File('w', encoding='utf-8'), default='-', help='File to write (default stdout).')
+def export_board_command(board_key, fmt, output):
+    """Write every task of a board, e.g. team-3, as CSV or JSON Lines."""
+    board = board_owner(board_key)
+    if board is None:
+        raise click.BadParameter(f'No board {board_key}', param_hint='BOARD_KEY')
+    for chunk in export_lines(export_rows(**board), fmt):
+        output.write(chunk)
+
+
+@bp.cli.command('import-board')
+@click.argument('board_key')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(list(FORMATS)), default=None, help='Default: from the file name.')
+def import_board_command(board_key, path, fmt):
+    """Add the tasks of a CSV or JSON Lines file to a board, e.g. team-3."""
+    if board_owner(board_key) is None:
+        raise click.BadParameter(f'No board {board_key}', param_hint='BOARD_KEY')
+    fmt = import_format(path, fmt)
+    if fmt is None:
+        raise click.BadParameter('Cannot tell the format from the file name', param_hint='--format')
+
+    def progress(report):
+        print(f'{report["imported"]} imported, {report["skipped"]} skipped', file=sys.stderr)
+
+    with open(path, encoding='utf-8-sig', newline='') as lines:
+        report = import_tasks(board_key, lines, fmt, progress)
+    for error in report['errors']:
+        print(f'line {error["line"]}: {error["errors"]}', file=sys.stderr)
+    print(f'Imported {report["imported"]} tasks, skipped {report["skipped"]} lines.')
@@ -1,92 +1,114 @@
-from flask import render_template, url_for, flash, redirect, request, abort
-from board import app, db, bcrypt
+from flask import render_template, url_for, flash, redirect, request, abort, current_app
+from board import bp, db, passwords
 from board.forms import RegistrationForm, LoginForm, UpdateAccountForm, TaskForm, TeamForm
-from board.models import User, Task, Team
+from board.models import User, Task, Team, ArchivedTask, user_team_association
+from board.archive import archived_tasks, restore_task
+from board.boards import board_key, get_board_or_404, task_board_key, load_board
+from board.cache import render_board
+from board.changes import log_board_change
+from board.deletion import commit_deletion, delete_team_rows, delete_user_rows
+from board.loading import TASK_PAGE, TEAM_ONLY, TEAM_PAGE
+from board.membership import add_members, require_member
+from board.passwords import PasswordHasherBusy
+from board.search import search_tasks
+from board.stats import board_stats
+from board.sessions import user_cache
 from flask_login import login_user, current_user, logout_user, login_required
 
-@app.route('/')
+@bp.app_errorhandler(PasswordHasherBusy)
+def password_hasher_busy(error):
+    # every password worker is busy and the queue is full. answer at once rather than make the request wait
+    return render_template('busy.html', title='Busy'), 503, {'Retry-After': '2'}
+
+@bp.route('/')
 def index():
     if current_user.is_authenticated:
-        # Get tasks and ordered by priority in descending order and then by due date in ascending order. 
+        # Get tasks in the order the cards were arranged in their columns.
         # The tasks are not associated with a team. The tasks also belong to the current user
-        tasks_todo = Task.query.filter_by(status='To Do', team_id=None, creator=current_user).order_by(Task.priority.desc(), Task.due_date.asc()).all()
-        tasks_in_progress = Task.query.filter_by(status='In Progress', team_id=None, creator=current_user).order_by(Task.priority.desc(), Task.due_date.asc()).all()
-        tasks_done = Task.query.filter_by(status='Done', team_id=None, creator=current_user).order_by(Task.priority.desc(), Task.due_date.asc()).all()
-
-        return render_template('kanban.html', tasks_todo=tasks_todo, tasks_in_progress=tasks_in_progress, tasks_done=tasks_done)
+        # Only the first page of each column is rendered, the rest is fetched from the column api on scroll.
+        # The rendered columns are cached per board version, and unchanged boards are answered with 304 Not Modified
+        return render_board('kanban.html', board_key(user=current_user),
+                            lambda: load_board(user=current_user, limit=current_app.config['BOARD_PAGE_SIZE']))
     return render_template('kanban.html')
 
-@app.route('/about')
+@bp.route('/about')
 def about():
     return render_template('about.html', title='About')
 
 
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('board.index'))
     
     form = RegistrationForm()
     if form.validate_on_submit():
-        hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')  # hash the password
+        hashed_password = passwords.hash(form.password.data)  # hash the password
         user = User(username=form.username.data, email=form.email.data, password=hashed_password)
         db.session.add(user)
         db.session.commit()
         # flash(f'Account created for {form.username.data}!', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('board.login'))
     return render_template('register.html', title='Register', form=form)
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('board.index'))
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
-        if user and bcrypt.check_password_hash(user.password, form.password.data):
+        if user and passwords.check(user.password, form.password.data):
+            if passwords.needs_rehash(user.password):
+                # the hash was made at a lower cost than the current one, upgrade it while we have the password
+                user.password = passwords.rehash(form.password.data)
+                db.session.commit()
             login_user(user)
             next_page = request.args.get('next')
-            return redirect(next_page) if next_page else redirect(url_for('index'))
+            return redirect(next_page) if next_page else redirect(url_for('board.index'))
             # flash(f'You have been logged in!', 'success')
         else:
             flash('Login Unsuccessful. Please check email and password', 'danger')
 
     return render_template('login.html', title='Login', form=form)
 
-@app.route('/account', methods=['GET', 'POST'])
+@bp.route('/account', methods=['GET', 'POST'])
 @login_required
 def account():
     form = UpdateAccountForm()
     if form.validate_on_submit():
-        current_user.username = form.username.data
-        current_user.email = form.email.data
+        # current_user is a cached snapshot, so change the user row and drop the stale snapshot
+        user = db.session.get(User, current_user.id)
+        user.username = form.username.data
+        user.email = form.email.data
         db.session.commit()
+        user_cache.invalidate(user.id)
         # flash('Your account has been updated!', 'success')
-        return redirect(url_for('index'))
+        return redirect(url_for('board.index'))
     elif request.method == 'GET':
         # pre-populate the form with the current user's data
         form.username.data = current_user.username
         form.email.data = current_user.email
     return render_template('account.html', title='Account', form=form)
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     logout_user()
-    return redirect(url_for('index'))
+    return redirect(url_for('board.index'))
 
-@app.route('/account/<int:user_id>/delete', methods=['POST'])
+@bp.route('/account/<int:user_id>/delete', methods=['POST'])
 @login_required
 def delete_account(user_id):
-    user = User.query.get_or_404(user_id)
     # if current user trying to delete the account is not the owner, abort the request
-    if user != current_user:
+    if user_id != current_user.id:
         abort(403)
-    db.session.delete(user)
-    db.session.commit()
+    # the tasks and memberships are deleted with bulk statements, large boards finish in the background
+    commit_deletion(delete_user_rows(user_id))
+    user_cache.invalidate(user_id)
     # flash('Your account has been deleted!', 'success')
-    return redirect(url_for('index'))
+    return redirect(url_for('board.index'))
 
-@app.route('/task/new', methods=['GET', 'POST'])
+@bp.route('/task/new', methods=['GET', 'POST'])
 @login_required
 def create_task():
     # create a new task
@@ -94,28 +116,30 @@ def create_task():
     form = TaskForm()
     if form.validate_on_submit():
         task = Task(title=form.title.data, description=form.description.data, due_date=form.due_date.data, 
-                    priority=form.priority.data, status=form.status.data, creator=current_user)
+                    priority=form.priority.data, status=form.status.data, user_id=current_user.id)
         db.session.add(task)
+        db.session.flush()  # assigns task.id
+        log_board_change(board_key(user=current_user), changed=[task.id])
         db.session.commit()
         # flash('Your task has been created!', 'success')
-        return redirect(url_for('index'))
+        return redirect(url_for('board.index'))
     return render_template('create_task.html', title='New Task', form=form, legend='New Task')
 
-@app.route('/task/<int:task_id>')
+@bp.route('/task/<int:task_id>')
 @login_required
 def task(task_id):
     # show the attributes of a task
 
-    task = Task.query.get_or_404(task_id)
+    task = Task.query.options(*TASK_PAGE).get_or_404(task_id)
     return render_template('task.html', title=task.title, task=task)
 
-@app.route('/task/<int:task_id>/update', methods=['GET', 'POST'])
+@bp.route('/task/<int:task_id>/update', methods=['GET', 'POST'])
 @login_required
 def update_task(task_id):
     # update the attributes of an existing task
 
-    task = Task.query.get_or_404(task_id)
-    if task.creator != current_user:
+    task = Task.query.options(*TASK_PAGE).get_or_404(task_id)
+    if task.user_id != current_user.id:
         abort(403)
     form = TaskForm()
     if form.validate_on_submit():
@@ -124,9 +148,10 @@ def update_task(task_id):
         task.status = form.status.data
         task.due_date = form.due_date.data
         task.priority = form.priority.data
+        log_board_change(task_board_key(task), changed=[task.id])
         db.session.commit()
         # flash('Your task has been updated!', 'success')
-        return redirect(url_for('index'))
+        return redirect(url_for('board.index'))
     elif request.method == 'GET':
         # pre-populate the form with the current task's data
         form.title.data = task.title
@@ -137,22 +162,21 @@ def update_task(task_id):
     return render_template('create_task.html', title='Update Task', form=form, legend='Update Task')
 
 
-@app.route('/task/<int:task_id>/delete', methods=['POST'])
+@bp.route('/task/<int:task_id>/delete', methods=['POST'])
 @login_required
 def delete_task(task_id):
     # delete a task
 
-    task = Task.query.get_or_404(task_id)
+    task = Task.query.options(*TASK_PAGE).get_or_404(task_id)
     if task.team_id:  # if the task is part of a team, make sure the user trying to delete it is part of the team
-        team = Team.query.get_or_404(task.team_id)
-        if current_user not in team.members:
-            abort(403)
+        require_member(task.team_id)
+    log_board_change(task_board_key(task), deleted=[task.id])
     db.session.delete(task)
     db.session.commit()
     # flash('Your task has been deleted!', 'success')
-    return redirect(url_for('index'))
+    return redirect(url_for('board.index'))
 
-@app.route('/team/new', methods=['GET', 'POST'])
+@bp.route('/team/new', methods=['GET', 'POST'])
 @login_required
 def create_team():
     # create a new team
@@ -160,102 +184,131 @@ def create_team():
     form = TeamForm()
     if form.validate_on_submit():
         team = Team(name=form.name.data)
-        team.members.append(current_user)
-        members_to_be_added = form.member_emails.data.split(',')
-        for member in members_to_be_added:
-            user = User.query.filter_by(email=member).first()
-            if user:
-                team.members.append(user)
         db.session.add(team)
+        db.session.flush()  # assigns team.id
+        # the members were resolved while validating the form. they are inserted with the creator in one statement
+        add_members(team.id, [current_user.id] + [user.id for user in form.members])
         db.session.commit()
         # flash('Your team has been created!', 'success')
-        return redirect(url_for('teams'))
+        return redirect(url_for('board.teams'))
     return render_template('create_team.html', title='New Team', form=form, legend='New Team')
 
-@app.route('/teams')
+@bp.route('/teams')
 @login_required
 def teams():
     # show all the teams the user is part of
 
-    teams = current_user.teams
+    teams = Team.query.options(*TEAM_ONLY).join(user_team_association) \
+        .filter(user_team_association.c.user_id == current_user.id).all()
     if len(teams) == 0:
-        return redirect(url_for('create_team'))
-    return render_template('teams.html', teams=teams)
+        return redirect(url_for('board.create_team'))
+    # column and overdue counts of every team, read from the board counters with two queries
+    stats = board_stats(board_key(team=team) for team in teams)
+    return render_template('teams.html', teams=teams, stats=stats)
 
-@app.route('/team/<int:team_id>')
+@bp.route('/team/<int:team_id>')
 @login_required
 def team(team_id):
     # show the team page where the user can see all the tasks of the team and update the team
 
-    team = Team.query.get_or_404(team_id)
-    if current_user not in team.members:
-        abort(403)
+    team = Team.query.options(*TEAM_PAGE).get_or_404(team_id)
+    require_member(team.id)
     return render_template('team.html', title=team.name, team=team)
 
-@app.route('/team/<int:team_id>/update', methods=['GET', 'POST'])
+@bp.route('/team/<int:team_id>/update', methods=['GET', 'POST'])
 @login_required
 def update_team(team_id):
     # update a team by changing its name and/or adding new members
 
-    team = Team.query.get_or_404(team_id)
-    if current_user not in team.members:
-        abort(403)
+    team = Team.query.options(*TEAM_ONLY).get_or_404(team_id)
+    require_member(team.id)
     form = TeamForm()
     if form.validate_on_submit():
         team.name = form.name.data
-        members_to_be_added = form.member_emails.data.split(',')
-        for member in members_to_be_added:
-            user = User.query.filter_by(email=member).first()
-            if user:
-                team.members.append(user)
+        add_members(team.id, [user.id for user in form.members])  # people already in the team are skipped
+        log_board_change(board_key(team=team), team=True)
         db.session.commit()
         # flash('Your team has been updated!', 'success')
-        return redirect(url_for('teams'))
+        return redirect(url_for('board.teams'))
     elif request.method == 'GET':
         form.name.data = team.name
     return render_template('create_team.html', title='Update Team', form=form, legend='Update Team')
 
 
-@app.route('/team/<int:team_id>/delete', methods=['POST'])
+@bp.route('/team/<int:team_id>/delete', methods=['POST'])
 @login_required
 def delete_team(team_id):
     # delete a team
 
-    team = Team.query.get_or_404(team_id)
-    if current_user not in team.members:
-        abort(403)
-    db.session.delete(team)
-    db.session.commit()
+    team = Team.query.options(*TEAM_ONLY).get_or_404(team_id)
+    require_member(team.id)
+    # the team goes with its tasks and memberships, deleted with bulk statements
+    commit_deletion(delete_team_rows(team.id))
     # flash('Your team has been deleted!', 'success')
-    return redirect(url_for('teams'))
+    return redirect(url_for('board.teams'))
 
 
-@app.route('/team/<int:team_id>/task/new', methods=['GET', 'POST'])
+@bp.route('/team/<int:team_id>/task/new', methods=['GET', 'POST'])
 @login_required
 def create_team_task(team_id):
     # create a new task for a team. this will not be visible to the user as part of their personal tasks
 
     form = TaskForm()
     if form.validate_on_submit():
-        team = Team.query.get_or_404(team_id)
+        team = Team.query.options(*TEAM_ONLY).get_or_404(team_id)
         task = Task(title=form.title.data, description=form.description.data, status=form.status.data, due_date=form.due_date.data, priority=form.priority.data, team=team)
         db.session.add(task)
+        db.session.flush()  # assigns task.id
+        log_board_change(board_key(team=team), changed=[task.id])
         db.session.commit()
         # flash('Your task has been created!', 'success')
-        return redirect(url_for('team_tasks', team_id=team_id))
+        return redirect(url_for('board.team_tasks', team_id=team_id))
     return render_template('create_task.html', title='New Task', form=form, legend='New Task')
 
-@app.route('/team/<int:team_id>/tasks')
+@bp.route('/team/<int:team_id>/tasks')
 def team_tasks(team_id):
     # show all the tasks of a team
     
-    team = Team.query.get_or_404(team_id)
-    if current_user not in team.members:
-        abort(403)
+    team = Team.query.options(*TEAM_ONLY).get_or_404(team_id)
+    require_member(team.id)
 
-    # get tasks ordered by priority in descending order and then by due date in ascending order
-    tasks_todo = Task.query.filter_by(team=team, status='To Do').order_by(Task.priority.desc(), Task.due_date.asc()).all()
-    tasks_in_progress = Task.query.filter_by(team=team, status='In Progress').order_by(Task.priority.desc(), Task.due_date.asc()).all()
-    tasks_done = Task.query.filter_by(team=team, status='Done').order_by(Task.priority.desc(), Task.due_date.asc()).all()
+    # get tasks in the order the cards were arranged in their columns
+    return render_board('team_tasks.html', board_key(team=team), lambda: load_board(team=team, limit=current_app.config['BOARD_PAGE_SIZE']),
+                        title=team.name, team=team)
 
-    return render_template('team_tasks.html', title=team.name, team=team, tasks_todo=tasks_todo, tasks_in_progress=tasks_in_progress, tasks_done=tasks_done)
+@bp.route('/search')
+@login_required
+def search():
+    # search the tasks of the personal board, or of the team board given in the board argument
+
+    key = request.args.get('board') or board_key(user=current_user)
+    board = get_board_or_404(key)
+    query = request.args.get('q', '')
+    page = max(request.args.get('page', 1, type=int), 1)
+    tasks, has_next = search_tasks(query, page=page, per_page=current_app.config['SEARCH_PAGE_SIZE'], **board)
+    return render_template('search.html', title='Search', query=query, board_key=key, team=board.get('team'),
+                           tasks=tasks, page=page, has_next=has_next)
+
+@bp.route('/archive')
+@login_required
+def archive():
+    # the archived tasks of the personal board, or of the team board given in the board argument, newest first
+
+    key = request.args.get('board') or board_key(user=current_user)
+    board = get_board_or_404(key)
+    before = request.args.get('before', type=int)
+    tasks, next_before = archived_tasks(before=before, limit=current_app.config['ARCHIVE_PAGE_SIZE'], **board)
+    return render_template('archive.html', title='Archived tasks', board_key=key, team=board.get('team'),
+                           tasks=tasks, next_before=next_before)
+
+@bp.route('/archive/<int:task_id>/restore', methods=['POST'])
+@login_required
+def restore_archived_task(task_id):
+    # move an archived task back to its board
+
+    task = ArchivedTask.query.get_or_404(task_id)
+    key = task_board_key(task)
+    get_board_or_404(key)
+    restore_task(task)
+    db.session.commit()
+    return redirect(url_for('board.archive', board=key))
@@ -0,0 +1,10 @@
+import os
+import tempfile
+
+# every test runs against a throwaway database, never instance/kanban.db. this has to happen before the test app is
+# created in test_boards.py
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test_kanban.db'))
+# the lowest bcrypt cost keeps the many test logins fast and skips the startup calibration
+os.environ.setdefault('BCRYPT_ROUNDS', '4')
+# views must load every relationship they use with their own query, see board/loading.py
+os.environ.setdefault('RAISE_ON_LAZY_LOAD', '1')
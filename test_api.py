@@ -0,0 +1,81 @@
+import unittest
+from test_boards import BoardTestCase
+from board import db
+from board.models import Task
+
+
+def task_json(title, **fields):
+    return dict({'title': title, 'description': 'test_description', 'status': 'To Do', 'due_date': '2030-01-01', 'priority': 3}, **fields)
+
+
+class TestBatchTaskApi(BoardTestCase):
+    def test_batch_create(self):
+        self.login()
+        tasks = [task_json(f'task {i}') for i in range(50)] + [task_json('team task', team_id=self.team.id)]
+        response, statements = self.count_queries(lambda: self.client.post('/api/tasks/batch', json={'tasks': tasks}))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.get_json()['ids']), 51)
+        self.assertEqual(len([statement for statement in statements if statement.startswith('INSERT INTO task')]), 1)
+        self.assertEqual(Task.query.filter_by(user_id=self.user.id).count(), 50)
+        self.assertEqual(Task.query.filter_by(team_id=self.team.id).count(), 1)
+
+    def test_batch_create_answers_the_id_of_each_task(self):
+        self.login()
+        tasks = [task_json(f'task {i}', status=['To Do', 'In Progress', 'Done'][i % 3],
+                           **({'team_id': self.team.id} if i % 2 else {})) for i in range(12)]
+        response = self.client.post('/api/tasks/batch', json={'tasks': tasks})
+        self.assertEqual(response.status_code, 201)
+        ids = response.get_json()['ids']
+        self.assertEqual([db.session.get(Task, task_id).title for task_id in ids], [task['title'] for task in tasks])
+
+    def test_batch_create_reports_every_invalid_item(self):
+        self.login()
+        other_team_task = task_json('elsewhere', team_id=self.team.id + 1)
+        tasks = [task_json('ok'), task_json('', priority=11), task_json('bad status', status='Later'), other_team_task]
+        response = self.client.post('/api/tasks/batch', json={'tasks': tasks})
+        self.assertEqual(response.status_code, 400)
+        errors = response.get_json()['errors']
+        self.assertEqual([error['index'] for error in errors], [1, 2, 3])
+        self.assertEqual(set(errors[0]['errors']), {'title', 'priority'})
+        self.assertIn('status', errors[1]['errors'])
+        self.assertIn('team_id', errors[2]['errors'])
+        self.assertEqual(Task.query.count(), 0)
+
+    def test_batch_move(self):
+        ids = [self.make_task(f'task {i}', user_id=self.user.id).id for i in range(10)]
+        self.login()
+        patch = [{'id': task_id, 'status': 'Done'} for task_id in ids] + [{'id': ids[0], 'priority': 9}]
+        response, statements = self.count_queries(lambda: self.client.patch('/api/tasks/batch', json={'tasks': patch}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len([statement for statement in statements if statement.startswith('UPDATE task')]), 2)
+        self.assertEqual(Task.query.filter_by(status='Done').count(), 10)
+        self.assertEqual(db.session.get(Task, ids[0]).priority, 9)
+
+    def test_batch_done_keeps_the_done_date_of_done_tasks(self):
+        done = self.make_task('done', status='Done', user_id=self.user.id)
+        todo = self.make_task('todo', user_id=self.user.id)
+        done_id, todo_id, stamped = done.id, todo.id, done.date_done
+        self.login()
+        patch = [{'id': done_id, 'status': 'Done'}, {'id': todo_id, 'status': 'Done'}]
+        self.assertEqual(self.client.patch('/api/tasks/batch', json={'tasks': patch}).status_code, 200)
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Task, done_id).date_done, stamped)
+        self.assertIsNotNone(db.session.get(Task, todo_id).date_done)
+
+    def test_batch_patch_and_delete_check_ownership(self):
+        other = self.make_user('bob')
+        theirs = self.make_task('theirs', user_id=other.id).id
+        mine = self.make_task('mine', user_id=self.user.id).id
+        self.login()
+        response = self.client.patch('/api/tasks/batch', json={'tasks': [{'id': mine, 'status': 'Done'}, {'id': theirs, 'status': 'Done'}]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['errors'][0]['id'], theirs)
+        self.assertEqual(self.client.delete('/api/tasks/batch', json={'ids': [theirs]}).status_code, 400)
+
+        response = self.client.delete('/api/tasks/batch', json={'ids': [mine]})
+        self.assertEqual(response.get_json(), {'deleted': 1})
+        self.assertEqual(Task.query.count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import inspect, update
+from test_boards import BoardTestCase
+from board import db
+from board.archive import archive_tasks, archived_tasks
+from board.boards import load_board
+from board.migrations import upgrade
+from board.models import ArchivedTask, Task
+from board.stats import board_stats
+
+
+class TestArchive(BoardTestCase):
+    def age(self, *tasks, days=40):
+        db.session.execute(update(Task).where(Task.id.in_([task.id for task in tasks]))
+                           .values(date_done=datetime.utcnow() - timedelta(days=days)))
+        db.session.commit()
+
+    def test_done_date_follows_status(self):
+        task = self.make_task('card', user_id=self.user.id)
+        self.assertIsNone(task.date_done)
+        task.status = 'Done'
+        db.session.commit()
+        self.assertIsNotNone(task.date_done)
+        task.status = 'To Do'
+        db.session.commit()
+        self.assertIsNone(task.date_done)
+
+    def test_archive_moves_only_old_done_tasks(self):
+        old = self.make_task('old', status='Done', team_id=self.team.id)
+        recent = self.make_task('recent', status='Done', team_id=self.team.id)
+        todo = self.make_task('todo', team_id=self.team.id)
+        self.age(old)
+        self.age(todo)
+        old_id = old.id
+        self.assertEqual(archive_tasks(datetime.utcnow() - timedelta(days=30), batch_size=1), 1)
+        self.assertEqual([task.id for task in Task.query.order_by(Task.id)], [recent.id, todo.id])
+        self.assertEqual(db.session.get(ArchivedTask, old_id).title, 'old')
+
+        # the board, its counters and the archive page see the move
+        team_key = f'team-{self.team.id}'
+        self.assertEqual([task.title for task in load_board(team=self.team)[2].tasks], ['recent'])
+        self.assertEqual(board_stats([team_key])[team_key].counts['Done'], 1)
+        self.login()
+        self.assertIn(b'old', self.client.get(f'/archive?board={team_key}').data)
+
+    def test_archive_pages(self):
+        for i in range(5):
+            self.make_task(f'task {i}', status='Done', user_id=self.user.id)
+        self.age(*Task.query.all())
+        archive_tasks(datetime.utcnow() - timedelta(days=30), batch_size=2)
+        pages, before = [], None
+        while True:
+            tasks, before = archived_tasks(user=self.user, before=before, limit=2)
+            pages.append([task.title for task in tasks])
+            if before is None:
+                break
+        self.assertEqual(pages, [['task 4', 'task 3'], ['task 2', 'task 1'], ['task 0']])
+
+    def test_restore(self):
+        task = self.make_task('old', status='Done', user_id=self.user.id)
+        self.age(task)
+        task_id = task.id
+        archive_tasks(datetime.utcnow() - timedelta(days=30), batch_size=10)
+        self.login()
+        self.assertEqual(self.client.post(f'/archive/{task_id}/restore').status_code, 302)
+        self.assertIsNone(db.session.get(ArchivedTask, task_id))
+        restored = db.session.get(Task, task_id)
+        self.assertEqual((restored.title, restored.status), ('old', 'Done'))
+        self.assertIn(b'old', self.client.get('/').data)
+        # restored tasks count as Done from now on
+        self.assertEqual(archive_tasks(datetime.utcnow() - timedelta(days=30), batch_size=10), 0)
+
+    def test_restore_checks_the_board(self):
+        task = self.make_task('theirs', status='Done', user_id=self.make_user('other').id)
+        self.age(task)
+        task_id = task.id
+        archive_tasks(datetime.utcnow() - timedelta(days=30), batch_size=10)
+        self.login()
+        self.assertEqual(self.client.post(f'/archive/{task_id}/restore').status_code, 403)
+        self.assertIsNotNone(db.session.get(ArchivedTask, task_id))
+
+    def test_upgrade_adds_date_done(self):
+        self.make_task('legacy', status='Done', user_id=self.user.id)
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql('DROP INDEX ix_task_done')
+            connection.exec_driver_sql('ALTER TABLE task DROP COLUMN date_done')
+        upgrade()
+        self.assertIn('ix_task_done', {index['name'] for index in inspect(db.engine).get_indexes('task')})
+        db.session.expire_all()
+        task = Task.query.one()
+        self.assertEqual(task.date_done, task.date_created)
+
+    def test_upgrade_keeps_archived_ids_free(self):
+        # a task table from before AUTOINCREMENT, whose last task was archived
+        with db.engine.begin() as connection:
+            create = connection.exec_driver_sql("SELECT sql FROM sqlite_master WHERE name = 'task'").scalar()
+            connection.exec_driver_sql('ALTER TABLE task RENAME TO task_old')
+            connection.exec_driver_sql(create.replace('CREATE TABLE task', 'CREATE TABLE task_plain')
+                                       .replace('AUTOINCREMENT', ''))
+            connection.exec_driver_sql('DROP TABLE task_old')
+            connection.exec_driver_sql('ALTER TABLE task_plain RENAME TO task')
+            connection.exec_driver_sql("DELETE FROM sqlite_sequence WHERE name = 'task'")
+        task = self.make_task('old', status='Done', user_id=self.user.id)
+        task_id = task.id
+        self.age(task)
+        archive_tasks(datetime.utcnow() - timedelta(days=30), batch_size=10)
+        upgrade()
+
+        self.assertGreater(self.make_task('new', user_id=self.user.id).id, task_id)
+        # the counter triggers came along with the table
+        self.assertEqual(board_stats([f'user-{self.user.id}'])[f'user-{self.user.id}'].counts['To Do'], 1)
+        self.login()
+        self.assertEqual(self.client.post(f'/archive/{task_id}/restore').status_code, 302)
+        self.assertEqual(db.session.get(Task, task_id).title, 'old')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import gzip
+import os
+import shutil
+import tempfile
+from test_boards import BoardTestCase, app
+from board.assets import asset_manifest, build_assets, configure_assets
+
+
+class TestAssets(BoardTestCase):
+    def setUp(self):
+        super().setUp()
+        # build from a copy of the static folder, and forget the build afterwards
+        self.static_folder = os.path.join(tempfile.mkdtemp(), 'static')
+        shutil.copytree(app.static_folder, self.static_folder, ignore=shutil.ignore_patterns('dist'))
+        self.original_folder = app.static_folder
+        app.static_folder = self.static_folder
+        self.addCleanup(self.restore_static_folder)
+
+    def restore_static_folder(self):
+        app.static_folder = self.original_folder
+        configure_assets(app)
+
+    def build(self):
+        manifest = build_assets(app)
+        configure_assets(app)
+        return manifest
+
+    def test_build_fingerprints_and_precompresses(self):
+        manifest = self.build()
+        self.assertEqual(set(manifest), {'kanban.css', 'kanban.js'})
+        self.assertRegex(manifest['kanban.css'], r'^kanban\.[0-9a-f]{12}\.css$')
+        dist = os.path.join(self.static_folder, 'dist')
+        with open(os.path.join(self.static_folder, 'kanban.css'), 'rb') as source, \
+                open(os.path.join(dist, manifest['kanban.css'] + '.gz'), 'rb') as compressed:
+            self.assertEqual(gzip.decompress(compressed.read()), source.read())
+
+        # a changed file gets a new name, an unchanged one keeps it
+        with open(os.path.join(self.static_folder, 'kanban.css'), 'a') as source:
+            source.write('\n.changed {}\n')
+        rebuilt = self.build()
+        self.assertNotEqual(rebuilt['kanban.css'], manifest['kanban.css'])
+        self.assertEqual(rebuilt['kanban.js'], manifest['kanban.js'])
+
+    def test_pages_link_to_built_assets(self):
+        self.assertEqual(asset_manifest, {})
+        self.assertIn('/static/kanban.css', self.client.get('/about').get_data(as_text=True))
+
+        manifest = self.build()
+        self.assertIn(f'/assets/{manifest["kanban.css"]}', self.client.get('/about').get_data(as_text=True))
+
+    def test_assets_are_served_precompressed_and_immutable(self):
+        manifest = self.build()
+        url = f'/assets/{manifest["kanban.js"]}'
+        response = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.addCleanup(response.close)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn(response.mimetype, ('text/javascript', 'application/javascript'))
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertTrue(response.cache_control.immutable)
+        self.assertTrue(response.cache_control.public)
+        self.assertEqual(response.cache_control.max_age, app.config['ASSET_MAX_AGE'])
+        with open(os.path.join(self.static_folder, 'kanban.js'), 'rb') as source:
+            self.assertEqual(gzip.decompress(response.data), source.read())
+
+        plain = self.client.get(url)
+        self.addCleanup(plain.close)
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertEqual(self.client.get('/assets/kanban.js').status_code, 404)
+        self.assertEqual(self.client.get('/assets/manifest.json').status_code, 404)
@@ -0,0 +1,207 @@
+import tempfile
+import unittest
+from datetime import datetime
+
+from flask import g
+from flask.testing import FlaskClient
+from sqlalchemy import event, inspect
+from board import bcrypt, create_app, db
+from board.models import User, Task, Team
+from board.boards import load_board, load_column
+from board.migrations import upgrade
+from board.cache import LRUCache, board_version, fragment_cache
+from board.sessions import user_cache
+
+# the app shared by every test module. the template cache goes to a throwaway folder as well
+app = create_app({'TEMPLATE_CACHE_DIR': tempfile.mkdtemp()})
+
+
+class FreshRequestClient(FlaskClient):
+    # the test cases keep an app context pushed, and flask reuses it for every request made by the client.
+    # clear g before each request so per request state (the logged in user, membership memos) starts empty as in production
+    def open(self, *args, **kwargs):
+        for name in list(g):
+            g.pop(name)
+        return super().open(*args, **kwargs)
+
+
+class BoardTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config['TESTING'] = True
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+        # ids and board versions restart with every test database, so forget what earlier tests cached
+        fragment_cache.clear()
+        user_cache.backend.clear()
+        app.test_client_class = FreshRequestClient
+        self.client = app.test_client()
+
+        self.user = self.make_user('alice')
+        self.team = Team(name='test_team')
+        self.team.members.append(self.user)
+        db.session.add(self.team)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def make_user(self, name):
+        user = User(username=name, email=f'{name}@example.com', password=bcrypt.generate_password_hash('password').decode('utf-8'))
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    def make_task(self, title, status='To Do', priority=1, due_date=datetime(2030, 1, 1), description='test_description', **kwargs):
+        task = Task(title=title, description=description, status=status, priority=priority, due_date=due_date, **kwargs)
+        db.session.add(task)
+        db.session.commit()
+        return task
+
+    def login(self, user=None):
+        user = user or self.user
+        return self.client.post('/login', data={'email': user.email, 'password': 'password'})
+
+    def count_queries(self, func):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            result = func()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return result, statements
+
+
+class TestBoardLoading(BoardTestCase):
+    def test_load_board_uses_one_query(self):
+        self.make_task('low', priority=1, user_id=self.user.id)
+        self.make_task('high', priority=9, user_id=self.user.id)
+        self.make_task('doing', status='In Progress', user_id=self.user.id)
+        self.make_task('done', status='Done', user_id=self.user.id)
+        self.make_task('team task', team_id=self.team.id)
+        user = db.session.get(User, self.user.id)
+
+        columns, statements = self.count_queries(lambda: load_board(user=user))
+        self.assertEqual(len(statements), 1)
+        self.assertEqual([[task.title for task in column.tasks] for column in columns], [['high', 'low'], ['doing'], ['done']])
+
+    def test_team_board_only_shows_team_tasks(self):
+        self.make_task('mine', user_id=self.user.id)
+        self.make_task('ours', team_id=self.team.id)
+        columns = load_board(team=self.team)
+        self.assertEqual([task.title for task in columns[0].tasks], ['ours'])
+
+    def test_board_pages_render(self):
+        self.make_task('mine', user_id=self.user.id)
+        self.make_task('ours', team_id=self.team.id)
+        self.login()
+        self.assertIn(b'mine', self.client.get('/').data)
+        self.assertIn(b'ours', self.client.get(f'/team/{self.team.id}/tasks').data)
+
+    def test_upgrade_creates_board_indexes(self):
+        with db.engine.begin() as connection:
+            for index in Task.__table__.indexes:
+                index.drop(connection)
+        upgrade()
+        names = {index['name'] for index in inspect(db.engine).get_indexes('task')}
+        self.assertIn('ix_task_team_rank', names)
+        self.assertIn('ix_task_user_rank', names)
+
+
+class TestColumnPagination(BoardTestCase):
+    def setUp(self):
+        super().setUp()
+        # every new card goes on top of its column, so the page order is the reverse of the creation order
+        for i in range(7):
+            self.make_task(f'done {i}', status='Done', priority=5 - i % 2, team_id=self.team.id)
+        self.make_task('todo', team_id=self.team.id)
+
+    def test_first_page_of_each_column(self):
+        team = db.session.get(Team, self.team.id)
+        columns, statements = self.count_queries(lambda: load_board(team=team, limit=3))
+        self.assertEqual(len(statements), 1)
+        # each column is read with its own limit rather than numbering every card of the board
+        self.assertEqual(statements[0].count('LIMIT'), 3)
+        self.assertEqual([len(column.tasks) for column in columns], [1, 0, 3])
+        self.assertIsNone(columns[0].cursor)
+        self.assertIsNotNone(columns[2].cursor)
+
+    def test_pages_cover_the_column_in_order(self):
+        team = db.session.get(Team, self.team.id)
+        expected = [task.title for task in load_board(team=team)[2].tasks]
+        titles, cursor = [], None
+        while True:
+            page = load_column('Done', team=team, after=cursor, limit=2)
+            titles.extend(task.title for task in page.tasks)
+            cursor = page.cursor
+            if cursor is None:
+                break
+        self.assertEqual(titles, expected)
+
+    def test_column_api(self):
+        app.config['BOARD_PAGE_SIZE'] = 4
+        self.login()
+        try:
+            html = self.client.get(f'/team/{self.team.id}/tasks').data.decode()
+            self.assertEqual(html.count('class="task"'), 5)
+            response = self.client.get(f'/api/boards/team-{self.team.id}/columns/done').get_json()
+            self.assertEqual(len(response['tasks']), 4)
+            response = self.client.get(response['next']).get_json()
+            self.assertEqual(len(response['tasks']), 3)
+            self.assertIsNone(response['next'])
+        finally:
+            app.config['BOARD_PAGE_SIZE'] = 50
+
+    def test_column_api_rejects_other_boards_and_bad_cursors(self):
+        other = self.make_user('bob')
+        self.login()
+        self.assertEqual(self.client.get(f'/api/boards/user-{other.id}/columns/done').status_code, 403)
+        self.assertEqual(self.client.get(f'/api/boards/team-{self.team.id}/columns/done?after=junk').status_code, 400)
+
+
+class TestBoardCache(BoardTestCase):
+    def test_unchanged_board_is_not_modified(self):
+        self.login()
+        first = self.client.get('/')
+        self.assertEqual(first.status_code, 200)
+        etag = first.headers['ETag']
+
+        second, statements = self.count_queries(lambda: self.client.get('/', headers={'If-None-Match': etag}))
+        self.assertEqual(second.status_code, 304)
+        self.assertFalse([statement for statement in statements if 'FROM task' in statement])
+
+    def test_writes_bump_the_board_version(self):
+        self.login()
+        etag = self.client.get('/').headers['ETag']
+        self.client.post('/task/new', data={'title': 'new card', 'description': 'test_description', 'status': 'To Do',
+                                            'due_date': '2030-01-01', 'priority': '3'})
+        self.assertEqual(board_version(f'user-{self.user.id}'), 1)
+
+        response = self.client.get('/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'new card', response.data)
+
+        self.client.post(f'/team/{self.team.id}/task/new', data={'title': 'team card', 'description': 'test_description',
+                                                                 'status': 'Done', 'due_date': '2030-01-01', 'priority': '3'})
+        self.assertEqual(board_version(f'team-{self.team.id}'), 1)
+
+    def test_lru_cache_evicts_by_size(self):
+        cache = LRUCache(10, size=len)
+        cache.set('a', 'xxxx')
+        cache.set('b', 'xxxx')
+        cache.get('a')
+        cache.set('c', 'xxxx')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'xxxx')
+        self.assertEqual(cache.current_size, 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from datetime import datetime, timedelta
+from test_boards import BoardTestCase
+from board import db
+from board.changes import compact_changes
+from board.models import BoardChange
+
+
+def task_form(title, status='To Do'):
+    return {'title': title, 'description': 'test_description', 'status': status, 'due_date': '2030-01-01', 'priority': '3'}
+
+
+class TestBoardChanges(BoardTestCase):
+    def changes(self, since=None):
+        query = '' if since is None else f'?since={since}'
+        return self.client.get(f'/api/boards/team-{self.team.id}/changes{query}').get_json()
+
+    def test_delta_since_a_version(self):
+        self.login()
+        self.client.post(f'/team/{self.team.id}/task/new', data=task_form('first'))
+        version = self.changes()['version']
+        self.client.post(f'/team/{self.team.id}/task/new', data=task_form('second'))
+        first = self.changes(0)['tasks'][0]
+        self.assertEqual(first['title'], 'first')
+
+        self.client.patch('/api/tasks/batch', json={'tasks': [{'id': first['id'], 'status': 'Done'}]})
+        self.client.post(f'/team/{self.team.id}/update', data={'name': 'renamed', 'member_emails': self.user.email})
+        delta = self.changes(version)
+        self.assertFalse(delta['snapshot'])
+        self.assertEqual(delta['version'], version + 3)
+        self.assertEqual(sorted((task['title'], task['status']) for task in delta['tasks']),
+                         [('first', 'Done'), ('second', 'To Do')])
+        self.assertEqual(delta['team'], {'name': 'renamed'})
+
+        self.client.delete('/api/tasks/batch', json={'ids': [first['id']]})
+        delta = self.changes(version + 3)
+        self.assertEqual((delta['tasks'], delta['deleted']), ([], [first['id']]))
+        self.assertEqual(self.changes(version + 4), {'version': version + 4, 'snapshot': False, 'tasks': [], 'deleted': []})
+
+    def test_compacted_log_falls_back_to_a_snapshot(self):
+        self.login()
+        self.client.post(f'/team/{self.team.id}/task/new', data=task_form('old'))
+        self.client.post(f'/team/{self.team.id}/task/new', data=task_form('new', status='Done'))
+        db.session.query(BoardChange).filter(BoardChange.version == 1).update({'date_created': datetime.utcnow() - timedelta(days=30)})
+        db.session.commit()
+        self.assertEqual(compact_changes(), 1)
+
+        self.assertFalse(self.changes(1)['snapshot'])
+        snapshot = self.changes(0)
+        self.assertTrue(snapshot['snapshot'])
+        self.assertEqual([[task['title'] for task in column['tasks']] for column in snapshot['columns']], [['old'], [], ['new']])
+
+    def test_changes_of_other_boards_are_forbidden(self):
+        other = self.make_user('bob')
+        self.login(other)
+        self.assertEqual(self.client.get(f'/api/boards/team-{self.team.id}/changes?since=0').status_code, 403)
+
+    def test_deleting_a_team_drops_its_log(self):
+        self.login()
+        self.client.post(f'/team/{self.team.id}/task/new', data=task_form('card'))
+        self.client.post(f'/team/{self.team.id}/delete')
+        self.assertEqual(BoardChange.query.count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
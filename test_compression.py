@@ -0,0 +1,80 @@
+import csv
+import gzip
+import io
+import unittest
+import zlib
+from test_boards import BoardTestCase, app
+from board.compression import brotli
+
+
+class TestResponseCompression(BoardTestCase):
+    def make_cards(self, count):
+        for i in range(count):
+            self.make_task(f'card {i}', user_id=self.user.id)
+
+    def test_board_page_is_gzipped(self):
+        self.make_cards(20)
+        self.login()
+        plain = self.client.get('/')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertIn('Accept-Encoding', plain.headers['Vary'])
+
+        response = self.client.get('/', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(gzip.decompress(response.data), plain.data)
+        self.assertEqual(int(response.headers['Content-Length']), len(response.data))
+        self.assertLess(len(response.data), len(plain.data) / 3)
+
+    @unittest.skipUnless(brotli, 'brotli is not installed')
+    def test_brotli_is_preferred(self):
+        self.make_cards(20)
+        self.login()
+        plain = self.client.get('/')
+        response = self.client.get('/', headers={'Accept-Encoding': 'gzip, deflate, br'})
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.data), plain.data)
+        response = self.client.get('/', headers={'Accept-Encoding': 'gzip, br;q=0'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+
+    def test_small_responses_are_sent_as_they_are(self):
+        self.login()
+        response = self.client.get(f'/api/boards/team-{self.team.id}/changes?since=0',
+                                   headers={'Accept-Encoding': 'gzip'})
+        self.assertLess(len(response.data), app.config['COMPRESS_MIN_SIZE'])
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_compressed_board_still_revalidates(self):
+        self.login()
+        first = self.client.get('/', headers={'Accept-Encoding': 'gzip'})
+        self.assertTrue(first.headers['ETag'].startswith('W/'))
+        second = self.client.get('/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': first.headers['ETag']})
+        self.assertEqual(second.status_code, 304)
+        self.assertNotIn('Content-Encoding', second.headers)
+
+    def test_streamed_export_is_compressed_chunk_by_chunk(self):
+        app.config['EXPORT_CHUNK_SIZE'] = 2
+        self.addCleanup(app.config.__setitem__, 'EXPORT_CHUNK_SIZE', 1000)
+        for i in range(6):
+            self.make_task(f'task {i}', team_id=self.team.id)
+        self.login()
+        response = self.client.get(f'/api/boards/team-{self.team.id}/export', headers={'Accept-Encoding': 'gzip'},
+                                   buffered=False)
+        self.addCleanup(response.close)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', response.headers)
+
+        # every chunk can be decoded as soon as it arrives
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunks = [decompressor.decompress(chunk) for chunk in response.response]
+        self.assertGreater(len([chunk for chunk in chunks if chunk]), 2)
+        rows = list(csv.DictReader(io.StringIO(b''.join(chunks).decode('utf-8'))))
+        self.assertEqual(len(rows), 6)
+
+    def test_event_streams_are_not_compressed(self):
+        self.login()
+        response = self.client.get(f'/api/boards/team-{self.team.id}/events', headers={'Accept-Encoding': 'gzip'},
+                                   buffered=False)
+        self.addCleanup(response.close)
+        self.assertNotIn('Content-Encoding', response.headers)
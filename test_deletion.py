@@ -0,0 +1,105 @@
+import unittest
+from datetime import datetime
+from test_boards import BoardTestCase, app
+from board import db
+from board.deletion import delete_user_rows, orphaned_tasks, purge_tasks, purge_worker
+from board.migrations import upgrade
+from board.models import Task, Team, User, user_team_association
+from board.ranks import spread_ranks
+
+
+class TestSetBasedDeletion(BoardTestCase):
+    def setUp(self):
+        super().setUp()
+        app.config['DELETE_CHUNK_SIZE'] = 3
+        app.config['DELETE_CHUNK_PAUSE'] = 0
+
+    def tearDown(self):
+        app.config['DELETE_CHUNK_SIZE'] = 5000
+        app.config['DELETE_CHUNK_PAUSE'] = 0.05
+        app.config['DELETE_IN_BACKGROUND'] = True
+        super().tearDown()
+
+    def add_tasks(self, count, **owner):
+        db.session.execute(Task.__table__.insert(), [{'title': f'task {i}', 'description': 'test_description', 'status': 'Done',
+                                                      'priority': 1, 'due_date': datetime(2030, 1, 1), 'rank': rank, **owner}
+                                                     for i, rank in enumerate(spread_ranks(count))])
+        db.session.commit()
+
+    def test_delete_account_does_not_load_tasks(self):
+        app.config['DELETE_IN_BACKGROUND'] = False
+        self.add_tasks(10, user_id=self.user.id)
+        self.add_tasks(2, team_id=self.team.id)
+        user_id, team_id = self.user.id, self.team.id
+        self.login()
+        response, statements = self.count_queries(lambda: self.client.post(f'/account/{user_id}/delete'))
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse([statement for statement in statements if statement.startswith('SELECT') and 'FROM task' in statement])
+        self.assertIsNone(db.session.get(User, user_id))
+        self.assertEqual(Task.query.filter_by(user_id=user_id).count(), 0)
+        self.assertEqual(Task.query.filter_by(team_id=team_id).count(), 2)
+        self.assertEqual(db.session.query(user_team_association).count(), 0)
+
+    def test_delete_team_removes_its_tasks_and_memberships(self):
+        app.config['DELETE_IN_BACKGROUND'] = False
+        self.add_tasks(7, team_id=self.team.id)
+        self.add_tasks(1, user_id=self.user.id)
+        team_id = self.team.id
+        self.login()
+        self.assertEqual(self.client.post(f'/team/{team_id}/delete').status_code, 302)
+        self.assertIsNone(db.session.get(Team, team_id))
+        self.assertEqual(Task.query.count(), 1)
+        self.assertEqual(db.session.query(user_team_association).count(), 0)
+
+    def test_large_owners_finish_in_the_background(self):
+        self.add_tasks(10, team_id=self.team.id)
+        self.login()
+        self.client.post(f'/team/{self.team.id}/delete')
+        purge_worker.submit(lambda: None).result()  # wait for the queued purge
+        db.session.expire_all()
+        self.assertEqual(Task.query.count(), 0)
+
+    def test_purge_orphans(self):
+        self.add_tasks(4, user_id=999)
+        self.add_tasks(2, team_id=999)
+        self.add_tasks(1, user_id=self.user.id)
+        self.assertEqual(Task.query.filter(orphaned_tasks()).count(), 6)
+        purge_tasks(orphaned_tasks())
+        self.assertEqual(Task.query.count(), 1)
+
+    def test_new_accounts_never_get_the_id_of_a_deleted_one(self):
+        self.add_tasks(12, user_id=self.user.id)
+        user_id = self.user.id
+        # the first chunk goes with the account, the rest is left as if the worker restarted before purging it
+        delete_user_rows(user_id)
+        db.session.commit()
+        self.assertEqual(Task.query.filter_by(user_id=user_id).count(), 9)
+
+        newcomer = self.make_user('bob')
+        self.assertGreater(newcomer.id, user_id)
+        self.login(newcomer)
+        self.assertNotIn('task 0', self.client.get('/').get_data(as_text=True))
+
+    def test_upgrade_stops_reusing_team_ids(self):
+        # a team table from before AUTOINCREMENT, whose last team was deleted with tasks left to purge
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql('CREATE TABLE team_old (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR(100) NOT NULL, '
+                                       'date_created DATETIME, shard INTEGER NOT NULL DEFAULT 0)')
+            connection.exec_driver_sql('INSERT INTO team_old SELECT id, name, date_created, shard FROM team')
+            connection.exec_driver_sql('DROP TABLE team')
+            connection.exec_driver_sql('ALTER TABLE team_old RENAME TO team')
+        self.add_tasks(2, team_id=self.team.id + 1)
+        upgrade()
+
+        with db.engine.connect() as connection:
+            sql = connection.exec_driver_sql("SELECT sql FROM sqlite_master WHERE name = 'team'").scalar()
+        self.assertIn('AUTOINCREMENT', sql)
+        self.assertEqual(db.session.get(Team, self.team.id).name, 'test_team')
+        team = Team(name='new')
+        db.session.add(team)
+        db.session.commit()
+        self.assertEqual(team.id, self.team.id + 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
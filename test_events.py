@@ -0,0 +1,83 @@
+import json
+import unittest
+from test_boards import BoardTestCase, app
+from board.events import BoardEventHub, board_events
+
+
+def task_form(title, status='To Do'):
+    return {'title': title, 'description': 'test_description', 'status': status, 'due_date': '2030-01-01', 'priority': '3'}
+
+
+def events(chunk):
+    # the data of the events in a chunk of the stream
+    lines = chunk.decode('utf-8').splitlines()
+    return [json.loads(line[len('data: '):]) for line in lines if line.startswith('data: ')]
+
+
+class TestBoardEvents(BoardTestCase):
+    def setUp(self):
+        super().setUp()
+        app.config['EVENT_HEARTBEAT_SECONDS'] = 0.01
+
+    def tearDown(self):
+        app.config['EVENT_HEARTBEAT_SECONDS'] = 15
+        super().tearDown()
+
+    def open_stream(self, query='', headers=None):
+        response = self.client.get(f'/api/boards/team-{self.team.id}/events{query}', headers=headers)
+        self.addCleanup(response.close)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        return response, iter(response.response)
+
+    def test_committed_changes_are_pushed(self):
+        self.login()
+        response, stream = self.open_stream()
+        self.assertEqual(events(next(stream)), [])
+
+        self.client.post(f'/team/{self.team.id}/task/new', data=task_form('pushed'))
+        pushed = events(next(stream))[0]
+        self.assertEqual((pushed['version'], pushed['tasks'][0]['title'], pushed['tasks'][0]['status']), (1, 'pushed', 'To Do'))
+
+        task_id = pushed['tasks'][0]['id']
+        self.client.patch('/api/tasks/batch', json={'tasks': [{'id': task_id, 'status': 'Done'}]})
+        self.assertEqual(events(next(stream))[0]['tasks'][0]['status'], 'Done')
+        self.client.post(f'/task/{task_id}/delete')
+        self.assertEqual(events(next(stream))[0]['deleted'], [task_id])
+        self.assertEqual(next(stream), b': heartbeat\n\n')
+
+    def test_reconnect_catches_up_from_the_last_event_id(self):
+        self.login()
+        self.client.post(f'/team/{self.team.id}/task/new', data=task_form('first'))
+        self.client.post(f'/team/{self.team.id}/task/new', data=task_form('missed'))
+        _, stream = self.open_stream(headers={'Last-Event-ID': '1'})
+        self.assertEqual([task['title'] for task in events(next(stream))[0]['tasks']], ['missed'])
+
+        _, stream = self.open_stream('?since=99')
+        self.assertTrue(events(next(stream))[0]['snapshot'])
+
+    def test_slow_subscribers_are_dropped(self):
+        hub = BoardEventHub(queue_size=2)
+        slow, fast = hub.subscribe('team-1'), hub.subscribe('team-1')
+        for version in (1, 2):
+            hub.dispatch('team-1', version, 'message')
+        fast.queue.get_nowait()
+        hub.dispatch('team-1', 3, 'message')
+        self.assertTrue(slow.dropped)
+        self.assertFalse(fast.dropped)
+        self.assertEqual(hub.subscribers['team-1'], {fast})
+
+    def test_closed_streams_unsubscribe(self):
+        self.login()
+        response, stream = self.open_stream()
+        next(stream)
+        self.assertTrue(board_events.has_subscribers(f'team-{self.team.id}'))
+        response.close()
+        self.assertFalse(board_events.has_subscribers(f'team-{self.team.id}'))
+
+    def test_other_boards_are_forbidden(self):
+        self.login(self.make_user('bob'))
+        self.assertEqual(self.client.get(f'/api/boards/team-{self.team.id}/events').status_code, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
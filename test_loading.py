@@ -0,0 +1,65 @@
+import unittest
+from test_boards import BoardTestCase, FreshRequestClient, app
+from board import db
+from board.loading import UnplannedLazyLoad
+from board.models import Team
+from board.membership import add_members
+
+
+class EmptySessionClient(FreshRequestClient):
+    # the test case shares its session with the requests. start every request without loaded rows, as in production,
+    # so that the pages run their own queries with their loading policy instead of finding the rows already loaded
+    def open(self, *args, **kwargs):
+        db.session.expunge_all()
+        return super().open(*args, **kwargs)
+
+
+class TestLoadingPolicy(BoardTestCase):
+    def setUp(self):
+        super().setUp()
+        self.team_id = self.team.id
+        app.test_client_class = EmptySessionClient
+        self.client = app.test_client()
+
+    def test_team_page_loads_members_with_one_query(self):
+        add_members(self.team_id, [self.make_user(f'member{i}').id for i in range(2)])
+        db.session.commit()
+        self.login()
+        self.client.get('/about')  # puts the user in the user cache
+        response, few = self.count_queries(lambda: self.client.get(f'/team/{self.team_id}'))
+        self.assertIn(b'member1', response.data)
+        add_members(self.team_id, [self.make_user(f'other{i}').id for i in range(10)])
+        db.session.commit()
+        response, many = self.count_queries(lambda: self.client.get(f'/team/{self.team_id}'))
+        self.assertIn(b'other9', response.data)
+        self.assertEqual(len(many), len(few))
+
+    def test_pages_make_no_unplanned_lazy_loads(self):
+        # RAISE_ON_LAZY_LOAD is on in the tests, so a page that lazily loads a relationship fails with an error
+        task = self.make_task('mine', user_id=self.user.id)
+        team_task = self.make_task('ours', team_id=self.team_id)
+        task_id, team_task_id, team_id = task.id, team_task.id, self.team_id
+        self.login()
+        for url in ('/', '/teams', f'/team/{team_id}', f'/team/{team_id}/tasks', f'/team/{team_id}/update',
+                    f'/task/{task_id}', f'/task/{task_id}/update', '/search?q=mine', '/archive', '/account'):
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+        task_form = {'title': 'changed', 'description': 'test_description', 'status': 'Done', 'due_date': '2030-01-01',
+                     'priority': '3'}
+        for url, data in ((f'/task/{task_id}/update', task_form), (f'/team/{team_id}/task/new', task_form),
+                          (f'/team/{team_id}/update', {'name': 'renamed', 'member_emails': 'alice@example.com'}),
+                          (f'/task/{team_task_id}/delete', {}), (f'/team/{team_id}/delete', {})):
+            self.assertEqual(self.client.post(url, data=data).status_code, 302, url)
+
+    def test_unplanned_lazy_load_fails_in_views(self):
+        with app.test_request_context('/'):
+            team = db.session.get(Team, self.team_id, populate_existing=True)
+            db.session.expire(team, ['members'])
+            self.assertRaises(UnplannedLazyLoad, lambda: team.members)
+        # outside of requests, e.g. in cli commands, lazy loads are allowed
+        team = db.session.get(Team, self.team_id)
+        db.session.expire(team, ['members'])
+        self.assertEqual([member.username for member in team.members], ['alice'])
+
+
+if __name__ == '__main__':
+    unittest.main()
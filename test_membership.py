@@ -0,0 +1,73 @@
+import re
+import unittest
+from flask import g
+from test_boards import BoardTestCase, app
+from board import db
+from board.models import User, Team, user_team_association
+from board.membership import is_member, parse_member_emails
+from board.migrations import upgrade
+
+
+class TestMembership(BoardTestCase):
+    def test_is_member_is_memoized_per_request(self):
+        other = self.make_user('bob')
+        with app.test_request_context():
+            user = db.session.get(User, self.user.id)
+            self.assertTrue(is_member(self.team.id, user))
+            self.assertFalse(is_member(self.team.id, other))
+            _, statements = self.count_queries(lambda: is_member(self.team.id, user))
+            self.assertEqual(statements, [])
+            self.assertEqual(len(g.team_memberships), 2)
+
+    def test_non_members_are_forbidden(self):
+        other = self.make_user('bob')
+        self.login(other)
+        self.assertEqual(self.client.get(f'/team/{self.team.id}').status_code, 403)
+        self.assertEqual(self.client.get(f'/team/{self.team.id}/tasks').status_code, 403)
+
+    def test_members_are_not_loaded(self):
+        self.login()
+        response, statements = self.count_queries(lambda: self.client.get(f'/team/{self.team.id}/tasks'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([statement for statement in statements if 'FROM user, user_team_association' in statement])
+
+    def test_update_team_skips_existing_members(self):
+        self.login()
+        response = self.client.post(f'/team/{self.team.id}/update', data={'name': 'renamed', 'member_emails': self.user.email})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(db.session.query(user_team_association).count(), 1)
+
+    def test_upgrade_dedupes_memberships(self):
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql('DROP TABLE user_team_association')
+            connection.exec_driver_sql('CREATE TABLE user_team_association (user_id INTEGER, team_id INTEGER)')
+            connection.exec_driver_sql(f'INSERT INTO user_team_association VALUES ({self.user.id}, {self.team.id}), '
+                                       f'({self.user.id}, {self.team.id})')
+        upgrade()
+        self.assertEqual(db.session.query(user_team_association).count(), 1)
+
+
+class TestMemberResolution(BoardTestCase):
+    def test_parse_member_emails(self):
+        self.assertEqual(parse_member_emails(' a@example.com, b@example.com,,a@example.com '), ['a@example.com', 'b@example.com'])
+
+    def test_create_team_resolves_members_in_bulk(self):
+        emails = [self.make_user(f'member{i}').email for i in range(20)]
+        self.login()
+        data = {'name': 'big team', 'member_emails': ','.join(emails + [self.user.email, emails[0]])}
+        response, statements = self.count_queries(lambda: self.client.post('/team/new', data=data))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len([statement for statement in statements if re.search(r'FROM user\b', statement)]), 1)
+
+        team = Team.query.filter_by(name='big team').one()
+        self.assertEqual(len(team.members), 21)
+
+    def test_unknown_email_is_rejected(self):
+        self.login()
+        response = self.client.post('/team/new', data={'name': 'team', 'member_emails': 'nobody@example.com'})
+        self.assertIn(b'nobody@example.com does not exist', response.data)
+        self.assertIsNone(Team.query.filter_by(name='team').first())
+
+
+if __name__ == '__main__':
+    unittest.main()
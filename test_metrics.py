@@ -0,0 +1,46 @@
+import unittest
+from test_boards import BoardTestCase, app
+from board.metrics import HISTOGRAMS, request_queries
+
+
+class TestRequestMetrics(BoardTestCase):
+    def setUp(self):
+        super().setUp()
+        for histogram in HISTOGRAMS:
+            histogram.reset()
+
+    def test_server_timing_header(self):
+        self.login()
+        response = self.client.get(f'/team/{self.team.id}/tasks')
+        timings = response.headers.getlist('Server-Timing')
+        self.assertTrue(timings[0].startswith('db;dur='))
+        self.assertIn('queries', timings[0])
+        self.assertTrue(timings[1].startswith('app;dur='))
+
+    def test_slow_queries_are_logged_with_their_route(self):
+        self.login()
+        app.config['SLOW_QUERY_MS'] = 0
+        try:
+            with self.assertLogs(app.logger, 'WARNING') as logs:
+                self.client.get('/')
+        finally:
+            app.config['SLOW_QUERY_MS'] = 100
+        self.assertIn('GET /', logs.output[0])
+
+    def test_metrics_are_admin_only(self):
+        self.login()
+        self.client.get('/about')
+        self.assertEqual(self.client.get('/admin/metrics').status_code, 403)
+
+        app.config['ADMIN_EMAILS'] = [self.user.email]
+        try:
+            body = self.client.get('/admin/metrics').data.decode()
+        finally:
+            app.config['ADMIN_EMAILS'] = []
+        self.assertIn('kanban_request_queries_count{endpoint="board.about"} 1', body)
+        self.assertIn('kanban_user_cache_hits_total', body)
+        self.assertIn('board.about', request_queries.series)
+
+
+if __name__ == '__main__':
+    unittest.main()
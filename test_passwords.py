@@ -0,0 +1,64 @@
+import threading
+import unittest
+from test_boards import BoardTestCase, app
+from board import bcrypt, db, passwords
+from board.models import User
+from board.passwords import PasswordHasher, PasswordHasherBusy, calibrate_rounds, hash_rounds
+
+
+class TestPasswordHasher(BoardTestCase):
+    def test_hash_and_check(self):
+        hashed = passwords.hash('secret')
+        self.assertEqual(hash_rounds(hashed), app.config['BCRYPT_LOG_ROUNDS'])
+        self.assertTrue(passwords.check(hashed, 'secret'))
+        self.assertFalse(passwords.check(hashed, 'wrong'))
+
+    def test_full_pool_rejects_at_once(self):
+        hasher = PasswordHasher(bcrypt, 4, workers=1, queue_size=0)
+        started, release = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            release.wait()
+
+        worker = threading.Thread(target=hasher.run, args=('hash', slow))
+        worker.start()
+        started.wait()
+        try:
+            with self.assertRaises(PasswordHasherBusy):
+                hasher.check(passwords.hash('secret'), 'secret')
+        finally:
+            release.set()
+            worker.join()
+        self.assertEqual(hasher.stats()['rejected'], 1)
+        self.assertTrue(hasher.check(passwords.hash('secret'), 'secret'))
+
+    def test_busy_login_answers_503(self):
+        slots = passwords.slots
+        passwords.slots = threading.BoundedSemaphore(1)
+        passwords.slots.acquire()
+        try:
+            response = self.login()
+        finally:
+            passwords.slots = slots
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '2')
+
+    def test_outdated_hashes_are_upgraded_at_login(self):
+        user = db.session.get(User, self.user.id)
+        user.password = bcrypt.generate_password_hash('password', 4).decode('utf-8')
+        db.session.commit()
+        passwords.rounds, rounds = 5, passwords.rounds
+        try:
+            self.assertEqual(self.login().status_code, 302)
+        finally:
+            passwords.rounds = rounds
+        self.assertEqual(hash_rounds(db.session.get(User, self.user.id).password), 5)
+
+    def test_calibration_respects_the_minimum(self):
+        self.assertEqual(calibrate_rounds(target_ms=0.001, min_rounds=10), 10)
+        self.assertGreaterEqual(calibrate_rounds(target_ms=1000, min_rounds=4), 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import random
+import unittest
+from sqlalchemy import inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.schema import CreateTable
+from test_boards import BoardTestCase, app
+from board import db
+from board.boards import load_board, load_column
+from board.migrations import upgrade
+from board.models import Task, Team
+from board.ranks import rank_between, ranks_between, rebalance_column, rebalance_worker, spread_ranks
+
+
+class TestRankKeys(unittest.TestCase):
+    def test_rank_between_sorts_between_its_neighbours(self):
+        rng = random.Random(1)
+        ranks = [rank_between('', None)]
+        for _ in range(2000):
+            position = rng.randint(0, len(ranks))
+            before = ranks[position - 1] if position else ''
+            after = ranks[position] if position < len(ranks) else None
+            rank = rank_between(before, after)
+            self.assertTrue(before < rank and (after is None or rank < after))
+            self.assertFalse(rank.endswith('0'))
+            ranks.insert(position, rank)
+        self.assertEqual(ranks, sorted(ranks))
+        self.assertRaises(ValueError, rank_between, 'V', 'V')
+
+    def test_many_ranks_at_once(self):
+        ranks = ranks_between('', 'V', 100)
+        self.assertEqual(ranks, sorted(set(ranks)))
+        self.assertLess(ranks[-1], 'V')
+        self.assertLessEqual(max(len(rank) for rank in ranks), 3)
+
+    def test_spread_ranks(self):
+        for count in (0, 1, 61, 62, 5000):
+            ranks = spread_ranks(count)
+            self.assertEqual(ranks, sorted(set(ranks)))
+            self.assertFalse([rank for rank in ranks if rank.endswith('0')])
+
+    def test_ranks_compare_as_bytes_on_every_database(self):
+        self.assertIn('COLLATE "C"', str(CreateTable(Task.__table__).compile(dialect=postgresql.dialect())))
+        self.assertNotIn('COLLATE', str(CreateTable(Task.__table__).compile(dialect=sqlite.dialect())))
+
+
+class TestCardOrder(BoardTestCase):
+    def titles(self, status='To Do'):
+        return [task.title for task in load_column(status, team=db.session.get(Team, self.team.id)).tasks]
+
+    def move(self, task_id, status='To Do', after=None):
+        return self.client.post(f'/api/tasks/{task_id}/move', json={'status': status, 'after': after})
+
+    def test_new_cards_go_on_top(self):
+        for title in ('a', 'b', 'c'):
+            self.make_task(title, team_id=self.team.id)
+        self.assertEqual(self.titles(), ['c', 'b', 'a'])
+        self.login()
+        response = self.client.post('/api/tasks/batch', json={'tasks': [
+            {'title': title, 'description': 'test_description', 'status': 'To Do', 'due_date': '2030-01-01',
+             'priority': 1, 'team_id': self.team.id} for title in ('d', 'e')]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.titles(), ['d', 'e', 'c', 'b', 'a'])
+
+    def test_move_writes_one_row(self):
+        a, b, c = [self.make_task(title, team_id=self.team.id).id for title in ('a', 'b', 'c')]
+        self.login()
+        response, statements = self.count_queries(lambda: self.move(c, after=a))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len([statement for statement in statements if statement.startswith('UPDATE task')]), 1)
+        self.assertEqual(self.titles(), ['b', 'a', 'c'])
+
+        self.assertEqual(self.move(a).status_code, 200)
+        self.assertEqual(self.titles(), ['a', 'b', 'c'])
+        self.assertEqual(self.move(b, status='Done').status_code, 200)
+        self.assertEqual((self.titles(), self.titles('Done')), (['a', 'c'], ['b']))
+        self.assertIsNotNone(db.session.get(Task, b).date_done)
+
+    def test_move_checks_the_column_and_board(self):
+        a = self.make_task('a', team_id=self.team.id).id
+        done = self.make_task('done', status='Done', team_id=self.team.id).id
+        theirs = self.make_task('theirs', user_id=self.make_user('bob').id).id
+        self.login()
+        self.assertEqual(self.move(a, after=done).status_code, 400)
+        self.assertEqual(self.move(a, status='Later').status_code, 400)
+        self.assertEqual(self.move(theirs).status_code, 403)
+
+    def test_rebalance_keeps_the_order(self):
+        ids = [self.make_task(f'task {i}', team_id=self.team.id).id for i in range(5)]
+        self.login()
+        # squeezing cards into the same gap makes ranks longer
+        for task_id in ids[1:]:
+            self.move(task_id, after=ids[0])
+        order = self.titles()
+        self.assertEqual(rebalance_column(f'team-{self.team.id}', 'To Do'), 5)
+        self.assertEqual(self.titles(), order)
+        self.assertLessEqual(max(len(task.rank) for task in Task.query), 2)
+
+    def test_long_ranks_are_rebalanced_in_the_background(self):
+        app.config['RANK_REBALANCE_LENGTH'] = 3
+        try:
+            ids = [self.make_task(f'task {i}', team_id=self.team.id).id for i in range(30)]
+            rebalance_worker.submit(lambda: None).result()
+            db.session.expire_all()
+            self.assertLessEqual(max(len(task.rank) for task in Task.query), 3)
+            self.assertEqual(self.titles(), [f'task {i}' for i in reversed(range(30))])
+        finally:
+            app.config['RANK_REBALANCE_LENGTH'] = 24
+
+    def test_upgrade_ranks_existing_cards_by_priority(self):
+        self.make_task('low', priority=1, team_id=self.team.id)
+        self.make_task('high', priority=9, team_id=self.team.id)
+        with db.engine.begin() as connection:
+            for index in Task.__table__.indexes:
+                index.drop(connection)
+            connection.exec_driver_sql('ALTER TABLE task DROP COLUMN rank')
+        upgrade()
+        self.assertIn('ix_task_team_rank', {index['name'] for index in inspect(db.engine).get_indexes('task')})
+        db.session.expire_all()
+        self.assertEqual([task.title for task in load_board(team=db.session.get(Team, self.team.id))[0].tasks], ['high', 'low'])
+
+
+if __name__ == '__main__':
+    unittest.main()
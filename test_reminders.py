@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from test_boards import BoardTestCase
+from board import db
+from board.models import Reminder, Task
+from board.reminders import OutboxSink, ReminderScheduler
+
+
+class ListSink:
+    # keeps what was sent. fails the first `failures` batches
+    def __init__(self, failures=0):
+        self.sent = []
+        self.failures = failures
+
+    def send(self, reminders):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('sink is down')
+        self.sent.extend((reminder['title'], reminder['kind']) for reminder in reminders)
+
+
+class TestReminders(BoardTestCase):
+    def scheduler(self, sink, window=timedelta(hours=1)):
+        return ReminderScheduler(sink, lead=timedelta(hours=24), window=window, batch_size=500)
+
+    def test_reminders_are_sent_as_tasks_come_due(self):
+        # due on january 2nd: due soon from the start of that day, overdue once it has ended
+        self.make_task('soon', due_date=datetime(2030, 1, 2), user_id=self.user.id)
+        self.make_task('done', status='Done', due_date=datetime(2030, 1, 2), user_id=self.user.id)
+        self.make_task('later', due_date=datetime(2030, 1, 5), team_id=self.team.id)
+        sink = ListSink()
+        scheduler = self.scheduler(sink)
+        scheduler.start(datetime(2030, 1, 1, 12))
+
+        self.assertEqual(scheduler.tick(datetime(2030, 1, 1, 23, 59)), 0)
+        self.assertEqual(scheduler.tick(datetime(2030, 1, 2, 0, 0)), 1)
+        self.assertEqual(scheduler.tick(datetime(2030, 1, 3, 0, 30)), 1)
+        self.assertEqual(sink.sent, [('soon', 'due soon'), ('soon', 'overdue')])
+
+    def test_changed_tasks_are_rescheduled(self):
+        moved = self.make_task('moved', due_date=datetime(2030, 1, 2), user_id=self.user.id)
+        finished = self.make_task('finished', due_date=datetime(2030, 1, 2), user_id=self.user.id)
+        deleted = self.make_task('deleted', due_date=datetime(2030, 1, 2), user_id=self.user.id)
+        sink = ListSink()
+        scheduler = self.scheduler(sink, window=timedelta(days=3))
+        scheduler.start(datetime(2030, 1, 1, 12))
+        self.assertEqual(len(scheduler.schedules[0].heap), 6)
+
+        self.login()
+        self.client.post('/task/new', data={'title': 'created', 'description': 'd', 'status': 'To Do',
+                                            'due_date': '2030-01-02', 'priority': 1})
+        self.client.post(f'/task/{moved.id}/update', data={'title': 'moved', 'description': 'd', 'status': 'To Do',
+                                                           'due_date': '2030-01-20', 'priority': 1})
+        self.client.patch('/api/tasks/batch', json={'tasks': [{'id': finished.id, 'status': 'Done'}]})
+        self.client.post(f'/task/{deleted.id}/delete')
+
+        scheduler.tick(datetime(2030, 1, 2, 0, 30))
+        scheduler.tick(datetime(2030, 1, 3, 0, 30))
+        self.assertEqual(sink.sent, [('created', 'due soon'), ('created', 'overdue')])
+
+    def test_failed_batches_are_sent_again(self):
+        self.make_task('soon', due_date=datetime(2030, 1, 2), user_id=self.user.id)
+        sink = ListSink(failures=1)
+        scheduler = self.scheduler(sink)
+        scheduler.start(datetime(2030, 1, 1, 12))
+        with self.assertLogs(level='ERROR'):
+            self.assertEqual(scheduler.tick(datetime(2030, 1, 2, 0, 30)), 0)
+        self.assertEqual(scheduler.tick(datetime(2030, 1, 2, 0, 31)), 1)
+        self.assertEqual(sink.sent, [('soon', 'due soon')])
+
+    def test_outbox_is_written_once_across_restarts(self):
+        task = self.make_task('soon', due_date=datetime(2030, 1, 2), team_id=self.team.id)
+        self.scheduler(OutboxSink()).start(datetime(2030, 1, 1, 12))
+        for _ in range(2):
+            # a restarted scheduler carries on from where the last one stopped
+            scheduler = self.scheduler(OutboxSink())
+            scheduler.start(datetime(2030, 1, 2, 0, 30))
+            scheduler.tick(datetime(2030, 1, 2, 0, 30))
+        reminders = db.session.scalars(db.select(Reminder)).all()
+        self.assertEqual([(reminder.task_id, reminder.board_key, reminder.kind) for reminder in reminders],
+                         [(task.id, f'team-{self.team.id}', 'due soon')])
+        self.assertIsNone(reminders[0].date_sent)
+
+    def test_only_the_tasks_coming_due_are_read(self):
+        db.session.execute(Task.__table__.insert(), [
+            {'title': f'far {i}', 'description': 'd', 'due_date': datetime(2031, 1, 1) + timedelta(days=i % 300),
+             'priority': 1, 'status': 'To Do', 'user_id': self.user.id, 'rank': 'V'} for i in range(300)])
+        self.make_task('soon', due_date=datetime(2030, 1, 2), user_id=self.user.id)
+        scheduler = self.scheduler(ListSink())
+        scheduler.start(datetime(2030, 1, 1, 23, 30))
+        self.assertEqual([entry[1:3] for entry in scheduler.schedules[0].heap], [(301, 'due soon')])
+
+        plan = db.session.execute(text("EXPLAIN QUERY PLAN SELECT id, due_date FROM task WHERE status IN ('To Do', "
+                                       "'In Progress') AND due_date >= '2030-01-01' AND due_date < '2030-01-03'")).all()
+        self.assertIn('ix_task_due', ' '.join(row[-1] for row in plan))
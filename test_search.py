@@ -0,0 +1,66 @@
+import unittest
+from test_boards import BoardTestCase
+from board import db
+from board.models import Team, User
+from board.migrations import upgrade
+from board.search import match_expression, search_tasks
+
+
+class TestTaskSearch(BoardTestCase):
+    def titles(self, query, **board):
+        tasks, _ = search_tasks(query, **board)
+        return [task.title for task in tasks]
+
+    def test_index_follows_task_writes(self):
+        user = db.session.get(User, self.user.id)
+        task = self.make_task('Fix the login page', user_id=self.user.id)
+        self.assertEqual(self.titles('login', user=user), ['Fix the login page'])
+
+        task.title = 'Fix the signup page'
+        db.session.commit()
+        self.assertEqual(self.titles('login', user=user), [])
+        self.assertEqual(self.titles('signup', user=user), ['Fix the signup page'])
+
+        db.session.delete(task)
+        db.session.commit()
+        self.assertEqual(self.titles('signup', user=user), [])
+
+    def test_search_is_scoped_to_the_board(self):
+        self.make_task('deploy personal', user_id=self.user.id)
+        self.make_task('deploy team', team_id=self.team.id)
+        self.assertEqual(self.titles('deploy', team=db.session.get(Team, self.team.id)), ['deploy team'])
+
+    def test_prefix_ranking_and_pagination(self):
+        self.make_task('report', description='unrelated', team_id=self.team.id)
+        self.make_task('other', description='the quarterly report is late, report it', team_id=self.team.id)
+        for i in range(3):
+            self.make_task(f'filler {i}', description='report', team_id=self.team.id)
+        team = db.session.get(Team, self.team.id)
+        self.assertEqual(self.titles('repo', team=team, per_page=1), ['report'])
+        tasks, has_next = search_tasks('repo', team=team, page=5, per_page=1)
+        self.assertEqual(len(tasks), 1)
+        self.assertFalse(has_next)
+
+    def test_user_input_is_not_fts_syntax(self):
+        self.assertEqual(match_expression('title:"x OR y'), '"title" "x" "OR" "y"*')
+        self.assertIsNone(match_expression('  ::  '))
+
+    def test_upgrade_indexes_existing_tasks(self):
+        self.make_task('legacy card', user_id=self.user.id)
+        with db.engine.begin() as connection:
+            for name in ('task_fts_insert', 'task_fts_update', 'task_fts_delete'):
+                connection.exec_driver_sql(f'DROP TRIGGER {name}')
+            connection.exec_driver_sql('DROP TABLE task_fts')
+        upgrade()
+        self.assertEqual(self.titles('legacy', user=db.session.get(User, self.user.id)), ['legacy card'])
+
+    def test_search_page(self):
+        self.make_task('searchable card', team_id=self.team.id)
+        self.login()
+        response = self.client.get(f'/search?board=team-{self.team.id}&q=searchable')
+        self.assertIn(b'searchable card', response.data)
+        self.assertEqual(self.client.get('/search?board=team-999&q=x').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import time
+import unittest
+from test_boards import BoardTestCase
+from board.sessions import LocalUserCache, UserSnapshot, user_cache
+
+
+class TestUserSessionCache(BoardTestCase):
+    def test_authenticated_requests_skip_the_user_lookup(self):
+        self.login()
+        self.client.get('/about')
+        hits = user_cache.hits
+        response, statements = self.count_queries(lambda: self.client.get('/about'))
+        self.assertIn(b'alice', response.data)
+        self.assertEqual(user_cache.hits, hits + 1)
+        self.assertFalse([statement for statement in statements if 'FROM user' in statement])
+
+    def test_account_update_invalidates_the_snapshot(self):
+        self.login()
+        self.client.get('/about')
+        self.client.post('/account', data={'username': 'alicia', 'email': self.user.email})
+        self.assertIn(b'alicia', self.client.get('/about').data)
+
+    def test_deleted_account_is_logged_out(self):
+        self.login()
+        self.client.get('/about')
+        self.client.post(f'/account/{self.user.id}/delete')
+        self.assertNotIn(b'alice', self.client.get('/about').data)
+
+    def test_local_cache_expires_snapshots(self):
+        cache = LocalUserCache(max_users=2, ttl=0.01)
+        cache.set(UserSnapshot(1, 'alice', 'alice@example.com'))
+        self.assertEqual(cache.get(1).username, 'alice')
+        time.sleep(0.02)
+        self.assertIsNone(cache.get(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from test_boards import FreshRequestClient
+from board import bcrypt, create_app, db
+from board.cache import fragment_cache
+from board.migrations import upgrade
+from board.models import Reminder, Team, User
+from board.reminders import OutboxSink, ReminderScheduler
+from board.sessions import user_cache
+from board.shards import plan_moves, shard_engine, task_shard
+from board.storage import SHARDED_TABLES
+
+# a home database and two shards, in files of their own
+folder = tempfile.mkdtemp()
+sharded_app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(folder, 'home.db'), 'SHARD_COUNT': 2,
+                          'TEMPLATE_CACHE_DIR': tempfile.mkdtemp(), 'DELETE_IN_BACKGROUND': False})
+
+
+class TestShards(unittest.TestCase):
+    def setUp(self):
+        sharded_app.config['TESTING'] = True
+        sharded_app.config['WTF_CSRF_ENABLED'] = False
+        self.ctx = sharded_app.app_context()
+        self.ctx.push()
+        upgrade()
+        fragment_cache.clear()
+        user_cache.backend.clear()
+        sharded_app.test_client_class = FreshRequestClient
+        self.client = sharded_app.test_client()
+        self.user = User(username='alice', email='alice@example.com',
+                         password=bcrypt.generate_password_hash('password').decode('utf-8'))
+        db.session.add(self.user)
+        db.session.commit()
+        self.client.post('/login', data={'email': 'alice@example.com', 'password': 'password'})
+
+    def tearDown(self):
+        db.session.remove()
+        tables = [db.metadata.tables[name] for name in SHARDED_TABLES]
+        for shard in (1, 2):
+            db.metadata.drop_all(shard_engine(shard), tables=tables)
+        db.drop_all()
+        self.ctx.pop()
+
+    def make_team(self, name):
+        self.client.post('/team/new', data={'name': name, 'member_emails': 'alice@example.com'})
+        return db.session.scalars(db.select(Team).where(Team.name == name)).one()
+
+    def make_tasks(self, tasks):
+        # tasks are (title, team or None) pairs, created with the batch api. returns their ids
+        items = [{'title': title, 'description': 'd', 'status': 'To Do', 'due_date': '2030-01-01', 'priority': 1,
+                  'team_id': team.id if team else None} for title, team in tasks]
+        response = self.client.post('/api/tasks/batch', json={'tasks': items})
+        self.assertEqual(response.status_code, 201, response.get_json())
+        return response.get_json()['ids']
+
+    def titles_in(self, shard):
+        with shard_engine(shard).connect() as connection:
+            return sorted(connection.scalars(text('SELECT title FROM task')))
+
+    def test_teams_are_placed_on_the_shards_and_their_tasks_follow(self):
+        first, second = self.make_team('first'), self.make_team('second')
+        self.assertEqual({first.shard, second.shard}, {1, 2})
+        ids = self.make_tasks([('mine', None), ('first task', first), ('second task', second), ('also first', first)])
+
+        # the ids come back in the order sent, each in the range of its shard
+        self.assertEqual([task_shard(task_id) for task_id in ids], [0, first.shard, second.shard, first.shard])
+        self.assertEqual(self.titles_in(0), ['mine'])
+        self.assertEqual(self.titles_in(first.shard), ['also first', 'first task'])
+        self.assertEqual(self.titles_in(second.shard), ['second task'])
+
+        # views read from the right database without knowing about shards
+        board = self.client.get(f'/team/{first.id}/tasks').get_data(as_text=True)
+        self.assertIn('first task', board)
+        self.assertNotIn('second task', board)
+        self.assertIn('mine', self.client.get('/').get_data(as_text=True))
+        self.assertIn('second task', self.client.get(f'/task/{ids[2]}').get_data(as_text=True))
+        teams = self.client.get('/teams').get_data(as_text=True)
+        self.assertIn('first', teams)
+        results = self.client.get(f'/search?board=team-{first.id}&q=first').get_data(as_text=True)
+        self.assertIn('also first', results)
+
+    def test_batch_changes_span_shards(self):
+        first, second = self.make_team('first'), self.make_team('second')
+        ids = self.make_tasks([('mine', None), ('first task', first), ('second task', second)])
+        response = self.client.patch('/api/tasks/batch', json={'tasks': [{'id': task_id, 'status': 'Done'} for task_id in ids]})
+        self.assertEqual(response.get_json(), {'updated': 3})
+        for shard in (0, 1, 2):
+            with shard_engine(shard).connect() as connection:
+                self.assertEqual(set(connection.scalars(text('SELECT status FROM task'))), {'Done'})
+                # the counters of each board are kept in the shard of the board
+                self.assertEqual(set(connection.scalars(text('SELECT status FROM board_count'))), {'Done'})
+
+        response = self.client.delete('/api/tasks/batch', json={'ids': ids[1:]})
+        self.assertEqual(response.get_json(), {'deleted': 2})
+        self.assertEqual(self.titles_in(first.shard) + self.titles_in(second.shard), [])
+        changes = self.client.get(f'/api/boards/team-{first.id}/changes?since=2').get_json()
+        self.assertEqual(changes['deleted'], [ids[1]])
+
+    def test_moved_team_keeps_its_board_and_old_links(self):
+        team = self.make_team('movers')
+        ids = self.make_tasks([('one', team), ('two', team)])
+        source, target = team.shard, 3 - team.shard
+
+        result = sharded_app.test_cli_runner().invoke(args=['move-team', str(team.id), str(target)])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Moved 2 tasks', result.output)
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Team, team.id).shard, target)
+        self.assertEqual(self.titles_in(source), [])
+        self.assertEqual(self.titles_in(target), ['one', 'two'])
+
+        board = self.client.get(f'/team/{team.id}/tasks').get_data(as_text=True)
+        self.assertIn('one', board)
+        response = self.client.get(f'/task/{ids[0]}')
+        self.assertEqual(response.status_code, 308)
+        new_id = int(response.headers['Location'].rsplit('/', 1)[1])
+        self.assertEqual(task_shard(new_id), target)
+        self.assertIn('one', self.client.get(f'/task/{new_id}').get_data(as_text=True))
+        # clients holding the old version get a snapshot with the new ids
+        changes = self.client.get(f'/api/boards/team-{team.id}/changes?since=2').get_json()
+        self.assertTrue(changes['snapshot'])
+        self.assertEqual(self.client.get('/task/12345').status_code, 404)
+
+    def test_rebalance_moves_teams_out_of_the_home_database(self):
+        # a team from before sharding, with its tasks at home
+        legacy = Team(name='legacy', shard=0)
+        legacy.members.append(self.user)
+        db.session.add(legacy)
+        db.session.commit()
+        self.make_tasks([('old task', legacy)])
+        self.assertEqual(self.titles_in(0), ['old task'])
+
+        result = sharded_app.test_cli_runner().invoke(args=['rebalance-shards'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        db.session.expire_all()
+        shard = db.session.get(Team, legacy.id).shard
+        self.assertIn(shard, (1, 2))
+        self.assertEqual(self.titles_in(0), [])
+        self.assertEqual(self.titles_in(shard), ['old task'])
+        self.assertIn('old task', self.client.get(f'/team/{legacy.id}/tasks').get_data(as_text=True))
+
+    def test_plan_moves_evens_out_the_shards(self):
+        teams = {1: (1, 100), 2: (1, 60), 3: (1, 40), 4: (2, 10), 5: (0, 30)}
+        moves = dict(plan_moves(teams, 2))
+        self.assertEqual(moves[5], 2)
+        load = {1: 0, 2: 0}
+        for team_id, (shard, size) in teams.items():
+            load[moves.get(team_id, shard)] += size
+        self.assertLessEqual(abs(load[1] - load[2]), 20)
+        self.assertEqual(plan_moves({1: (1, 5), 2: (2, 5)}, 2), [])
+
+    def test_purge_orphans_clears_tasks_left_on_another_shard(self):
+        team = self.make_team('team')
+        self.make_tasks([('kept', team)])
+        # e.g. written by a request that was waiting for the old shard while the team moved
+        with shard_engine(3 - team.shard).begin() as connection:
+            connection.execute(text("INSERT INTO task (title, description, due_date, priority, status, team_id, rank) "
+                                    "VALUES ('stray', 'd', '2030-01-01', 1, 'To Do', :team_id, 'V')"), {'team_id': team.id})
+        result = sharded_app.test_cli_runner().invoke(args=['purge-orphans'])
+        self.assertIn('Deleted 1 orphaned tasks.', result.output)
+        self.assertEqual(self.titles_in(3 - team.shard), [])
+        self.assertEqual(self.titles_in(team.shard), ['kept'])
+
+    def test_reminders_are_sent_from_every_shard(self):
+        first, second = self.make_team('first'), self.make_team('second')
+        self.make_tasks([('mine', None), ('first task', first), ('second task', second)])
+        scheduler = ReminderScheduler(OutboxSink(), lead=timedelta(hours=24), window=timedelta(hours=1), batch_size=500)
+        scheduler.start(datetime(2029, 12, 31, 12))
+        self.assertEqual(scheduler.tick(datetime(2030, 1, 1, 0, 30)), 3)
+        reminders = db.session.scalars(db.select(Reminder).order_by(Reminder.board_key)).all()
+        self.assertEqual([(reminder.title, reminder.board_key) for reminder in reminders],
+                         [('first task', f'team-{first.id}'), ('second task', f'team-{second.id}'), ('mine', 'user-1')])
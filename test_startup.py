@@ -0,0 +1,73 @@
+import os
+import tempfile
+from test_boards import BoardTestCase, app
+from board import create_app, db
+from board.startup import load_templates, warm_up
+
+
+class TestAppFactory(BoardTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = tempfile.mkdtemp()
+
+    def make_app(self, **config):
+        return create_app(dict({'TEMPLATE_CACHE_DIR': self.cache_dir}, **config))
+
+    def compile_templates(self, other):
+        # the cli runs in the app context already pushed, so push the one of the app under test
+        with other.app_context():
+            return other.test_cli_runner().invoke(args=['compile-templates'])
+
+    def cached_files(self):
+        return {name: os.path.getmtime(os.path.join(self.cache_dir, name)) for name in os.listdir(self.cache_dir)}
+
+    def test_apps_are_independent(self):
+        other = self.make_app(BOARD_PAGE_SIZE=7)
+        self.assertIsNot(other, app)
+        self.assertEqual(other.config['BOARD_PAGE_SIZE'], 7)
+        self.assertNotEqual(app.config['BOARD_PAGE_SIZE'], 7)
+        self.assertEqual({rule.endpoint for rule in other.url_map.iter_rules()},
+                         {rule.endpoint for rule in app.url_map.iter_rules()})
+        self.assertEqual(other.test_client().get('/about').status_code, 200)
+
+    def test_compile_templates_fills_the_bytecode_cache(self):
+        other = self.make_app()
+        result = self.compile_templates(other)
+        self.assertEqual(result.exit_code, 0, result.output)
+        templates = other.jinja_env.list_templates(extensions=['html'])
+        self.assertIn(f'Compiled {len(templates)} templates', result.output)
+        self.assertEqual(len(self.cached_files()), len(templates))
+
+    def test_workers_read_compiled_templates(self):
+        self.compile_templates(self.make_app())
+        compiled = self.cached_files()
+        # a new worker loads every template from the cache and compiles none
+        load_templates(self.make_app())
+        self.assertEqual(self.cached_files(), compiled)
+
+    def test_changed_template_is_compiled_again(self):
+        other = self.make_app()
+        folder = tempfile.mkdtemp()
+        other.jinja_loader.searchpath = [folder]
+        path = os.path.join(folder, 'about.html')
+        with open(path, 'w') as template:
+            template.write('first')
+        self.assertEqual(other.jinja_env.get_template('about.html').render(), 'first')
+        with open(path, 'w') as template:
+            template.write('second')
+        # what a restarted worker does: nothing in memory, the old bytecode on disk
+        other.jinja_env.cache.clear()
+        self.assertEqual(other.jinja_env.get_template('about.html').render(), 'second')
+
+    def test_no_template_cache(self):
+        other = create_app({'TEMPLATE_CACHE_DIR': ''})
+        self.assertIsNone(other.jinja_env.bytecode_cache)
+        self.assertEqual(other.test_client().get('/about').status_code, 200)
+
+    def test_warm_up(self):
+        other = self.make_app()
+        warm_up(other)
+        self.assertEqual(len(self.cached_files()), len(other.jinja_env.list_templates(extensions=['html'])))
+        with other.app_context():
+            pool = db.engine.pool
+            self.assertEqual(pool.checkedin(), pool.size())
@@ -0,0 +1,77 @@
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import delete, update
+from test_boards import BoardTestCase
+from board import db
+from board.models import BoardCount, Task, Team
+from board.migrations import upgrade
+from board.stats import board_stats, reconcile_board_counts
+
+
+class TestBoardCounters(BoardTestCase):
+    def stats(self, key):
+        return board_stats([key])[key]
+
+    def test_counters_follow_task_writes(self):
+        team_key = f'team-{self.team.id}'
+        task = self.make_task('card', team_id=self.team.id)
+        self.make_task('late', due_date=datetime.utcnow() - timedelta(days=3), team_id=self.team.id)
+        self.make_task('late and done', status='Done', due_date=datetime.utcnow() - timedelta(days=3), team_id=self.team.id)
+        self.assertEqual(self.stats(team_key).counts, {'To Do': 2, 'In Progress': 0, 'Done': 1})
+        self.assertEqual(self.stats(team_key).overdue, 1)
+
+        task.status = 'In Progress'
+        db.session.commit()
+        self.assertEqual(self.stats(team_key).counts, {'To Do': 1, 'In Progress': 1, 'Done': 1})
+
+        # bulk statements of the batch api go through the same triggers
+        db.session.execute(update(Task).where(Task.title == 'late').values(status='Done'))
+        db.session.execute(delete(Task).where(Task.id == task.id))
+        db.session.commit()
+        self.assertEqual(self.stats(team_key), ({'To Do': 0, 'In Progress': 0, 'Done': 2}, 0))
+        self.assertEqual(reconcile_board_counts(db.session.connection()), [])
+
+    def test_moving_a_task_between_boards(self):
+        task = self.make_task('mine', user_id=self.user.id)
+        task.team_id = self.team.id
+        db.session.commit()
+        stats = board_stats([f'user-{self.user.id}', f'team-{self.team.id}'])
+        self.assertEqual(stats[f'user-{self.user.id}'].counts['To Do'], 0)
+        self.assertEqual(stats[f'team-{self.team.id}'].counts['To Do'], 1)
+
+    def test_reconcile_repairs_drift(self):
+        self.make_task('card', team_id=self.team.id)
+        db.session.execute(update(BoardCount).values(count=7))
+        db.session.commit()
+        with db.engine.begin() as connection:
+            self.assertEqual(reconcile_board_counts(connection, repair=False), [f'team-{self.team.id}'])
+            self.assertEqual(reconcile_board_counts(connection), [f'team-{self.team.id}'])
+            self.assertEqual(reconcile_board_counts(connection), [])
+        self.assertEqual(self.stats(f'team-{self.team.id}').counts['To Do'], 1)
+
+    def test_upgrade_counts_existing_tasks(self):
+        self.make_task('legacy', user_id=self.user.id)
+        with db.engine.begin() as connection:
+            for name in ('task_count_insert', 'task_count_update', 'task_count_delete'):
+                connection.exec_driver_sql(f'DROP TRIGGER {name}')
+            connection.exec_driver_sql('DELETE FROM board_count')
+        upgrade()
+        self.assertEqual(self.stats(f'user-{self.user.id}').counts['To Do'], 1)
+        self.make_task('new', user_id=self.user.id)
+        self.assertEqual(self.stats(f'user-{self.user.id}').counts['To Do'], 2)
+
+    def test_teams_page_shows_counts_without_reading_tasks(self):
+        other = Team(name='other team')
+        other.members.append(db.session.merge(self.user))
+        db.session.add(other)
+        db.session.commit()
+        self.make_task('late', due_date=datetime.utcnow() - timedelta(days=1), team_id=self.team.id)
+        self.login()
+        response, statements = self.count_queries(lambda: self.client.get('/teams'))
+        self.assertIn(b'1 To Do / 0 In Progress / 0 Done, 1 overdue', response.data)
+        self.assertIn(b'0 To Do / 0 In Progress / 0 Done', response.data)
+        self.assertFalse([statement for statement in statements if 'FROM task' in statement])
+
+
+if __name__ == '__main__':
+    unittest.main()
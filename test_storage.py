@@ -0,0 +1,78 @@
+import sqlite3
+import threading
+import time
+import unittest
+from test_boards import BoardTestCase
+from board import db
+from board.boards import load_board
+from board.models import Team
+from board.storage import database_uri, engine_options, shard_uri
+
+
+class TestStorageConfiguration(unittest.TestCase):
+    def test_server_database_gets_pool_settings(self):
+        environ = {'DATABASE_URL': 'postgres://kanban@db/kanban', 'DB_POOL_SIZE': '20', 'DB_POOL_PRE_PING': 'false'}
+        uri = database_uri(environ)
+        self.assertEqual(uri, 'postgresql://kanban@db/kanban')
+        options = engine_options(uri, environ)
+        self.assertEqual(options['pool_size'], 20)
+        self.assertFalse(options['pool_pre_ping'])
+        self.assertNotIn('connect_args', options)
+
+    def test_shards_are_sqlite_files(self):
+        self.assertEqual(shard_uri(None, 'sqlite:////data/kanban.db', 2), 'sqlite:////data/kanban-shard-2.db')
+        self.assertEqual(shard_uri('sqlite:////data/k{shard}.db', 'postgresql://db/kanban', 3), 'sqlite:////data/k3.db')
+        with self.assertRaises(RuntimeError):
+            shard_uri('postgresql://kanban@db/kanban_{shard}', 'sqlite:////data/kanban.db', 1)
+        with self.assertRaises(RuntimeError):
+            shard_uri(None, 'postgresql://kanban@db/kanban', 1)
+
+    def test_sqlite_file_gets_busy_timeout(self):
+        options = engine_options('sqlite:///kanban.db', {'SQLITE_BUSY_TIMEOUT_MS': '2500'})
+        self.assertEqual(options['connect_args']['timeout'], 2.5)
+
+
+class TestSqliteConcurrency(BoardTestCase):
+    def test_pragmas_are_applied(self):
+        with db.engine.connect() as connection:
+            self.assertEqual(connection.exec_driver_sql('PRAGMA journal_mode').scalar(), 'wal')
+            self.assertEqual(connection.exec_driver_sql('PRAGMA synchronous').scalar(), 1)  # NORMAL
+            self.assertEqual(connection.exec_driver_sql('PRAGMA busy_timeout').scalar(), 5000)
+
+    def test_board_reads_do_not_wait_for_writes(self):
+        self.make_task('existing', team_id=self.team.id)
+        team = db.session.get(Team, self.team.id)
+        path = db.engine.url.database
+        locked, release = threading.Event(), threading.Event()
+
+        def write():
+            # hold an exclusive write transaction open, as a slow task write would
+            connection = sqlite3.connect(path, isolation_level=None)
+            connection.execute('BEGIN EXCLUSIVE')
+            connection.execute("INSERT INTO task (title, description, due_date, priority, status, team_id, rank) "
+                               "VALUES ('pending', 'test_description', '2030-01-01 00:00:00', 1, 'To Do', ?, 'V')", (self.team.id,))
+            locked.set()
+            release.wait(5)
+            connection.execute('COMMIT')
+            connection.close()
+
+        # end the read transaction of the test session, it would hold the writer off without write-ahead logging
+        db.session.remove()
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            self.assertTrue(locked.wait(5))
+            start = time.perf_counter()
+            columns = load_board(team=team)
+            elapsed = time.perf_counter() - start
+        finally:
+            release.set()
+            writer.join()
+
+        # the reader sees the last committed state straight away instead of waiting for the writer
+        self.assertLess(elapsed, 1)
+        self.assertEqual([task.title for task in columns[0].tasks], ['existing'])
+
+
+if __name__ == '__main__':
+    unittest.main()
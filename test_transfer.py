@@ -0,0 +1,105 @@
+import csv
+import io
+import os
+import tempfile
+import unittest
+from test_boards import BoardTestCase, app
+from board import db
+from board.boards import load_board
+from board.models import Task, Team
+
+IMPORT_HEADERS = {'X-Requested-With': 'XMLHttpRequest'}
+
+
+class TestBoardTransfer(BoardTestCase):
+    def setUp(self):
+        super().setUp()
+        app.config['EXPORT_CHUNK_SIZE'] = 2
+        app.config['IMPORT_BATCH_SIZE'] = 2
+
+    def tearDown(self):
+        app.config['EXPORT_CHUNK_SIZE'] = 1000
+        app.config['IMPORT_BATCH_SIZE'] = 1000
+        super().tearDown()
+
+    def make_other_team(self):
+        other = Team(name='other team')
+        other.members.append(db.session.merge(self.user))
+        db.session.add(other)
+        db.session.commit()
+        return other.id
+
+    def test_csv_export_streams_every_task(self):
+        for i in range(5):
+            self.make_task(f'task {i}', team_id=self.team.id)
+        self.make_task('done, "quoted"', status='Done', team_id=self.team.id)
+        self.login()
+        response = self.client.get(f'/api/boards/team-{self.team.id}/export')
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.mimetype, 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual([row['title'] for row in rows], ['done, "quoted"'] + [f'task {i}' for i in reversed(range(5))])
+        self.assertEqual(rows[0]['due_date'], '2030-01-01')
+
+    def test_export_checks_the_board(self):
+        other = self.make_user('bob')
+        self.login()
+        self.assertEqual(self.client.get(f'/api/boards/user-{other.id}/export').status_code, 403)
+        self.assertEqual(self.client.get(f'/api/boards/team-{self.team.id}/export?format=xml').status_code, 400)
+
+    def test_round_trip_keeps_the_order(self):
+        for i in range(3):
+            self.make_task(f'task {i}', team_id=self.team.id)
+        self.make_task('doing', status='In Progress', team_id=self.team.id)
+        other_id = self.make_other_team()
+        self.make_task('already there', team_id=other_id)
+        self.login()
+        exported = self.client.get(f'/api/boards/team-{self.team.id}/export?format=jsonl').data
+        response = self.client.post(f'/api/boards/team-{other_id}/import',
+                                    data={'file': (io.BytesIO(exported), 'board.jsonl')}, headers=IMPORT_HEADERS)
+        self.assertEqual(response.get_json(), {'imported': 4, 'skipped': 0, 'errors': []})
+        columns = load_board(team=db.session.get(Team, other_id))
+        self.assertEqual([task.title for task in columns[0].tasks], ['already there', 'task 2', 'task 1', 'task 0'])
+        self.assertEqual([task.title for task in columns[1].tasks], ['doing'])
+        self.assertEqual(Task.query.count(), 9)
+
+    def test_import_needs_a_header_a_cross_site_form_cannot_send(self):
+        self.login()
+        upload = 'title,description,status,priority,due_date\nforged,text,To Do,3,2030-01-01'
+        response = self.client.post(f'/api/boards/user-{self.user.id}/import',
+                                    data={'file': (io.BytesIO(upload.encode()), 'tasks.csv')})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Task.query.count(), 0)
+
+    def test_import_skips_and_reports_bad_lines(self):
+        lines = ['title,description,status,priority,due_date',
+                 'good,text,To Do,3,2030-01-01',
+                 'bad priority,text,To Do,11,2030-01-01',
+                 'bad status,text,Later,3,2030-01-01',
+                 'also good,"two\nlines",Done,1,2030-02-01']
+        self.login()
+        response = self.client.post(f'/api/boards/user-{self.user.id}/import',
+                                    data={'file': (io.BytesIO('\n'.join(lines).encode()), 'tasks.csv')},
+                                    headers=IMPORT_HEADERS)
+        report = response.get_json()
+        self.assertEqual((report['imported'], report['skipped']), (2, 2))
+        self.assertEqual([(error['line'], list(error['errors'])) for error in report['errors']],
+                         [(3, ['priority']), (4, ['status'])])
+        self.assertEqual(db.session.query(Task.description).filter_by(title='also good').scalar(), 'two\nlines')
+        self.assertIsNotNone(db.session.query(Task.date_done).filter_by(title='also good').scalar())
+
+    def test_cli_export_and_import(self):
+        self.make_task('mine', user_id=self.user.id)
+        other_id = self.make_other_team()
+        path = os.path.join(tempfile.mkdtemp(), 'board.csv')
+        runner = app.test_cli_runner()
+        result = runner.invoke(args=['export-board', f'user-{self.user.id}', '--output', path])
+        self.assertEqual(result.exit_code, 0, result.output)
+        result = runner.invoke(args=['import-board', f'team-{other_id}', path])
+        self.assertIn('Imported 1 tasks, skipped 0 lines.', result.output)
+        self.assertEqual(Task.query.filter_by(team_id=other_id, title='mine').count(), 1)
+        self.assertNotEqual(runner.invoke(args=['import-board', 'team-999', path]).exit_code, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
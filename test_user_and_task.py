@@ -1,5 +1,5 @@
 import unittest
-from board import app, db
+from board import create_app, db
 from board.models import User, Task, Team
 from board.urls import register
 import json
@@ -7,6 +7,8 @@ import requests
 from flask_login import current_user, logout_user, login_user
 from datetime import datetime
 
+app = create_app()
+
 
 class TestAuth(unittest.TestCase):
     def setUp(self):